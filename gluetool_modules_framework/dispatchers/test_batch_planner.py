@@ -9,6 +9,7 @@ import gluetool
 from gluetool import GlueError, SoftGlueError
 from gluetool.log import format_dict, log_dict
 from gluetool.utils import cached_property, load_yaml, PatternMap
+from gluetool_modules_framework.helpers.rules_engine import precompile_rules
 
 # Type annotations
 from typing import cast, List, Tuple, Dict, Any, Optional, Callable, Union  # Ignore PyUnusedCodeBear
@@ -245,7 +246,7 @@ class TestBatchPlanner(gluetool.Module):
         if not self.option('ignore-methods-map'):
             return []
 
-        return cast(RulesMapType, load_yaml(self.option('ignore-methods-map'), logger=self.logger))
+        return cast(RulesMapType, precompile_rules(load_yaml(self.option('ignore-methods-map'), logger=self.logger)))
 
     @cached_property
     def _job_priority_map(self) -> RulesMapType:
@@ -253,7 +254,7 @@ class TestBatchPlanner(gluetool.Module):
         if not self.option('job-priority-map'):
             return []
 
-        return cast(RulesMapType, load_yaml(self.option('job-priority-map'), logger=self.logger))
+        return cast(RulesMapType, precompile_rules(load_yaml(self.option('job-priority-map'), logger=self.logger)))
 
     def _reduce_section(self,
                         commands: Optional[SubSectionType],
@@ -578,7 +579,7 @@ class TestBatchPlanner(gluetool.Module):
 
     def _plan_by_static_config(self, companion_nvrs: Optional[List[str]] = None) -> List[Tuple[Any, Any]]:
 
-        self.require_shared('evaluate_rules', 'eval_context')
+        self.require_shared('evaluate_rules', 'evaluate_filter', 'eval_context')
 
         if not self.configs:
             self.warn('Empty dispatcher configuration')
@@ -632,25 +633,25 @@ class TestBatchPlanner(gluetool.Module):
             config = cast(List[SectionDictType], load_yaml(config_filepath, logger=self.logger))
             self.debug('find out which config section we should use')
 
-            matching_section = None
+            sections = []
 
             for section in config:
                 if 'rule' not in section:
                     self.warn("Section does not contain 'rule' key, ignored", sentry=True)
                     continue
 
-                if not self.shared('evaluate_rules', section['rule'],
-                                   context=self.shared('eval_context')):
-                    self.debug('denied by rules')
-                    continue
+                sections.append(section)
 
-                matching_section = section
-                break
+            matching_sections = self.shared(
+                'evaluate_filter', sections, context=self.shared('eval_context'), stop_at_first_hit=True, batch=True
+            )
 
-            else:
+            if not matching_sections:
                 self.warn('Cannot select any section, no rules matched current environment')
                 continue
 
+            matching_section = matching_sections[0]
+
             # Find command sets for the component
             commands = self._construct_command_sets(matching_section, task.component_id)
             log_dict(self.debug, 'commands', commands)
@@ -699,7 +700,7 @@ class TestBatchPlanner(gluetool.Module):
         for config_filepath in self.configs:
             config = load_yaml(config_filepath, logger=self.logger)
 
-            for item in self.shared('evaluate_filter', config):
+            for item in self.shared('evaluate_filter', config, context=context, batch=True):
 
                 module = item['module']
                 args = item['args'] if item['args'] else []
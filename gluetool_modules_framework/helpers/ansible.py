@@ -244,10 +244,18 @@ class Ansible(gluetool.Module):
         """
         Detect Ansible's python interpreter on the given guest and return it.
 
+        Interpreters found are cached by the guest, until the guest forgets them, e.g. after a reboot
+        or a snapshot restore. An empty result is not cached, the detection is tried again next time.
+
         :param gluetool_modules_framework.libs.guest.NetworkedGuest guest: Guest for auto-detection
         :returns: List of paths to the auto-detected python interpreters. Empty list if auto-detection failed.
         """
 
+        if guest.ansible_interpreters:
+            log_dict(guest.debug, 'available interpreters (cached)', guest.ansible_interpreters)
+
+            return list(guest.ansible_interpreters)
+
         assert guest.hostname is not None
         assert guest.key is not None
 
@@ -294,6 +302,9 @@ class Ansible(gluetool.Module):
 
         log_dict(guest.debug, 'available interpreters', available_interpreters)
 
+        if available_interpreters:
+            guest.ansible_interpreters = list(available_interpreters)
+
         return available_interpreters
 
     def run_playbook(self,
@@ -1,19 +1,33 @@
 # Copyright Contributors to the Testing Farm project.
 # SPDX-License-Identifier: Apache-2.0
 
+import errno
+import fcntl
 import os
 import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 import tempfile
 
+import requests.exceptions
+
+# boto3 is optional, without it S3 objects are uploaded with AWS cli
+try:
+    import boto3
+    import boto3.s3.transfer
+
+except ImportError:
+    boto3 = None
+
 import gluetool
 from gluetool.glue import GlueError
+from gluetool.log import log_dict
 from gluetool.utils import Command, normalize_bool_option, render_template
 from gluetool.result import Result
 from gluetool_modules_framework.libs.threading import RepeatTimer
 
-from typing import List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Pattern, Tuple, cast
 
 DEFAULT_RETRY_TIMEOUT = 30
 DEFAULT_RETRY_TICK = 10
@@ -21,14 +35,56 @@ DEFAULT_PARALLEL_ARCHIVING_TICK = 30
 DEFAULT_RSYNC_TIMEOUT = 120
 DEFAULT_VERIFY_TICK = 5
 DEFAULT_VERIFY_TIMEOUT = 1800
+DEFAULT_VERIFY_WORKERS = 8
 DEFAULT_PARALLEL_ARCHIVING_FINISH_TICK = 5
 DEFAULT_PARALLEL_ARCHIVING_FINISH_TIMEOUT = 1800
+DEFAULT_S3_UPLOAD_WORKERS = 1
+DEFAULT_S3_MULTIPART_THRESHOLD = 8
+
+#: ``ioctl`` request creating a reflink - a copy-on-write clone - of a file, see ``ioctl_ficlone(2)``.
+FICLONE = 0x40049409
 
 ARCHIVE_STAGES = ['execute', 'progress', 'destroy']
 # Stages which use a copy for syncing
 ARCHIVE_STAGES_USING_COPY = ['execute', 'progress']
 SOURCE_DESTINATION_ENTRY_KEYS = ['source', 'exclude', 'destination', 'permissions', 'verify']
 
+#: Number of files, their total size and the latest modification time (in nanoseconds) of a source.
+SourceSignature = Tuple[int, int, int]
+
+
+def source_signature(path: str) -> Optional[SourceSignature]:
+    """
+    Compute signature of a file or a directory tree, which changes whenever a file is added, removed or modified.
+
+    :param str path: path to the file or directory.
+    :returns: signature of the source, or ``None`` if it cannot be inspected.
+    """
+
+    try:
+        if not os.path.isdir(path):
+            stat = os.stat(path)
+
+            return 1, stat.st_size, stat.st_mtime_ns
+
+        count, size, mtime_ns = 0, 0, 0
+
+        for dirpath, _, filenames in os.walk(path):
+            # Directory's own mtime changes when entries are added, removed or renamed
+            mtime_ns = max(mtime_ns, os.stat(dirpath).st_mtime_ns)
+
+            for filename in filenames:
+                stat = os.lstat(os.path.join(dirpath, filename))
+
+                count += 1
+                size += stat.st_size
+                mtime_ns = max(mtime_ns, stat.st_mtime_ns)
+
+        return count, size, mtime_ns
+
+    except OSError:
+        return None
+
 
 class Archive(gluetool.Module):
     """
@@ -51,9 +107,26 @@ class Archive(gluetool.Module):
     * The ``daemon`` mode uses the rsync daemon to with rsync protocol
     * The ``ssh`` mode uses rsync with ssh protocol
     * The ``local`` mode copies files locally with rsync. It should be used only for testing and development.
-    * The ``s3`` mode uses the AWS cli to sync files to S3 bucket.
+    * The ``s3`` mode uses the AWS cli to sync files to S3 bucket. With ``s3-upload-workers`` set to more than one,
+      files are uploaded one object at a time by a pool of concurrent workers, in-process with ``boto3`` when it
+      is installed, or with the AWS cli otherwise.
 
     Use the ``verify`` flag to verify given path on the artifact location provided by the ``coldstore`` module.
+
+    The ``execute`` and ``progress`` stages archive a snapshot of sources, because ``hide-secrets`` module rewrites
+    files. With ``source-snapshot-method`` set to ``clone``, files are not copied but cloned with reflinks,
+    if the filesystem supports them. Sources and ``source-snapshot-dir`` should be on the same filesystem,
+    otherwise files are copied.
+    All paths of a stage are verified together, once archived, with concurrent requests.
+
+    With ``progress-change-tracking`` option, the ``progress`` stage of parallel archiving syncs only sources
+    which changed since the previous run, and regenerates results only when results of the test schedule changed.
+    Detecting changes of a directory means inspecting every file in it, on every run.
+
+    With ``batch-rsync`` option, sources of entries without ``DESTINATION`` are synced with a single ``rsync``
+    per stage and permissions, listing the sources in a ``--files-from`` manifest. Such sources keep their paths
+    relative to the root directory (or the working directory, for relative sources), like they would without
+    the option.
     """
 
     name = 'archive'
@@ -117,6 +190,19 @@ class Archive(gluetool.Module):
             'type': int,
             'default': DEFAULT_VERIFY_TIMEOUT,
         },
+        'batch-rsync': {
+            'help': """
+                    Sync sources of entries without a destination with a single rsync per stage and permissions,
+                    instead of one rsync per source. Not used with ``s3`` archive mode.
+                    """,
+            'action': 'store_true',
+        },
+        'verify-workers': {
+            'help': 'Number of concurrent archive verification requests. (default: %(default)s)',
+            'metavar': 'VERIFY_WORKERS',
+            'type': int,
+            'default': DEFAULT_VERIFY_WORKERS,
+        },
         'rsync-timeout': {
             'help': 'Timeout for the rsync command. (default: %(default)s)',
             'metavar': 'RCYNC_TIMEOUT',
@@ -133,6 +219,23 @@ class Archive(gluetool.Module):
             'type': int,
             'default': DEFAULT_PARALLEL_ARCHIVING_TICK
         },
+        'source-snapshot-method': {
+            'help': """
+                    How to create snapshots of sources in ``execute`` and ``progress`` stages, ``copy`` files
+                    or ``clone`` them with reflinks, falling back to copies (default: %(default)s).
+                    """,
+            'choices': ['copy', 'clone'],
+            'default': 'copy',
+        },
+        'source-snapshot-dir': {
+            'help': 'Directory for snapshots of sources (default: system temporary directory).',
+            'metavar': 'DIR',
+            'type': str,
+        },
+        'progress-change-tracking': {
+            'help': 'Sync only changed sources and regenerate results only when they changed in ``progress`` stage.',
+            'action': 'store_true',
+        },
         'parallel-archiving-finish-timeout': {
             'help': 'Timeout for parallel archiving to finish in seconds. (default: %(default)s)',
             'metavar': 'PARALLEL_ARCHIVING_FINISH_TIMEOUT',
@@ -166,6 +269,25 @@ class Archive(gluetool.Module):
             'action': 'append',
             'default': []
         },
+        'aws-endpoint-url': {
+            'help': 'S3-compatible endpoint to use instead of the AWS one, e.g. a local stand-in for testing.',
+            'type': str,
+        },
+        's3-upload-workers': {
+            'help': """
+                    Number of concurrent S3 uploads. With more than one, sources are uploaded object by object,
+                    each with its own retries (default: %(default)s).
+                    """,
+            'metavar': 'WORKERS',
+            'type': int,
+            'default': DEFAULT_S3_UPLOAD_WORKERS,
+        },
+        's3-multipart-threshold': {
+            'help': 'Files larger than this are uploaded in multiple parts, in MiB. (default: %(default)s)',
+            'metavar': 'MIB',
+            'type': int,
+            'default': DEFAULT_S3_MULTIPART_THRESHOLD,
+        },
     }
 
     required_options = ('source-destination-map', 'artifacts-root', 'archive-mode',)
@@ -179,6 +301,14 @@ class Archive(gluetool.Module):
         # We need to keep track of them to avoid creating them multiple times.
         self._created_directories: List[str] = []
 
+        # Signatures of sources synced by previous runs of the progress stage, and of the test schedule
+        # whose results were generated by the last run.
+        self._progress_manifest: Dict[str, SourceSignature] = {}
+        self._progress_schedule_signature: Optional[Any] = None
+
+        # Bytes of snapshots by the way they were created.
+        self._snapshot_bytes: Dict[str, int] = {'cloned': 0, 'copied': 0}
+
     def sanity(self) -> None:
         if self.option('archive-mode') not in ('daemon', 'ssh', 'local', 's3'):
             raise GlueError('rsync mode must be either daemon, ssh, local or s3')
@@ -310,8 +440,23 @@ class Archive(gluetool.Module):
             for option in options
         ]
 
+        if self.option('aws-endpoint-url'):
+            rendered_options += ['--endpoint-url', self.option('aws-endpoint-url')]
+
         return rendered_options
 
+    @gluetool.utils.cached_property
+    def aws_env(self) -> Dict[str, str]:
+
+        env = os.environ.copy()
+        env.update({
+            'AWS_REGION': self.option('aws-region'),
+            'AWS_ACCESS_KEY_ID': self.option('aws-access-key-id'),
+            'AWS_SECRET_ACCESS_KEY': self.option('aws-secret-access-key'),
+        })
+
+        return env
+
     def create_archive_directory_ssh(self, directory: Optional[str] = None) -> None:
         """
         Creates directory on the host with ssh where artifacts will be stored.
@@ -421,11 +566,66 @@ class Archive(gluetool.Module):
 
         self._created_directories.append(path)
 
-    def prepare_source_copy(self, original_source: str) -> Tuple[str, str]:
-        original_source = original_source.rstrip('/')
+    def _snapshot_file(self, original_file: str, snapshot_file: str) -> str:
+        """
+        Create snapshot of a single file, trying a reflink first, and a copy if the file cannot be cloned.
+        Used as ``copy_function`` of :py:func:`shutil.copytree`.
+        """
+
+        if os.path.islink(original_file):
+            os.symlink(os.readlink(original_file), snapshot_file)
+            return snapshot_file
+
+        size = os.path.getsize(original_file)
+
+        try:
+            with open(original_file, 'rb') as original, open(snapshot_file, 'wb') as snapshot:
+                fcntl.ioctl(snapshot.fileno(), FICLONE, original.fileno())
+
+            shutil.copystat(original_file, snapshot_file)
+
+            self._snapshot_bytes['cloned'] += size
+            return snapshot_file
+
+        except OSError as exc:
+            # EOPNOTSUPP, EXDEV, EINVAL, ... - filesystem cannot clone this file
+            self.debug('cannot clone {}: {}'.format(original_file, errno.errorcode.get(exc.errno or 0, exc)))
+
+            if os.path.exists(snapshot_file):
+                os.unlink(snapshot_file)
+
+        shutil.copy2(original_file, snapshot_file, follow_symlinks=False)
+
+        self._snapshot_bytes['copied'] += size
+        return snapshot_file
+
+    def _hide_secrets(self, search_path: str, snapshot: bool = False) -> None:
+        """
+        Hide secrets in files. Snapshot files are not going to be scanned again, records of their scans
+        are not kept.
+
+        :param str search_path: path to hide secrets under.
+        :param bool snapshot: whether the path is a snapshot of sources.
+        """
+
+        if snapshot:
+            self.shared('hide_secrets', search_path=search_path, keep_records=False)
+
+        else:
+            self.shared('hide_secrets', search_path=search_path)
+
+    def _mkdtemp(self) -> str:
+        if self.option('source-snapshot-dir'):
+            return tempfile.mkdtemp(dir=cast(str, self.option('source-snapshot-dir')))
+
+        return tempfile.mkdtemp()
+
+    def _copy_source(self, original_source: str, source: str) -> None:
+        clone = self.option('source-snapshot-method') == 'clone'
+
+        # Keep copytree's default copy function unless cloning
+        copytree_options: Dict[str, Any] = {'copy_function': self._snapshot_file} if clone else {}
 
-        # Create a copy in the temporary directory with
-        source = os.path.join(tempfile.mkdtemp(), os.path.basename(original_source))
         if os.path.isdir(original_source):
             shutil.copytree(
                 original_source, source,
@@ -434,11 +634,21 @@ class Archive(gluetool.Module):
                 # ignore dangling symlinks, if they would exist
                 ignore_dangling_symlinks=True,
                 # this should not be needed, but rather setting it to mitigate certain corner cases
-                dirs_exist_ok=True
+                dirs_exist_ok=True,
+                **copytree_options
             )
+        elif clone:
+            self._snapshot_file(original_source, source)
         else:
             shutil.copy2(original_source, source, follow_symlinks=False)
 
+    def prepare_source_copy(self, original_source: str) -> Tuple[str, str]:
+        original_source = original_source.rstrip('/')
+
+        # Create a copy in the temporary directory with
+        source = os.path.join(self._mkdtemp(), os.path.basename(original_source))
+        self._copy_source(original_source, source)
+
         return source, original_source
 
     def delete_source_copy(self, source: str) -> None:
@@ -490,34 +700,48 @@ class Archive(gluetool.Module):
             destination = original_source
             destination = destination.lstrip('/')
 
+        full_destination = self.rsync_destination(destination)
+
+        # Before we start archiving, we need to hide secrets in files
+        self._hide_secrets(source, snapshot=source_copy)
+
+        cmd.append(full_destination)
+
+        # Check if source file or directory still exists
+        if not os.path.exists(source):
+            self.warn('source {} does not exist, skipping rsync'.format(source))
+            return
+
+        self.debug('syncing {} to {}'.format(source, full_destination))
+
+        self._run_rsync_command(cmd, "rsync '{}' to '{}'".format(source, destination))
+
+        # make sure to remove source copy if it was created
+        if source_copy:
+            self.delete_source_copy(source)
+
+    def rsync_destination(self, destination: str) -> str:
+        """
+        Return rsync destination for the given path relative to the request's artifacts directory.
+        """
+
         assert self._request_id is not None
 
         if self.option('archive-mode') == 'daemon':
-            full_destination = 'rsync://{}/{}'.format(
+            return 'rsync://{}/{}'.format(
                 self.artifacts_rsync_host,
                 os.path.join(self._request_id, destination)
             )
 
-        elif self.option('archive-mode') == 'ssh':
-            full_destination = '{}:{}'.format(
+        if self.option('archive-mode') == 'ssh':
+            return '{}:{}'.format(
                 self.artifacts_host,
                 os.path.join(self.artifacts_root, self._request_id, destination)
             )
 
-        else:
-            full_destination = os.path.join(self.artifacts_local_root, self._request_id, destination)
-
-        # Before we start archiving, we need to hide secrets in files
-        self.shared('hide_secrets', search_path=source)
+        return os.path.join(self.artifacts_local_root, self._request_id, destination)
 
-        cmd.append(full_destination)
-
-        # Check if source file or directory still exists
-        if not os.path.exists(source):
-            self.warn('source {} does not exist, skipping rsync'.format(source))
-            return
-
-        self.debug('syncing {} to {}'.format(source, full_destination))
+    def _run_rsync_command(self, cmd: List[str], label: str) -> None:
 
         def _run_rsync() -> Result[bool, bool]:
             try:
@@ -528,15 +752,90 @@ class Archive(gluetool.Module):
             return Result.Ok(True)
 
         gluetool.utils.wait(
-            "rsync '{}' to '{}'".format(source, destination),
+            label,
             _run_rsync,
             timeout=self.option('retry-timeout'),
             tick=self.option('retry-tick')
         )
 
-        # make sure to remove source copy if it was created
-        if source_copy:
-            self.delete_source_copy(source)
+    def run_rsync_batch(
+        self,
+        sources: List[str],
+        options: Optional[List[str]] = None,
+        source_copy: bool = False
+    ) -> None:
+        """
+        Sync multiple sources with a single rsync. Sources are listed in a ``--files-from`` manifest, relative
+        to the root directory, or to the current working directory for relative sources, and keep these relative
+        paths in the request's artifacts directory.
+
+        :param list(str) sources: sources to sync, all absolute or all relative.
+        :param list(str) options: additional rsync options.
+        :param bool source_copy: if set, sources are copied to a temporary directory first, and synced from there.
+        """
+
+        base = '/' if os.path.isabs(sources[0]) else '.'
+        snapshot_dir: Optional[str] = None
+
+        # Relative paths of sources which still exist - some, e.g. temporary files, may be gone already
+        relative_sources = [
+            os.path.relpath(source.rstrip('/'), base) for source in sources if os.path.exists(source)
+        ]
+
+        for source in sources:
+            if not os.path.exists(source):
+                self.warn('source {} does not exist, skipping rsync'.format(source))
+
+        if not relative_sources:
+            return
+
+        manifest_fd, manifest_path = tempfile.mkstemp(prefix='archive-manifest-')
+
+        try:
+            # Used in cases when we need to work with a source copy to mitigate breaking of "live" logs.
+            # Copies are placed into a single snapshot directory, under their relative paths.
+            if source_copy:
+                snapshot_dir = self._mkdtemp()
+
+                for relative_source in relative_sources:
+                    copy_path = os.path.join(snapshot_dir, relative_source)
+
+                    os.makedirs(os.path.dirname(copy_path), exist_ok=True)
+                    self._copy_source(os.path.join(base, relative_source), copy_path)
+
+                base = snapshot_dir
+
+                # Before we start archiving, we need to hide secrets in files
+                self._hide_secrets(snapshot_dir, snapshot=True)
+
+            else:
+                for relative_source in relative_sources:
+                    self._hide_secrets(os.path.join(base, relative_source))
+
+            # Use NUL separators, file names may contain new lines
+            with os.fdopen(manifest_fd, 'w') as manifest:
+                manifest.write('\0'.join(relative_sources))
+
+            full_destination = self.rsync_destination('')
+
+            cmd = ['rsync'] + self.rsync_options + (options or []) + [
+                '--files-from={}'.format(manifest_path),
+                '--from0',
+                base,
+                full_destination
+            ]
+
+            self.debug('syncing {} sources from {} to {}'.format(len(relative_sources), base, full_destination))
+
+            self._run_rsync_command(cmd, "rsync {} sources to '{}'".format(len(relative_sources), full_destination))
+
+        finally:
+            os.unlink(manifest_path)
+
+            # make sure to remove source copy if it was created
+            if snapshot_dir:
+                self.debug('removing source copy {}'.format(snapshot_dir))
+                shutil.rmtree(snapshot_dir)
 
     def run_aws(
         self,
@@ -548,12 +847,7 @@ class Archive(gluetool.Module):
         options = options or []
         original_source = source
 
-        env = os.environ.copy()
-        env.update({
-            'AWS_REGION': self.option('aws-region'),
-            'AWS_ACCESS_KEY_ID': self.option('aws-access-key-id'),
-            'AWS_SECRET_ACCESS_KEY': self.option('aws-secret-access-key'),
-        })
+        env = self.aws_env
 
         cmd = ['aws', 's3']
 
@@ -591,7 +885,7 @@ class Archive(gluetool.Module):
         )
 
         # Before we start archiving, we need to hide secrets in files
-        self.shared('hide_secrets', search_path=source)
+        self._hide_secrets(source, snapshot=source_copy)
 
         cmd.append(full_destination)
 
@@ -621,6 +915,149 @@ class Archive(gluetool.Module):
         if source_copy:
             self.delete_source_copy(source)
 
+    def _s3_client(self) -> Any:
+        if boto3 is None:
+            return None
+
+        return boto3.client(
+            's3',
+            region_name=self.option('aws-region'),
+            aws_access_key_id=self.option('aws-access-key-id'),
+            aws_secret_access_key=self.option('aws-secret-access-key'),
+            endpoint_url=self.option('aws-endpoint-url')
+        )
+
+    def _upload_s3_object(self, client: Any, filepath: str, key: str) -> None:
+        """
+        Upload a single file to S3, retrying on failure.
+
+        :param client: ``boto3`` S3 client, or ``None`` to use AWS cli.
+        :param str filepath: file to upload.
+        :param str key: object key.
+        """
+
+        url = 's3://{}/{}'.format(self.option('aws-s3-bucket'), key)
+
+        def _upload() -> Result[bool, bool]:
+            try:
+                if client is None:
+                    Command(['aws', 's3', 'cp'] + self.aws_options + [filepath, url], logger=self.logger).run(
+                        env=self.aws_env
+                    )
+
+                else:
+                    client.upload_file(
+                        filepath, self.option('aws-s3-bucket'), key,
+                        Config=boto3.s3.transfer.TransferConfig(
+                            multipart_threshold=self.option('s3-multipart-threshold') * 1024 * 1024,
+                            # concurrency is controlled by our own pool of workers
+                            use_threads=False
+                        )
+                    )
+
+            except Exception as exc:
+                self.warn('upload of "{}" to "{}" failed, retrying: {}'.format(filepath, url, exc))
+                return Result.Error(False)
+
+            return Result.Ok(True)
+
+        gluetool.utils.wait(
+            "upload '{}' to '{}'".format(filepath, url),
+            _upload,
+            timeout=self.option('retry-timeout'),
+            tick=self.option('retry-tick')
+        )
+
+    def run_s3_uploads(self, sources: List[Tuple[str, Optional[str]]], source_copy: bool = False) -> None:
+        """
+        Upload sources to S3 with a pool of concurrent workers, one object at a time. Directories are uploaded
+        file by file, like ``aws s3 sync`` would do.
+
+        :param list sources: sources to upload, each with its destination, or ``None`` to reuse the source path.
+        :param bool source_copy: if set, sources are copied to a temporary directory first, and uploaded from there.
+        """
+
+        assert self._request_id is not None
+
+        snapshot_dir: Optional[str] = None
+
+        # Pairs of local files and object keys
+        objects: List[Tuple[str, str]] = []
+
+        try:
+            if source_copy:
+                snapshot_dir = self._mkdtemp()
+
+            for source, destination in sources:
+                # Check if source file or directory still exists
+                if not os.path.exists(source):
+                    self.warn('source {} does not exist, skipping upload'.format(source))
+                    continue
+
+                original_source = source.rstrip('/')
+
+                # Used in cases when we need to work with a source copy to mitigate breaking of "live" logs
+                if snapshot_dir:
+                    source = os.path.join(snapshot_dir, original_source.lstrip('/'))
+
+                    os.makedirs(os.path.dirname(source), exist_ok=True)
+                    self._copy_source(original_source, source)
+
+                else:
+                    # Before we start archiving, we need to hide secrets in files
+                    self._hide_secrets(source)
+
+                # See run_aws for the destination handling
+                if not destination or source_copy:
+                    destination = original_source.lstrip('/').lstrip('./')
+
+                key = os.path.join(self.artifacts_root, self._request_id, destination).lstrip('/')
+
+                if not os.path.isdir(source):
+                    # Like with `aws s3 cp`, a destination ending with slash is a directory to upload the file into
+                    if key.endswith('/'):
+                        key = os.path.join(key, os.path.basename(original_source))
+
+                    objects.append((source, key))
+                    continue
+
+                for dirpath, _, filenames in os.walk(source):
+                    for filename in filenames:
+                        filepath = os.path.join(dirpath, filename)
+
+                        objects.append((filepath, os.path.join(key, os.path.relpath(filepath, source))))
+
+            if snapshot_dir:
+                self._hide_secrets(snapshot_dir, snapshot=True)
+
+            if not objects:
+                return
+
+            client = self._s3_client()
+
+            self.debug('uploading {} objects with {} workers{}'.format(
+                len(objects), self.option('s3-upload-workers'), '' if client else ' using AWS cli'
+            ))
+
+            with ThreadPoolExecutor(
+                max_workers=self.option('s3-upload-workers'),
+                thread_name_prefix='s3-upload'
+            ) as executor:
+                futures = [
+                    executor.submit(self._upload_s3_object, client, filepath, key) for filepath, key in objects
+                ]
+
+            errors = [future.exception() for future in futures if future.exception() is not None]
+
+            if errors:
+                raise GlueError('failed to upload {} of {} objects: {}'.format(len(errors), len(objects), errors[0]))
+
+        finally:
+            # make sure to remove source copy if it was created
+            if snapshot_dir:
+                self.debug('removing source copy {}'.format(snapshot_dir))
+                shutil.rmtree(snapshot_dir)
+
     # The stage is default to progress because we want to use the function
     # in the parallel archiving timer without calling it
     def archive_stage(self, stage: str = 'progress') -> None:
@@ -629,6 +1066,8 @@ class Archive(gluetool.Module):
             self.warn('No testing farm request found, skipping archiving', sentry=True)
             return
 
+        track_changes = stage == 'progress' and self.option('progress-change-tracking')
+
         # Before archiving in progress, let's regenerate results.xml
         if stage == 'progress':
             # Refresh results from results.yaml for running schedule entries
@@ -638,10 +1077,36 @@ class Archive(gluetool.Module):
                 for entry in schedule:
                     self.shared('refresh_test_schedule_entry_results', entry)
 
-            self.shared('generate_results', 'test execution running', generate_xunit=False, report_results=False)
+            schedule_signature = self._schedule_signature(schedule) if track_changes else None
+
+            if schedule_signature is not None and schedule_signature == self._progress_schedule_signature:
+                self.debug('test schedule results did not change, skipping results regeneration')
+
+            else:
+                self.shared(
+                    'generate_results', 'test execution running', generate_xunit=False, report_results=False
+                )
+
+                self._progress_schedule_signature = schedule_signature
 
         map_stage = self.source_destination_map().get(stage, [])
 
+        # Signatures of sources taken before syncing them, recorded in the manifest once they are synced
+        signatures: Dict[str, Optional[SourceSignature]] = {}
+
+        # Archived sources to verify once the whole stage is archived
+        to_verify: List[str] = []
+
+        batch_rsync = self.option('batch-rsync') and self.option('archive-mode') != 's3'
+        pooled_s3 = self.option('archive-mode') == 's3' and (self.option('s3-upload-workers') or 1) > 1
+
+        # Sources uploaded to S3 by a pool of workers, with their destinations and verify flags
+        s3_uploads: List[Tuple[str, Optional[str], bool]] = []
+
+        # Sources synced with a single rsync, grouped by their base directory and permissions,
+        # each with a flag saying whether it should be verified.
+        batches: Dict[Tuple[str, Optional[str]], List[Tuple[str, bool]]] = {}
+
         for entry in map_stage:
             if entry.get('source') is None:
                 raise GlueError('Source path must be specified in source-destination-map')
@@ -655,6 +1120,13 @@ class Archive(gluetool.Module):
             if verify:
                 self.require_shared('artifacts_location')
 
+            # Compile exclude patterns just once, not for every source
+            try:
+                exclude_patterns: List[Pattern[str]] = [re.compile(exclude_entry) for exclude_entry in excludes or []]
+            except re.error as error:
+                self.error(f'Failed to sync {sources}: {error}', sentry=True)
+                continue
+
             # If the entry['source'] is a wildcard, we need to use glob to find all the files
             for source in glob(sources, recursive=True):
 
@@ -662,10 +1134,27 @@ class Archive(gluetool.Module):
                     self.debug('Archiving cancelled, stopping progress sync')
                     return
 
-                try:
-                    if excludes is not None and any(re.search(exclude_entry, source) for exclude_entry in excludes):
-                        self.debug('Skipping {} because it matches exclude pattern {}'.format(source, excludes))
+                if any(pattern.search(source) for pattern in exclude_patterns):
+                    self.debug('Skipping {} because it matches exclude pattern {}'.format(source, excludes))
+                    continue
+
+                if track_changes:
+                    signatures[source] = source_signature(source)
+
+                    if signatures[source] is not None and self._progress_manifest.get(source) == signatures[source]:
+                        self.debug('Skipping {} because it did not change since the last sync'.format(source))
                         continue
+
+                if batch_rsync and not destination:
+                    batch_key = ('/' if os.path.isabs(source) else '.', permissions)
+                    batches.setdefault(batch_key, []).append((source, verify))
+                    continue
+
+                if pooled_s3:
+                    s3_uploads.append((source, destination, verify))
+                    continue
+
+                try:
                     options = []
 
                     if self.option('archive-mode') != 's3':
@@ -694,35 +1183,163 @@ class Archive(gluetool.Module):
                             source_copy=True if stage in ARCHIVE_STAGES_USING_COPY else False
                         )
 
+                    self._record_synced_sources([source], signatures)
+
                     if not verify or self.option('archive-mode') == 'local':
                         continue
 
-                    # Verify archivation target
-                    target = self.shared('artifacts_location', source.lstrip('/'))
+                    to_verify.append(source)
 
-                    def _verify_archivation() -> Result[bool, bool]:
-                        with gluetool.utils.requests() as request:
-                            # For HEAD method we need to enable redirects explicitely
-                            # https://requests.readthedocs.io/en/latest/user/quickstart/#redirection-and-history
-                            response = request.head(target, allow_redirects=True)
+                except Exception as error:
+                    # Log error and continue with another item
+                    self.error(f'Failed to sync {sources}: {error}', sentry=True)
 
-                            if response.status_code == 200:
-                                return Result.Ok(True)
+        if s3_uploads:
+            upload_sources = [source for source, _, _ in s3_uploads]
 
-                            return Result.Error(True)
+            try:
+                self.run_s3_uploads(
+                    [(source, destination) for source, destination, _ in s3_uploads],
+                    source_copy=True if stage in ARCHIVE_STAGES_USING_COPY else False
+                )
 
-                    self.info("Verifying archivation of '{}'".format(target))
+                self._record_synced_sources(upload_sources, signatures)
 
-                    gluetool.utils.wait(
-                        "verify archivation of '{}'".format(target),
-                        _verify_archivation,
-                        timeout=self.option('verify-timeout'),
-                        tick=self.option('verify-tick')
-                    )
+                to_verify += [source for source, _, verify in s3_uploads if verify]
 
-                except Exception as error:
-                    # Log error and continue with another item
-                    self.error(f'Failed to sync {sources}: {error}', sentry=True)
+            except Exception as error:
+                self.error(f'Failed to sync {upload_sources}: {error}', sentry=True)
+
+        for (_, permissions), batch in batches.items():
+            if stage == 'progress' and self._archive_timer and self._archive_timer.finished.is_set():
+                self.debug('Archiving cancelled, stopping progress sync')
+                return
+
+            batch_sources = [source for source, _ in batch]
+
+            options = []
+
+            if any(os.path.isdir(source) for source in batch_sources):
+                options.append('--recursive')
+
+            if permissions:
+                options.append('--chmod={}'.format(permissions))
+
+            try:
+                self.run_rsync_batch(
+                    batch_sources,
+                    options=options or None,
+                    source_copy=True if stage in ARCHIVE_STAGES_USING_COPY else False
+                )
+
+                self._record_synced_sources(batch_sources, signatures)
+
+                if self.option('archive-mode') == 'local':
+                    continue
+
+                to_verify += [source for source, verify in batch if verify]
+
+            except Exception as error:
+                # Log error and continue with another batch
+                self.error(f'Failed to sync {batch_sources}: {error}', sentry=True)
+
+        if to_verify:
+            self.verify_archivations(to_verify)
+
+    def _record_synced_sources(self, sources: List[str], signatures: Dict[str, Optional[SourceSignature]]) -> None:
+        for source in sources:
+            signature = signatures.get(source)
+
+            if signature is not None:
+                self._progress_manifest[source] = signature
+
+    def _schedule_signature(self, schedule: Any) -> Optional[Any]:
+        """
+        Compute signature of the test schedule, which changes whenever results of the progress stage
+        would change - an entry changes its stage, state or result, or its refreshed test results differ.
+
+        :returns: signature of the schedule, or ``None`` if there is no schedule.
+        """
+
+        if schedule is None:
+            return None
+
+        return [
+            (entry.id, entry.stage, entry.state, entry.result, list(getattr(entry, 'results', None) or []))
+            for entry in schedule
+        ]
+
+    def verify_archivations(self, sources: List[str]) -> None:
+        """
+        Wait until the archived sources are available on the artifact location.
+
+        Targets are checked with concurrent ``HEAD`` requests sharing a pool of connections, and each round
+        checks only targets which were not available yet. Targets which do not become available in time
+        are reported together, failure to verify them does not interrupt the archiving.
+
+        :param list(str) sources: archived sources to verify.
+        """
+
+        # Keep the order, but check every target just once
+        targets = list(dict.fromkeys(self.shared('artifacts_location', source.lstrip('/')) for source in sources))
+        pending = list(targets)
+
+        workers = self.option('verify-workers') or DEFAULT_VERIFY_WORKERS
+
+        self.info('Verifying archivation of {} targets'.format(len(targets)))
+
+        with gluetool.utils.requests() as req:
+            session = req.Session()
+
+            adapter = req.adapters.HTTPAdapter(pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            def _is_available(target: str) -> bool:
+                try:
+                    # For HEAD method we need to enable redirects explicitely
+                    # https://requests.readthedocs.io/en/latest/user/quickstart/#redirection-and-history
+                    return bool(session.head(target, allow_redirects=True).status_code == 200)
+
+                except requests.exceptions.RequestException as exc:
+                    self.debug("failed to verify archivation of '{}': {}".format(target, exc))
+                    return False
+
+            def _verify_archivations() -> Result[bool, bool]:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='verify') as executor:
+                    available = list(executor.map(_is_available, pending))
+
+                pending[:] = [target for target, is_available in zip(pending, available) if not is_available]
+
+                if pending:
+                    self.debug('{} of {} targets not available yet'.format(len(pending), len(targets)))
+                    return Result.Error(True)
+
+                return Result.Ok(True)
+
+            try:
+                gluetool.utils.wait(
+                    'verify archivation of {} targets'.format(len(targets)),
+                    _verify_archivations,
+                    timeout=self.option('verify-timeout'),
+                    tick=self.option('verify-tick')
+                )
+
+            except GlueError:
+                log_dict(self.debug, 'unverified targets', pending)
+
+                self.error(
+                    'Failed to verify archivation of {} of {} targets, e.g. {}'.format(
+                        len(pending), len(targets), pending[0]
+                    ),
+                    sentry=True
+                )
+                return
+
+            finally:
+                session.close()
+
+        self.info('Verified archivation of {} targets'.format(len(targets)))
 
     def _safe_archive_stage(self, stage: str = 'progress') -> None:
         """
@@ -812,3 +1429,10 @@ class Archive(gluetool.Module):
             self.error(str(error), sentry=True)
         except Exception as error:
             self.error('Unexpected error during destroy stage archiving: {}'.format(error), sentry=True)
+
+        if self.option('source-snapshot-method') == 'clone':
+            self.info(
+                'source snapshots: {cloned} bytes cloned, {copied} bytes copied'.format(
+                    **self._snapshot_bytes
+                )
+            )
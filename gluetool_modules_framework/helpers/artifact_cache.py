@@ -0,0 +1,693 @@
+# Copyright Contributors to the Testing Farm project.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Worker-local cache of artifacts downloaded by guests.
+
+Artifacts are downloaded once per pipeline, stored by their SHA256 digests, and served to guests by a small HTTP
+server running on the worker. Guests reach the server either directly, using the worker address, or through an SSH
+reverse tunnel.
+
+Artifacts cached by previous pipelines are reused only when their servers confirm the artifacts did not change,
+or when their checksums are known.
+"""
+
+import concurrent.futures
+import hashlib
+import http.server
+import json
+import os
+import re
+import shlex
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import requests
+
+import gluetool
+from gluetool.log import log_dict
+from gluetool.result import Ok, Error
+from gluetool.utils import Result, normalize_path, wait
+
+from gluetool_modules_framework.libs.guest import NetworkedGuest
+
+# Type annotations
+from typing import cast, Any, Dict, List, Optional, Tuple  # noqa
+
+#: Size of chunks used when downloading and serving artifacts.
+CHUNK_SIZE = 1024 * 1024
+
+#: Name of the file mapping URLs to digests of their content.
+INDEX_FILENAME = 'index.json'
+
+#: Path served by the cache server: digest of the content, followed by the original, still encoded, filename.
+CONTENT_PATH_PATTERN = re.compile(r'^/([0-9a-f]{64})/([^/]+)$')
+
+#: Names of files holding cached content.
+CONTENT_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+#: Response headers recorded in the index, and request headers sending them back to check the content changed.
+VALIDATORS = {
+    'etag': ('ETag', 'If-None-Match'),
+    'last-modified': ('Last-Modified', 'If-Modified-Since')
+}
+
+#: Default limit of the cache size, in MiB.
+DEFAULT_MAX_SIZE = 10240
+
+#: Default number of days unused content is kept in the cache.
+DEFAULT_MAX_AGE = 7
+
+#: How many times to try downloading an artifact.
+DOWNLOAD_ATTEMPTS = 3
+
+
+def file_digest(filepath: str) -> str:
+    """
+    Compute SHA256 digest of a file.
+    """
+
+    digest = hashlib.sha256()
+
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ArtifactCache(gluetool.Module):
+    """
+    Provides a worker-local cache of artifacts, e.g. RPMs, for guests.
+
+    Install modules pass URLs of artifacts to the shared function ``cache_urls``. The artifacts are downloaded
+    concurrently, verified and stored in the cache directory, and the function returns URLs pointing to the cache
+    server instead. If an artifact cannot be cached, or the guest cannot reach the cache server, the original URL
+    is used.
+
+    Artifacts are stored by digests of their content, the cache directory can be shared by multiple pipelines
+    running on the same worker. An artifact cached by another pipeline is used only when its checksum is known,
+    or when its server confirms, using ``ETag`` or ``Last-Modified`` headers, the artifact did not change.
+
+    When the pipeline ends, content not used for ``max-age`` days is removed from the cache, followed by the least
+    recently used content until the cache fits into ``max-size``. Content used by the pipeline is always kept.
+    """
+
+    name = 'artifact-cache'
+    description = 'Worker-local cache of artifacts downloaded by guests.'
+
+    options = [
+        ('Cache options', {
+            'cache-dir': {
+                'help': 'Directory to store cached artifacts in (default: %(default)s).',
+                'metavar': 'PATH',
+                'type': str,
+                'default': 'artifact-cache'
+            },
+            'download-workers': {
+                'help': 'Number of artifacts to download concurrently (default: %(default)s).',
+                'metavar': 'N',
+                'type': int,
+                'default': 8
+            },
+            'download-timeout': {
+                'help': 'Timeout for connecting to and reading from artifact servers, in seconds '
+                        '(default: %(default)s).',
+                'metavar': 'SECONDS',
+                'type': int,
+                'default': 60
+            },
+            'max-size': {
+                'help': 'Maximal size of the cache, in MiB (default: %(default)s).',
+                'metavar': 'MIB',
+                'type': int,
+                'default': DEFAULT_MAX_SIZE
+            },
+            'max-age': {
+                'help': 'Remove content not used for this many days from the cache (default: %(default)s).',
+                'metavar': 'DAYS',
+                'type': int,
+                'default': DEFAULT_MAX_AGE
+            }
+        }),
+        ('Server options', {
+            'listen-address': {
+                'help': """
+                        Address the cache server listens on. The server is not authenticated, by default it listens
+                        on all addresses only when guests reach it directly, and on ``127.0.0.1`` when guests reach
+                        it through ``reverse-tunnel``.
+                        """,
+                'metavar': 'ADDRESS',
+                'type': str,
+                'default': None
+            },
+            'listen-port': {
+                'help': 'Port the cache server listens on, 0 picks a free port (default: %(default)s).',
+                'metavar': 'PORT',
+                'type': int,
+                'default': 0
+            },
+            'guest-url': {
+                'help': """
+                        Base URL guests use to reach the cache server. ``{port}`` is replaced with the port of
+                        the server. If not set, address of the worker on the route to the guest is used
+                        (default: %(default)s).
+                        """,
+                'metavar': 'URL',
+                'type': str,
+                'default': None
+            },
+            'reverse-tunnel': {
+                'help': 'If set, guests reach the cache server through an SSH reverse tunnel.',
+                'action': 'store_true'
+            },
+            'reverse-tunnel-port': {
+                'help': 'Port on the guest forwarded to the cache server (default: %(default)s).',
+                'metavar': 'PORT',
+                'type': int,
+                'default': 8642
+            },
+            'guest-check-timeout': {
+                'help': 'How long to wait for the guest to reach the cache server, in seconds (default: %(default)s).',
+                'metavar': 'SECONDS',
+                'type': int,
+                'default': 30
+            }
+        })
+    ]
+
+    shared_functions = ['cache_urls']
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+
+        super(ArtifactCache, self).__init__(*args, **kwargs)
+
+        self._lock = threading.Lock()
+
+        #: Downloads of this pipeline, URL to future resolving to digest of the content.
+        self._downloads: Dict[str, 'concurrent.futures.Future[str]'] = {}
+
+        #: Digests whose content was verified by this pipeline.
+        self._verified: Dict[str, bool] = {}
+
+        #: Base URLs of the cache server, by guest name. ``None`` when the guest cannot reach the server.
+        self._guest_urls: Dict[str, Optional[str]] = {}
+
+        #: Processes forwarding ports of guests to the cache server, by guest name.
+        self._tunnels: Dict[str, 'subprocess.Popen[bytes]'] = {}
+
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+
+    @property
+    def cache_dir(self) -> str:
+
+        return normalize_path(self.option('cache-dir') or 'artifact-cache')
+
+    def content_path(self, digest: str) -> str:
+        """
+        Path to the cached content with the given digest.
+        """
+
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    #
+    # Index
+    #
+
+    def _load_index(self) -> Dict[str, Dict[str, str]]:
+
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILENAME)) as f:
+                index = json.load(f)
+
+        except (IOError, ValueError):
+            return {}
+
+        return {
+            url: entry for url, entry in index.items() if isinstance(entry, dict) and 'digest' in entry
+        }
+
+    def _save_index(self, index: Dict[str, Dict[str, str]]) -> None:
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.index-')
+
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+
+        os.replace(tmp_path, os.path.join(self.cache_dir, INDEX_FILENAME))
+
+    def _update_index(self, url: str, entry: Dict[str, str]) -> None:
+        """
+        Record digest of the URL content, with headers validating the content did not change. The index may be
+        shared with other pipelines, it is re-read before the update, and replaced atomically.
+        """
+
+        with self._lock:
+            index = self._load_index()
+            index[url] = entry
+
+            self._save_index(index)
+
+    #
+    # Downloads
+    #
+
+    def _verify(self, digest: str) -> bool:
+        """
+        Check the cached content matches its digest. Each content is checked just once by a pipeline.
+        """
+
+        if digest not in self._verified:
+            path = self.content_path(digest)
+
+            self._verified[digest] = os.path.exists(path) and file_digest(path) == digest
+
+        if self._verified[digest]:
+            # modification time tracks the last use of the content
+            try:
+                os.utime(self.content_path(digest))
+
+            except OSError:
+                pass
+
+        return self._verified[digest]
+
+    def _download(self, url: str, checksum: Optional[str]) -> str:
+        """
+        Download URL into the cache, unless its content is cached already.
+
+        :param str url: URL to download.
+        :param str checksum: expected SHA256 digest of the content, if known.
+        :returns: digest of the content.
+        """
+
+        if checksum and self._verify(checksum):
+            self.debug("'{}' found in cache".format(url))
+            return checksum
+
+        # Without a checksum, content cached by previous pipelines must be validated by the server.
+        entry = self._load_index().get(url)
+
+        headers: Dict[str, str] = {}
+
+        if entry is not None and self._verify(entry['digest']):
+            headers = {
+                request_header: entry[name] for name, (_, request_header) in VALIDATORS.items() if name in entry
+            }
+
+        timeout = self.option('download-timeout')
+
+        attempt = 1
+
+        while True:
+            try:
+                fetched = self._fetch(url, timeout, headers)
+                break
+
+            except (requests.exceptions.RequestException, IOError, ValueError) as exc:
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    raise gluetool.GlueError("Failed to download '{}': {}".format(url, exc))
+
+                self.warn("Failed to download '{}', attempt #{}: {}".format(url, attempt, exc))
+
+                attempt += 1
+
+        if fetched is None:
+            assert entry is not None
+
+            self.debug("'{}' not modified, found in cache".format(url))
+
+            digest = entry['digest']
+
+        else:
+            digest, validators = fetched
+
+            self._update_index(url, dict(validators, digest=digest))
+
+        if checksum and digest != checksum:
+            raise gluetool.GlueError("Checksum of '{}' does not match: expected {}, got {}".format(
+                url, checksum, digest
+            ))
+
+        return digest
+
+    def _fetch(self, url: str, timeout: Optional[int], headers: Dict[str, str]) -> Optional[Tuple[str, Dict[str, str]]]:
+        """
+        Download URL into the cache.
+
+        :param dict headers: headers asking the server to send the content only if it changed.
+        :returns: ``None`` if the content did not change, digest of the content and headers validating the content
+            otherwise.
+        """
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.download-')
+
+        try:
+            digest = hashlib.sha256()
+            size = 0
+
+            with os.fdopen(fd, 'wb') as f:
+                with requests.get(url, stream=True, timeout=timeout, headers=headers) as response:
+                    if headers and response.status_code == 304:
+                        return None
+
+                    response.raise_for_status()
+
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+                    expected_size = response.headers.get('Content-Length')
+
+                    # with compressed transfer, content length describes the compressed body
+                    if expected_size is not None and 'Content-Encoding' not in response.headers \
+                            and int(expected_size) != size:
+                        raise IOError('Incomplete download: expected {} bytes, got {}'.format(expected_size, size))
+
+                    validators = {
+                        name: response.headers[response_header]
+                        for name, (response_header, _) in VALIDATORS.items()
+                        if response_header in response.headers
+                    }
+
+            hexdigest = digest.hexdigest()
+            path = self.content_path(hexdigest)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        self.debug("downloaded '{}', {} bytes, sha256 {}".format(url, size, hexdigest))
+
+        self._verified[hexdigest] = True
+
+        return hexdigest, validators
+
+    def _prune(self) -> None:
+        """
+        Remove content not used for ``max-age`` days, and the least recently used content exceeding ``max-size``.
+        Content used by this pipeline is kept.
+        """
+
+        max_age = (self.option('max-age') or DEFAULT_MAX_AGE) * 24 * 3600
+        max_size = (self.option('max-size') or DEFAULT_MAX_SIZE) * 1024 * 1024
+
+        contents: List[Tuple[float, int, str]] = []
+
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not CONTENT_NAME_PATTERN.match(filename):
+                    continue
+
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+
+                except OSError:
+                    # removed by another pipeline
+                    continue
+
+                contents.append((stat.st_mtime, stat.st_size, filename))
+
+        now = time.time()
+        size = 0
+        removed: List[str] = []
+
+        # most recently used first
+        for mtime, content_size, digest in sorted(contents, reverse=True):
+            if digest not in self._verified and (now - mtime > max_age or size + content_size > max_size):
+                try:
+                    os.unlink(self.content_path(digest))
+
+                except OSError:
+                    pass
+
+                removed.append(digest)
+                continue
+
+            size += content_size
+
+        if not removed:
+            return
+
+        with self._lock:
+            self._save_index({
+                url: entry for url, entry in self._load_index().items() if entry['digest'] not in removed
+            })
+
+        self.info('removed {} artifacts from cache, {} bytes left'.format(len(removed), size))
+
+    def _submit(self, url: str, checksum: Optional[str]) -> 'concurrent.futures.Future[str]':
+        """
+        Start download of the URL, unless it was started already by this pipeline.
+        """
+
+        with self._lock:
+            if url not in self._downloads:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.option('download-workers') or 8
+                    )
+
+                self._downloads[url] = self._executor.submit(self._download, url, checksum)
+
+            return self._downloads[url]
+
+    #
+    # Server
+    #
+
+    def _handler(self) -> Any:
+
+        module = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == '/':
+                    self.send_response(200)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                match = CONTENT_PATH_PATTERN.match(urllib.parse.urlparse(self.path).path)
+                path = module.content_path(match.group(1)) if match else None
+
+                if path is None or not os.path.exists(path):
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(os.path.getsize(path)))
+                self.end_headers()
+
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                module.debug('cache server: {}'.format(format % args))
+
+        return Handler
+
+    @property
+    def listen_address(self) -> str:
+        """
+        Address the cache server listens on.
+        """
+
+        if self.option('listen-address'):
+            return cast(str, self.option('listen-address'))
+
+        # tunnels forward connections to the loopback, there is no need to expose the server to the network
+        if self.option('reverse-tunnel'):
+            return '127.0.0.1'
+
+        return '0.0.0.0'
+
+    @property
+    def server_port(self) -> int:
+        """
+        Port of the cache server, starting the server if not running yet.
+        """
+
+        with self._lock:
+            if self._server is None:
+                self._server = http.server.ThreadingHTTPServer(
+                    (self.listen_address, self.option('listen-port') or 0),
+                    self._handler()
+                )
+                self._server.daemon_threads = True
+
+                threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+                self.info('cache server listening on {}:{}'.format(*self._server.server_address[:2]))
+
+            return int(self._server.server_address[1])
+
+    def _open_tunnel(self, guest: NetworkedGuest) -> str:
+        """
+        Forward a port on the guest to the cache server.
+
+        :returns: base URL of the cache server, as seen by the guest.
+        """
+
+        remote_port = self.option('reverse-tunnel-port')
+
+        self._tunnels[guest.name] = guest.forward_remote_port(remote_port, self.server_port)
+
+        return 'http://127.0.0.1:{}'.format(remote_port)
+
+    def _close_tunnel(self, name: str) -> None:
+        """
+        Stop forwarding the port of a guest, if it is forwarded.
+        """
+
+        tunnel = self._tunnels.pop(name, None)
+
+        if tunnel is None:
+            return
+
+        tunnel.terminate()
+        tunnel.wait()
+
+    def _worker_address(self, guest: NetworkedGuest) -> str:
+        """
+        Find the worker address on the route to the guest.
+        """
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            # no packet is sent, connecting a datagram socket just picks the route
+            sock.connect((guest.hostname, guest.port or 22))
+
+            return str(sock.getsockname()[0])
+
+    def guest_url(self, guest: NetworkedGuest) -> Optional[str]:
+        """
+        Base URL of the cache server for the guest, or ``None`` when the guest cannot reach the server.
+        """
+
+        if guest.name in self._guest_urls:
+            return self._guest_urls[guest.name]
+
+        port = self.server_port
+
+        url: Optional[str] = None
+
+        try:
+            if self.option('reverse-tunnel'):
+                url = self._open_tunnel(guest)
+
+            elif self.option('guest-url'):
+                url = self.option('guest-url').format(port=port)
+
+            else:
+                url = 'http://{}:{}'.format(self._worker_address(guest), port)
+
+        except (OSError, gluetool.GlueError) as exc:
+            guest.warn('cannot set up artifact cache: {}'.format(exc))
+            self._guest_urls[guest.name] = None
+            return None
+
+        def _check() -> Result[bool, str]:
+            try:
+                guest.execute('curl -sf --max-time 5 {}/'.format(shlex.quote(str(url))))
+
+            except gluetool.GlueCommandError:
+                return Error('cache server not reachable')
+
+            return Ok(True)
+
+        try:
+            wait('guest reaching artifact cache', _check,
+                 timeout=self.option('guest-check-timeout'), tick=2, logger=guest.logger)
+
+        except gluetool.GlueError as exc:
+            guest.warn('artifact cache not reachable from the guest, using original URLs: {}'.format(exc))
+            url = None
+
+            self._close_tunnel(guest.name)
+
+        self._guest_urls[guest.name] = url
+
+        return url
+
+    #
+    # Shared functions
+    #
+
+    def cache_urls(self,
+                   guest: NetworkedGuest,
+                   urls: List[str],
+                   checksums: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        Download artifacts into the cache, and provide URLs the guest can fetch them from.
+
+        :param NetworkedGuest guest: guest which is going to download the artifacts.
+        :param list(str) urls: URLs of artifacts.
+        :param dict(str, str) checksums: expected SHA256 digests of artifacts, by their URLs.
+        :returns: mapping between the original URLs and URLs to use by the guest. URLs which could not be cached
+            are mapped to themselves.
+        """
+
+        checksums = checksums or {}
+
+        mapping = {url: url for url in urls}
+
+        if not urls:
+            return mapping
+
+        base_url = self.guest_url(guest)
+
+        if base_url is None:
+            return mapping
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        futures = {url: self._submit(url, checksums.get(url)) for url in urls}
+
+        for url, future in futures.items():
+            try:
+                digest = future.result()
+
+            except gluetool.GlueError as exc:
+                guest.warn('{}, guest will download it directly'.format(exc))
+                continue
+
+            except Exception as exc:
+                guest.warn("Failed to cache '{}': {}, guest will download it directly".format(url, exc))
+                continue
+
+            # keep the last path segment as it is, still encoded, so the guest saves the file under the same name
+            # it would get when downloading the original URL
+            filename = urllib.parse.urlparse(url).path.rsplit('/', 1)[-1]
+
+            mapping[url] = '{}/{}/{}'.format(base_url, digest, filename)
+
+        log_dict(guest.debug, 'cached URLs', mapping)
+
+        return mapping
+
+    def destroy(self, failure: Optional[gluetool.Failure] = None) -> None:
+
+        for name in list(self._tunnels):
+            self._close_tunnel(name)
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+        if self._downloads and os.path.isdir(self.cache_dir):
+            self._prune()
@@ -3,16 +3,18 @@
 
 import os
 import re
+import shutil
 import six
 
 import gluetool
 from gluetool.action import Action
-from gluetool.log import log_dict
+from gluetool.log import format_blob, log_dict
 from gluetool.result import Ok
-from gluetool.utils import normalize_path_option, render_template
+from gluetool.utils import dump_yaml, normalize_path, normalize_path_option, render_template
 from gluetool_modules_framework.libs.artifacts import artifacts_location
 from gluetool_modules_framework.libs.guest_setup import guest_setup_log_dirpath, GuestSetupOutput, GuestSetupStage, \
-    GuestSetupStageAdapter, SetupGuestReturnType
+    GuestSetupStageAdapter, SetupGuestReturnType, STAGES_ORDERED
+from gluetool_modules_framework.helpers.rules_engine import precompile_rules
 
 # Type annotations
 from typing import cast, TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union  # noqa
@@ -52,6 +54,36 @@ STAGE_SPEC_PATTERN = re.compile(r'^(?:({}):)?(.+)$'.format(
     ])
 ))
 
+#: Name of the play marking the beginning of stage playbooks in a merged run.
+MERGED_STAGE_PLAY_NAME = 'guest-setup stage {}'
+
+#: Header of the marking play, as printed by ``ansible-playbook``.
+MERGED_STAGE_PLAY_PATTERN = re.compile(r'^PLAY \[guest-setup stage ([a-z-]+)\]', re.M)
+
+#: Outputs of a stage, or an exception raised while playing its playbooks.
+MergedStageResultType = Union[List[GuestSetupOutput], Exception]
+
+
+def split_merged_output(output: str) -> Dict[str, str]:
+    """
+    Split output of a merged ``ansible-playbook`` run into parts belonging to each stage.
+
+    Stages are recognized by headers of their marking plays, anything preceding the first header belongs
+    to the first stage.
+
+    :param str output: output of ``ansible-playbook``.
+    :returns: mapping between stage names and their output, in the order in which stages were played.
+    """
+
+    matches = list(MERGED_STAGE_PLAY_PATTERN.finditer(output))
+
+    return {
+        match.group(1): output[
+            (match.start() if i else 0):(matches[i + 1].start() if i + 1 < len(matches) else len(output))
+        ]
+        for i, match in enumerate(matches)
+    }
+
 
 class GuestSetup(gluetool.Module):
     """
@@ -110,6 +142,22 @@ class GuestSetup(gluetool.Module):
     the value of ``playbooks`` replaces the list of playbooks to play. The dictionary extra_vars adds
     additional extra variables which should be run with playbooks. All variables are processed by Jinja2 templating
     engine, so you can use evaluation context variables if needed.
+
+    Merged stages
+    =============
+
+    Every stage is played by its own ``ansible-playbook`` process, which means inventory parsing, fact gathering and
+    establishing SSH connection again and again. With ``--merge-stages``, consecutive stages can be played by
+    a single ``ansible-playbook`` run: when ``setup_guest`` is called for the first stage of a group, a wrapper
+    playbook, importing playbooks of all stages of the group, is played. Facts are cached between plays of the run,
+    but never reused by another run. Each stage still gets its own log and outputs, and these are returned by
+    ``setup_guest`` calls for the following stages of the group.
+
+    Variables are still passed to playbooks as extra variables, therefore stages are merged only when their
+    variables are the same - except ``GUEST_SETUP_STAGE``, which is set by a ``set_fact`` task at the beginning
+    of each stage. Otherwise, stages are played one by one. The variables given to the call of the first stage
+    are used for all stages of the group. The ``artifact-installation`` stage cannot be merged since other modules
+    install artifacts during that stage.
     """
 
     name = 'guest-setup'
@@ -146,11 +194,28 @@ class GuestSetup(gluetool.Module):
             'action': 'append',
             'default': [],
             'metavar': 'STAGE:FILE,STAGE2:FILE2,...'
+        },
+        'merge-stages': {
+            'help': """
+                    Comma-separated list of groups of consecutive stages whose playbooks should be played by a single
+                    ``ansible-playbook`` run. Stages of a group are separated by ``+``. (default: none).
+                    """,
+            'action': 'append',
+            'default': [],
+            'metavar': 'STAGE1+STAGE2,...'
         }
     }
 
     shared_functions = ['setup_guest']
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+
+        super(GuestSetup, self).__init__(*args, **kwargs)
+
+        #: Results of stages played by a merged run, waiting for their ``setup_guest`` calls. Keyed by guest name
+        #: and stage.
+        self._merged_results: Dict[Tuple[str, GuestSetupStage], MergedStageResultType] = {}
+
     def _parse_staged_option(
         self,
         option_name: str,
@@ -201,7 +266,7 @@ class GuestSetup(gluetool.Module):
                 ConfigInstructionMapType,
                 stages
             )[stage].extend(
-                gluetool.utils.load_yaml(filepath, logger=self.logger)
+                precompile_rules(gluetool.utils.load_yaml(filepath, logger=self.logger))
             )
 
         return cast(
@@ -253,6 +318,20 @@ class GuestSetup(gluetool.Module):
             )
         )
 
+    @gluetool.utils.cached_property
+    def _merged_stages(self) -> List[List[GuestSetupStage]]:
+
+        groups: List[List[GuestSetupStage]] = []
+
+        for value in gluetool.utils.normalize_multistring_option(self.option('merge-stages') or []):
+            try:
+                groups.append([GuestSetupStage(stage.strip()) for stage in value.split('+')])
+
+            except ValueError:
+                raise gluetool.GlueError('Unknown stage in merged stages: {}'.format(value))
+
+        return groups
+
     def _get_details_from_map(
        self,
        guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
@@ -278,14 +357,13 @@ class GuestSetup(gluetool.Module):
 
         playbooks_map = self._playbooks_map.get(stage.value, [])
 
-        for playbooks_set in playbooks_map:
-            gluetool.log.log_dict(self.debug, 'evaluating following playbooks set rule', playbooks_set)
+        if not playbooks_map:
+            return (playbooks, extra_vars)
 
-            if not self.shared('evaluate_rules',
-                               playbooks_set.get('rule', 'False'),
-                               context=context):
-                self.debug('rule does not match, moving on')
-                continue
+        # Rules of playbook sets do not depend on each other, therefore they can be evaluated in a batch.
+        for playbooks_set in self.shared('evaluate_filter', playbooks_map, context=context, default_rule='False',
+                                         batch=True):
+            gluetool.log.log_dict(self.debug, 'using playbooks set', playbooks_set)
 
             if 'playbooks' in playbooks_set:
                 playbooks = normalize_path_option([render_context(pbook) for pbook in playbooks_set['playbooks']])
@@ -301,6 +379,40 @@ class GuestSetup(gluetool.Module):
 
         return (playbooks, extra_vars)
 
+    def _get_stage_details(
+        self,
+        guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+        stage: GuestSetupStage,
+        variables: Optional[Dict[str, str]]
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """
+        Returns a tuple with list of playbooks and variables to play in the given stage.
+        """
+
+        # Detect playbooks and extra vars from the playbook map...
+        playbooks_from_map, variables_from_map = self._get_details_from_map(guest, stage)
+
+        # ... and command-line/config file options.
+        playbooks_from_config: List[str] = self._playbooks.get(stage.value, [])
+        variables_from_config: Dict[str, str] = self._extra_vars.get(stage.value, {})
+
+        # For the final list of playbooks, command-line/configuration has higher priority.
+        playbooks = playbooks_from_config or playbooks_from_map
+
+        # The same applies to extra variables - those specified by command-line/configuration override all other
+        # variables.
+        if variables_from_config:
+            variables = dict(variables_from_config)
+
+        else:
+            variables = dict(variables or {})
+
+            variables.update(variables_from_map)
+
+        variables['GUEST_SETUP_STAGE'] = stage.value
+
+        return playbooks, variables
+
     def setup_guest(self,
                     guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
                     stage: GuestSetupStage = GuestSetupStage.PRE_ARTIFACT_INSTALLATION,
@@ -328,6 +440,16 @@ class GuestSetup(gluetool.Module):
         assert guest.environment is not None
 
         log_dirpath = guest_setup_log_dirpath(guest, log_dirpath)
+
+        for group in self._merged_stages:
+            if stage not in group:
+                continue
+
+            r_merged = self._setup_guest_merged(guest, group[group.index(stage):], variables, log_dirpath, **kwargs)
+
+            if r_merged is not None:
+                return r_merged
+
         log_filepath = os.path.join(log_dirpath, 'guest-setup-output-{}.txt'.format(stage.value))
 
         logger = GuestSetupStageAdapter(guest.logger, stage)
@@ -335,38 +457,13 @@ class GuestSetup(gluetool.Module):
         log_location = artifacts_location(self, log_filepath, logger=logger)
         logger.info('guest setup log is in {}'.format(log_location))
 
-        # Detect playbooks and extra vars from the playbook map...
-        playbooks_from_map, variables_from_map = self._get_details_from_map(guest, stage)
-
-        # ... and command-line/config file options.
-        playbooks_from_config: List[str] = self._playbooks.get(stage.value, [])
-        variables_from_config: Dict[str, str] = self._extra_vars.get(stage.value, {})
-
-        # For the final list of playbooks, command-line/configuration has higher priority.
-        playbooks = playbooks_from_config or playbooks_from_map
+        playbooks, variables = self._get_stage_details(guest, stage, variables)
 
         if not playbooks:
             logger.info('no setup playbooks')
 
             return Ok([])
 
-        # The same applies to extra variables - those specified by command-line/configuration override all other
-        # variables.
-        if variables_from_config:
-            variables = variables_from_config
-
-        else:
-            variables = variables or {}
-
-            variables.update(variables_from_map)
-
-        # Make type checking happy
-        assert variables is not None
-
-        variables['GUEST_SETUP_STAGE'] = stage.value
-
-        log_dict(logger.debug, 'playbook variables', variables)
-
         log_dict(logger.debug, 'final playbook variables', variables)
 
         log_dict(logger.info, 'setting up with playbooks', playbooks)
@@ -404,9 +501,253 @@ class GuestSetup(gluetool.Module):
             )
         ])
 
+    def _setup_guest_merged(
+        self,
+        guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+        stages: List[GuestSetupStage],
+        variables: Optional[Dict[str, str]],
+        log_dirpath: str,
+        **kwargs: Any
+    ) -> Optional[SetupGuestReturnType]:
+        """
+        Return results of the first of given stages, playing playbooks of all given stages by a single
+        ``ansible-playbook`` run unless they were already played together with a preceding stage.
+
+        :returns: results of the first stage, or ``None`` if the stages cannot be merged, and the first stage
+            should be played on its own.
+        """
+
+        key = (guest.name, stages[0])
+
+        if key not in self._merged_results:
+            # Nothing to merge with, e.g. when preceding stages were played separately.
+            if len(stages) == 1:
+                return None
+
+            details = [(stage,) + self._get_stage_details(guest, stage, variables) for stage in stages]
+
+            # Extra variables are shared by all plays of the run, only the stage differs.
+            stages_variables = [
+                {name: value for name, value in stage_variables.items() if name != 'GUEST_SETUP_STAGE'}
+                for _, playbooks, stage_variables in details
+                if playbooks
+            ]
+
+            if any(stage_variables != stages_variables[0] for stage_variables in stages_variables[1:]):
+                GuestSetupStageAdapter(guest.logger, stages[0]).info(
+                    'variables of merged stages differ, playing stages separately'
+                )
+
+                return None
+
+            self._merged_results.update({
+                (guest.name, stage): result
+                for stage, result in self._play_merged_stages(
+                    guest, details, stages_variables[0] if stages_variables else {}, log_dirpath, **kwargs
+                ).items()
+            })
+
+        result = self._merged_results.pop(key)
+
+        if isinstance(result, Exception):
+            raise result
+
+        return Ok(result)
+
+    def _play_merged_stages(
+        self,
+        guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+        details: List[Tuple[GuestSetupStage, List[str], Dict[str, str]]],
+        variables: Dict[str, str],
+        log_dirpath: str,
+        **kwargs: Any
+    ) -> Dict[GuestSetupStage, MergedStageResultType]:
+        """
+        Play playbooks of given stages by a single ``ansible-playbook`` run.
+
+        :param list details: stages with their playbooks and variables, as returned by :py:meth:`_get_stage_details`.
+        :param dict variables: extra variables, common for all stages.
+        :returns: mapping between stages and their results. Stages following the failed one are not included.
+        """
+
+        assert guest.environment is not None
+
+        stages = [stage for stage, _, _ in details]
+
+        label = '+'.join(stage.value for stage in stages)
+
+        log_filepath = os.path.join(log_dirpath, 'guest-setup-output-{}.txt'.format(label))
+        playbook_filepath = os.path.join(log_dirpath, 'guest-setup-{}.yaml'.format(label))
+        fact_cache_dirpath = os.path.join(log_dirpath, 'ansible-facts-{}'.format(label))
+
+        # Each stage starts with a play setting the stage variable - its header in the output tells us where
+        # the stage begins.
+        plays: List[Dict[str, Any]] = []
+        played_stages: List[GuestSetupStage] = []
+
+        for stage, playbooks, stage_variables in details:
+            logger = GuestSetupStageAdapter(guest.logger, stage)
+
+            if not playbooks:
+                logger.info('no setup playbooks')
+                continue
+
+            log_dict(logger.debug, 'final playbook variables', stage_variables)
+
+            log_dict(logger.info, 'setting up with playbooks', playbooks)
+
+            played_stages.append(stage)
+
+            plays.append({
+                'name': MERGED_STAGE_PLAY_NAME.format(stage.value),
+                'hosts': 'all',
+                'gather_facts': False,
+                'tags': ['always'],
+                'tasks': [
+                    {
+                        'name': 'set guest setup stage',
+                        'set_fact': {
+                            'GUEST_SETUP_STAGE': stage.value
+                        }
+                    }
+                ]
+            })
+
+            plays += [
+                {
+                    'import_playbook': normalize_path(playbook),
+                    'tags': [stage.value]
+                }
+                for playbook in playbooks
+            ]
+
+        if not played_stages:
+            return {stage: [] for stage in stages}
+
+        dump_yaml(plays, playbook_filepath, logger=guest.logger)
+
+        # Let plays share gathered facts, instead of gathering them for each playbook. Facts must not outlive
+        # the run, the guest may change between runs, e.g. by installing the artifact, or by a reboot.
+        env = dict(kwargs.pop('env', None) or os.environ)
+
+        if 'ANSIBLE_CACHE_PLUGIN' not in env:
+            shutil.rmtree(fact_cache_dirpath, ignore_errors=True)
+
+            env.update({
+                'ANSIBLE_GATHERING': 'smart',
+                'ANSIBLE_CACHE_PLUGIN': 'jsonfile',
+                'ANSIBLE_CACHE_PLUGIN_CONNECTION': fact_cache_dirpath
+            })
+
+        ansible_output: Any = None
+        failure: Optional[Exception] = None
+
+        with Action(
+            'configuring guest with merged playbooks',
+            parent=Action.current_action(),
+            logger=guest.logger,
+            tags={
+                'guest': {
+                    'hostname': guest.hostname,
+                    'environment': guest.environment.serialize_to_json()
+                },
+                'playbook-paths': [playbook_filepath]
+            }
+        ):
+            try:
+                ansible_output = self.shared(
+                    'run_playbook',
+                    playbook_filepath,
+                    guest,
+                    variables=variables,
+                    json_output=False,
+                    logger=guest.logger,
+                    log_filepath=log_filepath,
+                    env=env,
+                    extra_vars_filename_prefix='extra-vars-{}-'.format(label),
+                    **kwargs
+                )
+
+                output = ansible_output.execution_output if ansible_output else None
+
+            except gluetool.GlueError as exc:
+                failure = exc
+
+                output = getattr(exc, 'ansible_output', None)
+
+        stage_outputs = split_merged_output(output.stdout or '') if output else {}
+
+        # The failure belongs to the last stage that began.
+        failed_stage: Optional[GuestSetupStage] = None
+
+        if failure is not None:
+            failed_stage = GuestSetupStage(list(stage_outputs)[-1]) if stage_outputs else played_stages[0]
+
+        results: Dict[GuestSetupStage, MergedStageResultType] = {}
+
+        for stage in stages:
+            if stage not in played_stages:
+                results[stage] = []
+                continue
+
+            logger = GuestSetupStageAdapter(guest.logger, stage)
+
+            if output is None:
+                stage_log_filepath = log_filepath
+
+            else:
+                stage_log_filepath = os.path.join(log_dirpath, 'guest-setup-output-{}.txt'.format(stage.value))
+
+                with open(stage_log_filepath, 'w') as f:
+                    f.write('# STDOUT:\n{}\n\n'.format(format_blob(stage_outputs.get(stage.value, ''))))
+
+                    if stage == (failed_stage or played_stages[-1]):
+                        f.write('# STDERR:\n{}\n\n'.format(format_blob(output.stderr or '')))
+
+            logger.info('guest setup log is in {}'.format(artifacts_location(self, stage_log_filepath, logger=logger)))
+
+            if stage == failed_stage:
+                assert failure is not None
+
+                results[stage] = failure
+                break
+
+            results[stage] = [
+                GuestSetupOutput(
+                    stage=stage,
+                    label='guest setup',
+                    log_path=stage_log_filepath,
+                    additional_data=ansible_output
+                )
+            ]
+
+        return results
+
+    def sanity(self) -> None:
+
+        merged_stages: List[GuestSetupStage] = []
+
+        for group in self._merged_stages:
+            label = '+'.join(stage.value for stage in group)
+
+            if GuestSetupStage.ARTIFACT_INSTALLATION in group:
+                raise gluetool.GlueError(
+                    'Stage {} cannot be merged'.format(GuestSetupStage.ARTIFACT_INSTALLATION.value)
+                )
+
+            indices = [STAGES_ORDERED.index(stage) for stage in group]
+
+            if len(group) < 2 or indices != list(range(indices[0], indices[0] + len(group))):
+                raise gluetool.GlueError('Merged stages must be two or more consecutive stages: {}'.format(label))
+
+            if any(stage in merged_stages for stage in group):
+                raise gluetool.GlueError('Stages cannot be merged more than once: {}'.format(label))
+
+            merged_stages += group
+
     def execute(self) -> None:
 
         self.require_shared('run_playbook')
 
         if self.option('playbooks-map'):
-            self.require_shared('evaluate_rules')
+            self.require_shared('evaluate_filter')
@@ -1,22 +1,325 @@
 # Copyright Contributors to the Testing Farm project.
 # SPDX-License-Identifier: Apache-2.0
 
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
 import tempfile
 
 import gluetool
 
 from gluetool.result import Result
 
-from typing import Any, Optional, List, Set, Union  # noqa
+from typing import Any, BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Pattern, Set, Tuple, Union  # noqa
 
 DEFAULT_RETRY_TIMEOUT = 30
 DEFAULT_RETRY_TICK = 10
 
+#: Secrets are replaced with this string.
+REPLACEMENT = b'hidden'
+
+#: Size of chunks files are streamed in.
+CHUNK_SIZE = 1024 * 1024
+
+#: How many leading bytes are probed for a NUL byte when detecting binary files.
+BINARY_PROBE_SIZE = 8192
+
+#: Maximum number of whitespace characters tolerated around newlines of multi-line secrets.
+MAX_INDENT = 128
+
+#: Scan files in the calling process if there are fewer files than this, a process pool does not pay off.
+POOL_MIN_FILES = 32
+
+#: Results of scrubbing a single file.
+FILE_CLEAN = 'clean'
+FILE_UNCHANGED = 'unchanged'
+FILE_HIDDEN = 'hidden'
+FILE_BINARY = 'binary'
+FILE_MISSING = 'missing'
+FILE_ERROR = 'error'
+
+#: How many bytes preceding the end of the previously scanned content are used to verify a file was only appended to.
+TAIL_SIZE = 4096
+
+#: A record of a file scan.
+#:
+#: :param int inode: inode of the scanned file.
+#: :param int size: number of bytes scanned.
+#: :param int mtime: modification time of the file, in nanoseconds, before it was scanned.
+#: :param str secrets: digest of secrets the file was scanned for, see :py:func:`secrets_digest`.
+#: :param str tail: digest of the last scanned bytes, used to tell appended files from rewritten ones.
+ScanRecord = NamedTuple('ScanRecord', (
+    ('inode', int),
+    ('size', int),
+    ('mtime', int),
+    ('secrets', str),
+    ('tail', str)
+))
+
+#: A file to scan, and offset of the content not scanned yet.
+ScanJob = Tuple[str, int, Optional[str]]
+
+#: Outcome of a file scan: one of ``FILE_*`` constants, an error message, and a record of the scan.
+ScanResult = Tuple[str, Optional[str], Optional[ScanRecord]]
+
+
+def _secret_pattern(secret: str) -> Tuple[bytes, int]:
+    """
+    Convert a secret to a regular expression and compute the maximal length of text it can match.
+
+    Secrets can be indented with spaces, so any whitespace around newlines is matched as well. Long lines
+    can be folded, e.g. by YAML dumpers, therefore a space may be replaced by a newline too.
+    """
+
+    newline = br'\s{0,%d}\n\s{0,%d}' % (MAX_INDENT, MAX_INDENT)
+    space = br'(?: |%s)' % newline
+
+    lines = [
+        space.join(re.escape(word.encode('utf-8')) for word in line.split(' '))
+        for line in secret.split('\n')
+    ]
+
+    breaks = secret.count('\n') + secret.count(' ')
+
+    return newline.join(lines), len(secret.encode('utf-8')) + breaks * 2 * MAX_INDENT
+
+
+def compile_secrets(secrets: Iterable[str]) -> Tuple[Optional[Pattern[bytes]], int]:
+    """
+    Compile all secrets into a single pattern matching any of them in one pass.
+
+    Longer secrets come first, so a secret containing another secret is hidden as a whole.
+
+    :returns: compiled pattern, or ``None`` when there are no secrets, and the maximal length of a match.
+    """
+
+    patterns = [_secret_pattern(secret) for secret in sorted(set(secrets), key=len, reverse=True) if secret]
+
+    if not patterns:
+        return None, 0
+
+    return re.compile(b'|'.join(pattern for pattern, _ in patterns)), max(length for _, length in patterns)
+
+
+def secrets_digest(secrets: Iterable[str]) -> str:
+    """
+    Compute a digest identifying a set of secrets.
+    """
+
+    return hashlib.sha256(b'\0'.join(sorted(secret.encode('utf-8') for secret in set(secrets) if secret))).hexdigest()
+
+
+def scrub_stream(
+    source: BinaryIO,
+    pattern: Pattern[bytes],
+    max_length: int,
+    output: Optional[BinaryIO] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> int:
+    """
+    Replace secrets in a stream, reading it in chunks.
+
+    The tail of each chunk which might contain a beginning of a secret is carried over to the next chunk,
+    therefore secrets crossing chunk boundaries are found as well.
+
+    :param source: stream to read.
+    :param pattern: compiled secrets, see :py:func:`compile_secrets`.
+    :param max_length: maximal length of a match.
+    :param output: if set, scrubbed content is written into this stream. Otherwise, the function stops
+        with the first secret found.
+    :param chunk_size: size of chunks to read.
+    :returns: number of secrets found.
+    """
+
+    found = 0
+    carry = b''
+
+    while True:
+        chunk = source.read(chunk_size)
+        buffer = carry + chunk
+        final = not chunk
+
+        # Matches starting before `cut` fit into the buffer, the rest must wait for the next chunk.
+        cut = len(buffer) if final else len(buffer) - max_length + 1
+
+        if cut <= 0 and not final:
+            carry = buffer
+            continue
+
+        position = 0
+        pieces: List[bytes] = []
+
+        for match in pattern.finditer(buffer):
+            if match.start() >= cut:
+                break
+
+            found += 1
+
+            if output is None:
+                return found
+
+            pieces += [buffer[position:match.start()], REPLACEMENT]
+            position = match.end()
+
+        keep = max(cut, position)
+
+        if output is not None:
+            pieces.append(buffer[position:keep])
+            output.write(b''.join(pieces))
+
+        carry = buffer[keep:]
+
+        if final:
+            return found
+
+
+def _is_binary(source: BinaryIO) -> bool:
+    source.seek(0)
+    return b'\0' in source.read(BINARY_PROBE_SIZE)
+
+
+def _tail_digest(source: BinaryIO, size: int) -> str:
+    source.seek(max(0, size - TAIL_SIZE))
+    return hashlib.sha256(source.read(min(size, TAIL_SIZE))).hexdigest()
+
+
+def _copy_head(source: BinaryIO, output: BinaryIO, size: int) -> None:
+    source.seek(0)
+
+    while size > 0:
+        chunk = source.read(min(size, CHUNK_SIZE))
+
+        if not chunk:
+            break
+
+        output.write(chunk)
+        size -= len(chunk)
+
+
+def scrub_file(
+    filepath: str,
+    pattern: Pattern[bytes],
+    max_length: int,
+    secrets: str,
+    skip_binary: bool = False,
+    offset: int = 0,
+    tail: Optional[str] = None
+) -> ScanResult:
+    """
+    Hide secrets in a file.
+
+    The file is scanned first, and only if it contains a secret, it is rewritten - scrubbed content is streamed
+    into a temporary file which then atomically replaces the original file.
+
+    If ``offset`` is set, the file was already scanned up to this offset, and only the rest, plus enough bytes
+    to catch a secret crossing the offset, is scanned. Unless the digest of bytes preceding the offset differs
+    from ``tail``, then the file was rewritten rather than appended to, and it is scanned as a whole.
+
+    :param secrets: digest of secrets, recorded in the scan record.
+    :returns: a result, one of ``FILE_*`` constants, an error message when the file could not be processed,
+        and a record of the scan.
+    """
+
+    try:
+        with open(filepath, 'rb') as source:
+            stat = os.fstat(source.fileno())
+
+            if skip_binary and _is_binary(source):
+                return FILE_BINARY, None, ScanRecord(
+                    stat.st_ino, stat.st_size, stat.st_mtime_ns, secrets, _tail_digest(source, stat.st_size)
+                )
+
+            if offset and _tail_digest(source, offset) != tail:
+                offset = 0
+
+            start = max(0, offset - max_length + 1)
+            source.seek(start)
+
+            if not scrub_stream(source, pattern, max_length):
+                size = source.tell()
+
+                return FILE_CLEAN, None, ScanRecord(
+                    stat.st_ino, size, stat.st_mtime_ns, secrets, _tail_digest(source, size)
+                )
+
+            fd, temp_filepath = tempfile.mkstemp(prefix='.hide-secrets-', dir=os.path.dirname(filepath))
+
+            try:
+                with os.fdopen(fd, 'w+b') as output:
+                    _copy_head(source, output, start)
+
+                    source.seek(start)
+                    scrub_stream(source, pattern, max_length, output=output)
+
+                    output.flush()
+                    os.fsync(output.fileno())
+
+                    stat = os.fstat(output.fileno())
+                    record = ScanRecord(
+                        stat.st_ino, stat.st_size, stat.st_mtime_ns, secrets, _tail_digest(output, stat.st_size)
+                    )
+
+                shutil.copymode(filepath, temp_filepath)
+                os.replace(temp_filepath, filepath)
+
+            except BaseException:
+                if os.path.exists(temp_filepath):
+                    os.unlink(temp_filepath)
+
+                raise
+
+    except FileNotFoundError:
+        # The file was removed in the meantime, nothing to hide.
+        return FILE_MISSING, None, None
+
+    except OSError as exc:
+        return FILE_ERROR, str(exc), None
+
+    return FILE_HIDDEN, None, record
+
+
+def _scrub_files(
+    jobs: List[ScanJob],
+    pattern: Pattern[bytes],
+    max_length: int,
+    secrets: str,
+    skip_binary: bool
+) -> List[ScanResult]:
+    return [
+        scrub_file(filepath, pattern, max_length, secrets, skip_binary=skip_binary, offset=offset, tail=tail)
+        for filepath, offset, tail in jobs
+    ]
+
+
+def list_files(search_path: str) -> List[str]:
+    """
+    List regular files under the search path, symlinks are not followed.
+    """
+
+    if os.path.isfile(search_path) and not os.path.islink(search_path):
+        return [search_path]
+
+    return [
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(search_path)
+        for filename in filenames
+        if not os.path.islink(os.path.join(dirpath, filename))
+    ]
+
 
 class HideSecrets(gluetool.Module):
     """
     Hide secrets from all files in the search path, by default
     current working directory.
+
+    All secrets are matched at once, files are streamed in chunks, and only files containing a secret are
+    rewritten. Large trees are scanned by a pool of worker processes.
+
+    Files are scanned again only when they changed since the last scan, or when new secrets were added.
+    Files which were only appended to, e.g. logs, are scanned from the end of the previous scan.
     """
 
     name = 'hide-secrets'
@@ -37,6 +340,19 @@ class HideSecrets(gluetool.Module):
             'type': int,
             'default': DEFAULT_RETRY_TIMEOUT,
         },
+        'workers': {
+            'help': 'Number of worker processes scanning files (default: number of CPUs).',
+            'metavar': 'WORKERS',
+            'type': int,
+        },
+        'skip-binary-files': {
+            'help': 'Do not hide secrets in binary files, i.e. files with a NUL byte close to their beginning.',
+            'action': 'store_true',
+        },
+        'full-scan': {
+            'help': 'Always scan whole files, ignoring records of previous scans.',
+            'action': 'store_true',
+        },
     }
     shared_functions = ['add_secrets', 'hide_secrets']
 
@@ -50,91 +366,143 @@ class HideSecrets(gluetool.Module):
         super(HideSecrets, self).__init__(*args, **kwargs)
         self._secrets: Set[str] = set()
 
-    def hide_secrets(self, search_path: Optional[str] = None) -> None:
+        # Records of previous file scans, by absolute path of the file.
+        self._scan_records: Dict[str, ScanRecord] = {}
+
+    def _plan_scan(self, filepaths: List[str], secrets: str) -> Tuple[List[ScanJob], int]:
+        """
+        Find out which files need to be scanned, and from which offset, using records of previous scans.
+
+        :returns: files to scan, and number of files which did not change since their last scan.
+        """
+
+        if self.option('full-scan'):
+            return [(filepath, 0, None) for filepath in filepaths], 0
+
+        jobs: List[ScanJob] = []
+        unchanged = 0
+
+        for filepath in filepaths:
+            record = self._scan_records.get(os.path.abspath(filepath))
+
+            if record is None or record.secrets != secrets:
+                jobs.append((filepath, 0, None))
+                continue
+
+            try:
+                stat = os.stat(filepath)
+
+            except OSError:
+                # Vanished files are left for the scan to report.
+                jobs.append((filepath, 0, None))
+                continue
+
+            if stat.st_ino != record.inode or stat.st_size < record.size:
+                jobs.append((filepath, 0, None))
+
+            elif stat.st_size > record.size:
+                jobs.append((filepath, record.size, record.tail))
+
+            elif stat.st_mtime_ns != record.mtime:
+                jobs.append((filepath, 0, None))
+
+            else:
+                unchanged += 1
+
+        return jobs, unchanged
+
+    def _scrub(
+        self,
+        jobs: List[ScanJob],
+        pattern: Pattern[bytes],
+        max_length: int,
+        secrets: str
+    ) -> List[ScanResult]:
+        skip_binary = bool(self.option('skip-binary-files'))
+        workers = self.option('workers') or os.cpu_count() or 1
+
+        if workers < 2 or len(jobs) < POOL_MIN_FILES:
+            return _scrub_files(jobs, pattern, max_length, secrets, skip_binary)
+
+        # Hand files to workers in batches, to keep the overhead of passing them around low. Using `spawn`,
+        # this module is often called from a timer thread, and forking a threaded process is not safe.
+        batch_size = max(1, len(jobs) // (workers * 4))
+        batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            futures = [
+                executor.submit(_scrub_files, batch, pattern, max_length, secrets, skip_binary)
+                for batch in batches
+            ]
+
+            return [result for future in futures for result in future.result()]
+
+    def hide_secrets(self, search_path: Optional[str] = None, keep_records: bool = True) -> None:
+        """
+        Hide secrets in all files under the search path.
+
+        :param str search_path: path to search for files, ``search-path`` option is used by default.
+        :param bool keep_records: if unset, records of scans of files under the search path are dropped once
+            processed. Useful for paths which are not going to be scanned again, e.g. temporary snapshots.
+        """
+
         search_path = search_path or self.option('search-path')
         assert search_path
 
-        # POSIX.2 Basic Regular Expressions (BREs) have a specific set of characters
-        # that you need to escape to use them as literals.
-        #
-        # Here's a list of special characters in POSIX.2 BREs:
-        # * Backslash '\'
-        # * Dot '.'
-        # * Asterisk '*'
-        # * Square brackets '[' and ']'
-        # * Caret '^'
-        # * Dollar sign '$'
-        #
-        # Note that backslash needs to be escaped separately
-        #
-        # We need to also escape:
-        # * Pipe '|' - because we use sed with '|' character
-        def _posix_bre_escaped(value: str) -> str:
-            value = value.replace('\\', '\\\\')
-            for escape in r".*[]^$|":
-                value = value.replace(escape, r'\{}'.format(escape))
-            # Secrets can be indented with spaces, so we need to match them
-            value = value.replace('\n', '[[:space:]]*\\n[[:space:]]*')
-            return value
-
-        sed_expr = '\n'.join('s|{}|hidden|g'.format(_posix_bre_escaped(value)) for value in self._secrets)
+        pattern, max_length = compile_secrets(self._secrets)
 
         # NOTE: We will deprecate this crazy module once TFT-1813
-        if not sed_expr:
+        if pattern is None:
             self.debug("No secrets to hide, all secrets had empty values")
             return
 
         self.debug("Hiding secrets from all files under '{}' path".format(search_path))
 
-        with tempfile.NamedTemporaryFile(mode='w', dir='.') as temp:
-            temp.write(sed_expr)
-            temp.flush()
-            # -print0 puts a null byte as a separator between each item
-            # -0 expects such separator so no more separating by space which takes quotes into account
-            command = "find '{}' -type f -print0 | xargs -0 -i##### sed -z -i -f '{}' '#####'".format(
-                search_path, temp.name)
+        secrets = secrets_digest(self._secrets)
+        pending, unchanged = self._plan_scan(list_files(search_path), secrets)
+        counts: Dict[str, int] = {FILE_UNCHANGED: unchanged}
 
-            def _run_sed() -> Result[bool, bool]:
-                try:
-                    output = gluetool.utils.Command([command], logger=self.logger).run(shell=True)
-                except gluetool.GlueCommandError as exc:
-                    self.warn('sync command "{}" failed, retrying: {}'.format(command, exc), sentry=True)
-                    return Result.Error(False)
+        def _run_scrub() -> Result[bool, bool]:
+            assert pattern is not None
 
-                output.log(self.logger)
-                if output.exit_code != 0:
-                    raise gluetool.GlueError('Failed to hide secrets, secrets could be leaked!')
+            results = self._scrub(pending, pattern, max_length, secrets)
+            failed = []
 
-                return Result.Ok(True)
+            for job, (result, error, record) in zip(pending, results):
+                filepath = job[0]
+                counts[result] = counts.get(result, 0) + 1
 
-            gluetool.utils.wait(
-                "Running '{}'".format(command),
-                _run_sed,
-                timeout=self.option('retry-timeout'),
-                tick=self.option('retry-tick')
-            )
+                if record is None or not keep_records:
+                    self._scan_records.pop(os.path.abspath(filepath), None)
 
-        # Be paranoic that modified files were written to the disk
-        cmd = ['sync', search_path]
+                else:
+                    self._scan_records[os.path.abspath(filepath)] = record
 
-        def _run_sync() -> Result[bool, bool]:
-            try:
-                gluetool.utils.Command(cmd, logger=self.logger).run()
-            except gluetool.GlueCommandError as exc:
-                self.warn('sync command "{}" failed, retrying: {}'.format(" ".join(cmd), exc), sentry=True)
-                return Result.Error(False)
-            return Result.Ok(True)
+                if result == FILE_ERROR:
+                    self.warn("Failed to hide secrets in '{}', retrying: {}".format(filepath, error), sentry=True)
+                    failed.append(job)
+
+            pending[:] = failed
+
+            return Result.Error(False) if failed else Result.Ok(True)
 
         try:
             gluetool.utils.wait(
-                "sync of '{}'".format(search_path),
-                _run_sync,
+                "hiding secrets under '{}'".format(search_path),
+                _run_scrub,
                 timeout=self.option('retry-timeout'),
                 tick=self.option('retry-tick')
             )
 
         except gluetool.GlueError:
-            self.warn('Failed to sync modified files to disk.', sentry=True)
+            raise gluetool.GlueError('Failed to hide secrets, secrets could be leaked!')
+
+        self.debug('Hidden secrets in {} files, {} files clean, {} unchanged, {} binary files skipped'.format(
+            counts.get(FILE_HIDDEN, 0), counts.get(FILE_CLEAN, 0), counts[FILE_UNCHANGED], counts.get(FILE_BINARY, 0)
+        ))
 
     def destroy(self, failure: Optional[Any] = None) -> None:
         self.hide_secrets()
@@ -8,10 +8,10 @@ import gluetool
 from gluetool.log import log_dict
 from gluetool.result import Ok, Error
 from gluetool_modules_framework.infrastructure.copr import CoprTask
-from gluetool_modules_framework.libs.artifacts import DEFAULT_DOWNLOAD_PATH, packages_download_cmd
+from gluetool_modules_framework.libs.artifacts import DEFAULT_DOWNLOAD_PATH, cached_urls, packages_download_cmd
 from gluetool_modules_framework.libs.guest_setup import guest_setup_log_dirpath, GuestSetupOutput, GuestSetupStage, \
     SetupGuestReturnType
-from gluetool_modules_framework.libs.sut_installation import SUTInstallation
+from gluetool_modules_framework.libs.sut_installation import SUTInstallation, rpm_query_failed_items
 from gluetool_modules_framework.libs.guest import NetworkedGuest
 from gluetool_modules_framework.libs.repo import create_repo
 from gluetool_modules_framework.libs.test_schedule import TestScheduleEntry
@@ -42,6 +42,16 @@ class InstallCoprBuild(gluetool.Module):
             'help': 'Path of the directory where all the packages will be downloaded to (default: %(default)s).',
             'type': str,
             'default': DEFAULT_DOWNLOAD_PATH
+        },
+        'download-parallelism': {
+            'help': 'Number of processes downloading packages in parallel (default: %(default)s).',
+            'metavar': 'N',
+            'type': int,
+            'default': 1
+        },
+        'single-session': {
+            'help': 'If set, run installation commands on the guest in a single SSH session.',
+            'action': 'store_true'
         }
     }
 
@@ -107,7 +117,10 @@ class InstallCoprBuild(gluetool.Module):
         # TODO: `builds[0]` might be misleading - it is passing a single artifact to the `SUTInstallation` class even
         # though the object is used to process all artifacts. This shouldn't affect the functionality, the single passed
         # artifact is used only for logging purposes.
-        sut_installation = SUTInstallation(self, installation_log_dirpath, builds[0], logger=guest.logger)
+        sut_installation = SUTInstallation(
+            self, installation_log_dirpath, builds[0], logger=guest.logger,
+            single_session=self.option('single-session') or False
+        )
 
         # create artifacts directory
         sut_installation.add_step(
@@ -136,10 +149,27 @@ class InstallCoprBuild(gluetool.Module):
                 local=has_bootc
             )
 
+            build_urls = build.rpm_urls + build.srpm_urls
+
+            # let guests download artifacts from the worker-local cache, if available
+            # checksums come from the repository metadata, do not bother fetching them when there is no cache
+            if has_bootc:
+                cached_build_urls = build_urls
+
+            else:
+                cached_build_urls = cached_urls(
+                    self, guest, build_urls,
+                    checksums=build.checksums if self.has_shared('cache_urls') else None
+                )
+
+            cached = dict(zip(build_urls, cached_build_urls))
+
             # download all artifacts, including excluded
             sut_installation.add_step(
                 'Download rpms from copr',
-                packages_download_cmd(download_path, rpm_urls=(build.rpm_urls + build.srpm_urls)),
+                packages_download_cmd(
+                    download_path, rpm_urls=cached_build_urls, parallel=self.option('download-parallelism') or 1
+                ),
                 local=has_bootc
             )
 
@@ -164,6 +194,7 @@ class InstallCoprBuild(gluetool.Module):
                 ]
 
             if not has_bootc:
+                copr_build_rpm_urls = [cached[rpm_url] for rpm_url in copr_build_rpm_urls]
 
                 # reinstall command has to be called for each rpm separately, hence list of rpms is used
                 if copr_build_rpm_urls:
@@ -238,7 +269,10 @@ class InstallCoprBuild(gluetool.Module):
                 ]
 
             if rpm_names:
-                sut_installation.add_step('Verify packages installed', 'rpm -q {}', items=rpm_names)
+                sut_installation.add_step(
+                    'Verify packages installed', 'rpm -q {}', items=rpm_names,
+                    batch=True, batch_parser=rpm_query_failed_items
+                )
 
         sut_result = sut_installation.run(guest)
 
@@ -47,6 +47,10 @@ class InstallKojiBuildExecute(gluetool.Module):
             'help': 'Path of the directory where all the packages will be downloaded to (default: %(default)s).',
             'type': str,
             'default': DEFAULT_DOWNLOAD_PATH
+        },
+        'single-session': {
+            'help': 'If set, run installation commands on the guest in a single SSH session.',
+            'action': 'store_true'
         }
     }
 
@@ -106,7 +110,10 @@ class InstallKojiBuildExecute(gluetool.Module):
 
         request = cast(TestingFarmRequest, self.shared('testing_farm_request'))
 
-        sut_installation = SUTInstallation(self, installation_log_dirpath, request, logger=guest)
+        sut_installation = SUTInstallation(
+            self, installation_log_dirpath, request, logger=guest,
+            single_session=self.option('single-session') or False
+        )
 
         assert guest.environment is not None
 
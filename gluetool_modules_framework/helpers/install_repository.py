@@ -16,7 +16,8 @@ from gluetool.result import Ok, Error
 from gluetool.utils import Command
 from gluetool.glue import GlueCommandError, GlueError
 
-from gluetool_modules_framework.libs.artifacts import DEFAULT_DOWNLOAD_PATH, splitFilename, packages_download_cmd
+from gluetool_modules_framework.libs.artifacts import DEFAULT_DOWNLOAD_PATH, cached_urls, splitFilename, \
+    packages_download_cmd
 from gluetool_modules_framework.libs.guest_setup import guest_setup_log_dirpath, GuestSetupOutput, GuestSetupStage, \
     SetupGuestReturnType
 from gluetool_modules_framework.libs.sut_installation import SUTInstallation
@@ -58,6 +59,12 @@ class InstallRepository(gluetool.Module):
             'type': str,
             'default': DEFAULT_DOWNLOAD_PATH
         },
+        'download-parallelism': {
+            'help': 'Number of processes downloading packages in parallel (default: %(default)s).',
+            'metavar': 'N',
+            'type': int,
+            'default': 1
+        },
         'packages-amount-threshold': {
             'help': '''
                 Threshold for amount of packages to install. If the amount of packages in repository is higher than
@@ -186,6 +193,9 @@ class InstallRepository(gluetool.Module):
             packages += packages_to_install
 
         if not has_bootc:
+            # let guests download packages from the worker-local cache, if available
+            packages = cached_urls(self, guest, packages)
+
             # Create a temporary file with list of packages to install with NamedTemporaryFile and save its name
             download_packages_filename = ""
             with NamedTemporaryFile(mode='w+', delete=False) as tmp_file:
@@ -193,12 +203,14 @@ class InstallRepository(gluetool.Module):
                 tmp_file.write(' '.join(packages))
                 tmp_file.flush()
 
-            # Copy the package list to the guest
-            guest.copy_to(download_packages_filename, download_packages_filename)
-
             # First download all found .rpm files
             sut_installation.add_step(
-                'Download packages', packages_download_cmd(download_path, rpm_urls_file=download_packages_filename),
+                'Download packages',
+                packages_download_cmd(
+                    download_path,
+                    rpm_urls_file=download_packages_filename,
+                    parallel=self.option('download-parallelism') or 1
+                ),
                 ignore_exception=True
             )
 
@@ -228,8 +240,11 @@ class InstallRepository(gluetool.Module):
                 tmp_file.write(' '.join(packages))
                 tmp_file.flush()
 
-            # Copy the package list to the guest
-            guest.copy_to(install_packages_filename, install_packages_filename)
+            # Copy both package lists to the guest, at once - their local and remote paths are the same
+            guest.copy_many_to(
+                [download_packages_filename, install_packages_filename],
+                os.path.dirname(install_packages_filename)
+            )
 
             # note: the `SUTInstallation` library does the magic of using DNF where it is needed \o/
             # but we need to keep yum in the first place for it to work
@@ -19,13 +19,24 @@ from typing import Any, Dict, List, Optional  # noqa
 # Default tick in seconds between checks for OOM
 DEFAULT_OOM_CHECK_TICK = 5
 
+# Mount point of the cgroup v2 hierarchy
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# List of cgroups the current process belongs to
+PROC_CGROUP = '/proc/self/cgroup'
+
+# Memory accounting methods
+ACCOUNTING_CGROUP = 'cgroup'
+ACCOUNTING_PROCESS = 'process'
+
 
 class OutOfMemory(Module):
     """
     Handle out-of-memory events for the pipeline.
 
-    Checks memory consumption by counting the RSS memory of all processes if running in a container,
-    except toolbox container.
+    Checks memory consumption if running in a container, except toolbox container. By default, the memory
+    consumption of the container's cgroup v2 is used, i.e. ``memory.current`` without inactive file cache.
+    If cgroup v2 memory controller is not available, the RSS memory of all processes is counted instead.
 
     If the process is running outside of a container or in a toolbox container, the check
     is disabled, because there is no easy way to identify containers launched by ``tmt``.
@@ -60,6 +71,22 @@ class OutOfMemory(Module):
                         processes and shared memory.
                     """,
                     "action": "append"
+                },
+                "count-once-pss": {
+                    "help": """
+                        Count processes matching ``count-once`` by the sum of their PSS memory instead of their
+                        maximum RSS memory. PSS splits shared memory between the processes sharing it.
+                    """,
+                    "action": "store_true",
+                },
+                "memory-accounting": {
+                    "help": """
+                        How to measure memory consumption, ``cgroup`` reads the cgroup v2 memory controller and falls
+                        back to ``process`` if it is not available, ``process`` counts memory of all processes.
+                        (default: %(default)s)
+                    """,
+                    "choices": (ACCOUNTING_CGROUP, ACCOUNTING_PROCESS),
+                    "default": ACCOUNTING_CGROUP,
                 }
             },
         ),
@@ -136,6 +163,45 @@ class OutOfMemory(Module):
     def count_once(self) -> List[str]:
         return normalize_multistring_option(self.option('count-once'))
 
+    @cached_property
+    def count_once_pss(self) -> bool:
+        return normalize_bool_option(self.option('count-once-pss'))
+
+    @cached_property
+    def cgroup_path(self) -> Optional[str]:
+        """
+        Path to the cgroup v2 directory of the current process, or ``None`` if the cgroup v2 memory controller
+        is not available.
+        """
+
+        try:
+            with open(PROC_CGROUP, 'r') as f:
+                entries = [line.strip().split(':', 2) for line in f]
+
+        except OSError:
+            return None
+
+        for entry in entries:
+            # cgroup v2 entry has an empty hierarchy ID and no controllers, e.g. `0::/`
+            if len(entry) == 3 and entry[0] == '0' and entry[1] == '':
+                path = os.path.join(CGROUP_ROOT, entry[2].lstrip('/'))
+
+                if os.path.exists(os.path.join(path, 'memory.current')):
+                    return path
+
+        return None
+
+    @cached_property
+    def accounting(self) -> str:
+        if (self.option('memory-accounting') or ACCOUNTING_CGROUP) == ACCOUNTING_PROCESS:
+            return ACCOUNTING_PROCESS
+
+        if self.cgroup_path is None:
+            self.warn('cgroup v2 memory controller not available, counting memory of all processes')
+            return ACCOUNTING_PROCESS
+
+        return ACCOUNTING_CGROUP
+
     def terminate_pipeline(self) -> None:
         """
         Terminate the pipeline by terminating the current process.
@@ -158,9 +224,68 @@ class OutOfMemory(Module):
         # cancel the pipeline using the SIGUSR2 signal - pipeline killed
         psutil.Process().send_signal(signal.SIGUSR2)
 
+    def cgroup_memory(self) -> Optional[int]:
+        """
+        Get memory consumption of the cgroup, ``memory.current`` without inactive file cache which the kernel
+        reclaims before it runs out of memory.
+
+        :returns: consumed memory in bytes, or ``None`` if the cgroup files could not be read.
+        """
+
+        assert self.cgroup_path is not None
+
+        try:
+            with open(os.path.join(self.cgroup_path, 'memory.current'), 'r') as f:
+                current = int(f.read().strip())
+
+            with open(os.path.join(self.cgroup_path, 'memory.stat'), 'r') as f:
+                stat = dict(line.split() for line in f if line.strip())
+
+            return max(0, current - int(stat.get('inactive_file', 0)))
+
+        except (OSError, ValueError) as exc:
+            if self.verbose_logging:
+                self.debug('Failed to read cgroup memory consumption: {}'.format(exc))
+
+            return None
+
+    def pss_memory(self, pid: int) -> Optional[int]:
+        """
+        Get PSS memory of a process from its ``smaps_rollup``.
+
+        :returns: PSS memory in bytes, or ``None`` if it is not available.
+        """
+
+        try:
+            with open('/proc/{}/smaps_rollup'.format(pid), 'r') as f:
+                for line in f:
+                    if line.startswith('Pss:'):
+                        return int(line.split()[1]) * 1024
+
+        except (OSError, ValueError, IndexError):
+            pass
+
+        return None
+
+    def memory_usage(self) -> int:
+        """
+        Get memory consumption, using the configured accounting method.
+        """
+
+        if self.accounting == ACCOUNTING_CGROUP:
+            usage = self.cgroup_memory()
+
+            if usage is not None:
+                return usage
+
+        return self.total_rss_memory()
+
     def total_rss_memory(self) -> int:
         """
         Get sum of RSS memory of all available processes.
+
+        Processes matching ``count-once`` are counted by their maximum RSS memory, or, with ``count-once-pss``,
+        by the sum of their PSS memory.
         """
         total_rss = 0
 
@@ -168,6 +293,7 @@ class OutOfMemory(Module):
             cmd: 0
             for cmd in self.count_once
         }
+        pss_total = 0
 
         for proc in psutil.process_iter():
             try:
@@ -178,7 +304,13 @@ class OutOfMemory(Module):
                 # used to mitigate counting multiple processes with shared memory
                 for cmd in self.count_once:
                     if cmd in cmdline:
-                        rss_max[cmd] = max(rss_max[cmd], rss)
+                        pss = self.pss_memory(proc.pid) if self.count_once_pss else None
+
+                        if pss is None:
+                            rss_max[cmd] = max(rss_max[cmd], rss)
+                        else:
+                            pss_total += pss
+
                         break
                 else:
                     total_rss += rss
@@ -190,7 +322,7 @@ class OutOfMemory(Module):
                 continue
 
         # add processes counted only once
-        total_rss += sum(rss for rss in six.itervalues(rss_max))
+        total_rss += sum(rss for rss in six.itervalues(rss_max)) + pss_total
 
         return total_rss
 
@@ -202,7 +334,7 @@ class OutOfMemory(Module):
         reservation = self.option('reservation')
         limit = self.option('limit')
 
-        memory_consumed = self.total_rss_memory() / 1024**2
+        memory_consumed = self.memory_usage() / 1024**2
 
         if self.verbose_logging:
             log_dict(self.debug, 'out-of-memory check', {
@@ -247,6 +379,8 @@ class OutOfMemory(Module):
             )
             return
 
+        self.debug('Measuring memory consumption using {} accounting'.format(self.accounting))
+
         log_dict(
             self.info,
             'Starting out-of-memory monitoring, check every {} seconds'.format(self.option('tick')),
@@ -257,7 +391,7 @@ class OutOfMemory(Module):
         )
 
         if normalize_bool_option(self.option("print-usage-only")):
-            self.info("Detected memory usage: {:.2f} MiB".format(self.total_rss_memory() / 1024**2))
+            self.info("Detected memory usage: {:.2f} MiB".format(self.memory_usage() / 1024**2))
             return
 
         self._oom_timer = RepeatTimer(
@@ -20,6 +20,7 @@ import gluetool
 from gluetool.log import log_dict
 from gluetool.utils import render_template, normalize_bool_option
 import gluetool_modules_framework.libs
+from gluetool_modules_framework.helpers.rules_engine import precompile_rules
 
 from typing import Any, List, Optional, Dict, Tuple, Union, cast  # noqa
 
@@ -321,42 +322,42 @@ class PipelineStateReporter(gluetool.Module):
         if not self.option('artifact-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('artifact-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('artifact-map'), logger=self.logger))
 
     @gluetool.utils.cached_property
     def error_reason_map(self) -> Any:
         if not self.option('error-reason-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('error-reason-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('error-reason-map'), logger=self.logger))
 
     @gluetool.utils.cached_property
     def test_docs_map(self) -> Any:
         if not self.option('test-docs-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('test-docs-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('test-docs-map'), logger=self.logger))
 
     @gluetool.utils.cached_property
     def run_map(self) -> Any:
         if not self.option('run-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('run-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('run-map'), logger=self.logger))
 
     @gluetool.utils.cached_property
     def final_overall_result_map(self) -> Any:
         if not self.option('final-overall-result-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('final-overall-result-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('final-overall-result-map'), logger=self.logger))
 
     @gluetool.utils.cached_property
     def final_state_map(self) -> Any:
         if not self.option('final-state-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('final-state-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('final-state-map'), logger=self.logger))
 
     def _subject_info(self, subject_name: str, instructions: str) -> Dict[str, Any]:
         self.require_shared('evaluate_instructions', 'evaluate_rules')
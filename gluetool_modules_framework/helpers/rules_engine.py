@@ -1,10 +1,12 @@
 # Copyright Contributors to the Testing Farm project.
 # SPDX-License-Identifier: Apache-2.0
 
+import collections
 import functools
 import importlib.util
 import re
 import sys
+import threading
 import ast
 import six
 
@@ -24,6 +26,10 @@ ContextGetterType = Callable[[], ContextType]  # noqa
 CommandCallbackType = Callable[[EntryType, str, Any, ContextType], bool]  # noqa
 
 
+#: Default number of compiled rules kept in the process-wide cache.
+DEFAULT_COMPILED_RULES_CACHE_SIZE = 1024
+
+
 # The module makes context available to rules via `EVAL_CONTEXT()` call. Level the playground
 # by making it available to templates as well.
 @jinja2.pass_context
@@ -168,6 +174,257 @@ class MatchableString(str):
         return re.search(pattern, str(self), re.I if I is True else 0)
 
 
+class CompiledRulesCache(object):
+    """
+    Process-wide LRU cache mapping rule text to its compiled code object.
+
+    Compilation of a rule - parsing, AST checks and ``compile`` - is far more expensive than its evaluation,
+    and instruction maps tend to evaluate the same rules over and over again. Only successfully compiled
+    rules are cached, errors are raised again on every attempt.
+
+    :param int maxsize: maximal number of compiled rules to keep.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_COMPILED_RULES_CACHE_SIZE) -> None:
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._cache: 'collections.OrderedDict[str, Any]' = collections.OrderedDict()
+
+        # guards access to the cache - rules are evaluated from multiple threads
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+
+        return len(self._cache)
+
+    def get(self, rules: 'Rules') -> Any:
+        """
+        Return compiled code of given rules, compiling them when not found in the cache.
+
+        :param Rules rules: rules to compile.
+        :returns: code object ready for ``eval``.
+        """
+
+        key = rules._rules
+
+        # Rules are expected to be strings, but we may be given anything - let the compilation deal with it.
+        if not isinstance(key, str):
+            return rules._compile()
+
+        with self._lock:
+            code = self._cache.get(key)
+
+            if code is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+
+                return code
+
+            self.misses += 1
+
+        code = rules._compile()
+
+        with self._lock:
+            self._cache[key] = code
+
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        return code
+
+    def resize(self, maxsize: int) -> None:
+        """
+        Change the maximal size of the cache, dropping the least recently used entries if needed.
+        """
+
+        with self._lock:
+            self.maxsize = maxsize
+
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop all cached rules and reset counters.
+        """
+
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+
+        return {
+            'size': len(self._cache),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+#: Compiled rules shared by all :py:class:`Rules` instances.
+COMPILED_RULES_CACHE = CompiledRulesCache()
+
+
+def precompile_rules(entries: Any) -> Any:
+    """
+    Compile ``rule`` keys of all given entries, populating the compiled rules cache.
+
+    Meant to be used right after loading a file with instructions, to pay the price of compilation
+    once. Rules that cannot be compiled are left alone, the error will be reported when such a rule
+    gets evaluated.
+
+    :param list(dict) entries: entries, possibly carrying ``rule`` key.
+    :returns: the very same ``entries``, to simplify use in loaders.
+    """
+
+    if not isinstance(entries, list):
+        return entries
+
+    for entry in entries:
+        if not isinstance(entry, dict) or 'rule' not in entry:
+            continue
+
+        try:
+            COMPILED_RULES_CACHE.get(Rules(entry['rule']))
+
+        except RulesError:
+            pass
+
+    return entries
+
+
+#: Patterns without any special characters, matching strings literally.
+_LITERAL_PATTERN = re.compile(r'^[a-zA-Z0-9_\-]*$')
+
+
+@functools.lru_cache(maxsize=DEFAULT_COMPILED_RULES_CACHE_SIZE)
+def _simple_rule(rules: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Find out whether the rule is a simple one, whose outcome can be decided by a plain lookup in the eval context
+    instead of evaluating the rule. Simple rules are:
+
+        * ``NAME == 'literal'`` (and ``'literal' == NAME``);
+        * ``NAME.match('literal')`` where ``literal`` has no regular expression special characters.
+
+    :param str rules: rule to inspect.
+    :returns: ``None`` for rules that are not simple, or a tuple of three items - operator (``==`` or ``match``),
+        variable name and the literal.
+    """
+
+    try:
+        node = ast.parse(rules, mode='eval').body
+
+    except (SyntaxError, TypeError, ValueError):
+        return None
+
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], ast.Eq):
+        left, right = node.left, node.comparators[0]
+
+        if isinstance(right, ast.Name):
+            left, right = right, left
+
+        if isinstance(left, ast.Name) and isinstance(right, ast.Constant) and isinstance(right.value, str):
+            return '==', left.id, right.value
+
+        return None
+
+    if isinstance(node, ast.Call) \
+            and isinstance(node.func, ast.Attribute) \
+            and node.func.attr == 'match' \
+            and isinstance(node.func.value, ast.Name) \
+            and len(node.args) == 1 \
+            and not node.keywords \
+            and isinstance(node.args[0], ast.Constant) \
+            and isinstance(node.args[0].value, str) \
+            and _LITERAL_PATTERN.match(node.args[0].value):
+        return 'match', node.func.value.id, node.args[0].value
+
+    return None
+
+
+class PreparedContext(Dict[str, Any]):
+    """
+    Eval context prepared for evaluation of rules.
+
+    Preparing a context for rules means wrapping its strings with :py:class:`MatchableString` and adding
+    helper functions like ``EXISTS``. Instead of doing that for every evaluated rule, the context can be
+    prepared once and reused for any number of rules as long as the original context does not change.
+    Strings are wrapped lazily, only when a rule actually uses them.
+
+    :param dict context: mapping of names and objects that should be available to rules.
+    """
+
+    def __init__(self, context: ContextType) -> None:
+
+        super(PreparedContext, self).__init__(context)
+
+        #: The original context, as given by the caller.
+        self.context = context
+
+        # `EVAL_CONTEXT` cannot be the prepared context itself - that would be a circular reference.
+        # it must be called first to return the context itself.
+        self.update({
+            'EVAL_CONTEXT': lambda: AttrDict({key: self[key] for key in self}),
+            'ALL': all,
+            'ANY': any,
+            'EXISTS': lambda name: name in self
+        })
+
+    def __getitem__(self, key: str) -> Any:
+
+        value = super(PreparedContext, self).__getitem__(key)
+
+        if isinstance(value, str) and not isinstance(value, MatchableString):
+            value = MatchableString(value)
+
+            self[key] = value
+
+        return value
+
+    def decide_simple_rule(self, rules: str) -> Optional[bool]:
+        """
+        Decide the outcome of a simple rule - see :py:func:`_simple_rule` - without evaluating it.
+
+        :param str rules: rule to decide.
+        :returns: ``True`` or ``False`` when the rule is simple and its outcome is known, ``None`` when the rule
+            must be evaluated.
+        """
+
+        if not isinstance(rules, str):
+            return None
+
+        simple_rule = _simple_rule(rules)
+
+        if simple_rule is None:
+            return None
+
+        operator, name, literal = simple_rule
+
+        if name not in self:
+            return None
+
+        value = super(PreparedContext, self).__getitem__(name)
+
+        # Anything but plain strings may have its own idea of comparison or matching.
+        if not isinstance(value, str):
+            return None
+
+        if operator == '==':
+            return value == literal
+
+        # Case-insensitive matching of non-ASCII strings does not match simple lowercasing.
+        if not value.isascii():
+            return None
+
+        return value.lower().startswith(literal.lower())
+
+
 class Rules(object):
     """
     Wrap compilation and evaluation of filtering rules.
@@ -217,7 +474,7 @@ class Rules(object):
         """
 
         if self._code is None:
-            self._code = self._compile()
+            self._code = COMPILED_RULES_CACHE.get(self)
 
         # eval is dangerous. This time I hope it's safe-guarded by AST filtering...
         try:
@@ -336,6 +593,12 @@ class RulesEngine(gluetool.Module):
             'action': 'append',
             'default': [],
             'metavar': 'FILE'
+        },
+        'compiled-rules-cache-size': {
+            'help': 'Number of compiled rules kept in the cache (default: %(default)s).',
+            'metavar': 'COUNT',
+            'type': int,
+            'default': DEFAULT_COMPILED_RULES_CACHE_SIZE
         }
     }
 
@@ -343,6 +606,10 @@ class RulesEngine(gluetool.Module):
 
     supported_dryrun_level = gluetool.glue.DryRunLevels.DRY
 
+    def sanity(self) -> None:
+
+        COMPILED_RULES_CACHE.resize(self.option('compiled-rules-cache-size'))
+
     @gluetool.utils.cached_property
     def _user_variable_files(self) -> List[str]:
 
@@ -370,7 +637,8 @@ class RulesEngine(gluetool.Module):
                 entries: List[EntryType],
                 context: Optional[Union[ContextType, ContextGetterType]] = None,
                 default_rule: str = 'True',
-                stop_at_first_hit: bool = False
+                stop_at_first_hit: bool = False,
+                batch: bool = False
                ) -> Iterator[Tuple[EntryType, ContextType]]:  # noqa
         """
         Yields entries that are allowed by their rules.
@@ -385,6 +653,7 @@ class RulesEngine(gluetool.Module):
         :param str default_rule: If there's no rule in the instruction, this will be used. For example, use ``"False"``
             to skip instructions without rules.
         :param bool stop_at_first_hit: If set, first entry whose rule evaluated true-ishly is returned immediately.
+        :param bool batch: If set, entries are evaluated in a batch - see :py:meth:`_filter_batch`.
         :rtype: Iterator[tuple(dict, dict)]
         :returns: yields tuples of two items: the entry and the context used in its evaluation.
         """
@@ -393,6 +662,10 @@ class RulesEngine(gluetool.Module):
         if context is None:
             context = self.shared('eval_context')
 
+        if batch:
+            yield from self._filter_batch(entries, context, default_rule, stop_at_first_hit)
+            return
+
         # For the sake of simplicity, the loop over instructions will always call context_getter. It's either
         # callable given by caller, or a simple anonymous function returning a dictionary - either the one
         # given by caller or the default from above.
@@ -402,14 +675,20 @@ class RulesEngine(gluetool.Module):
         else:
             context_getter = cast(ContextGetterType, lambda: context)
 
+        # Prepared context is reused as long as the getter keeps returning the very same context.
+        prepared_context: Optional[PreparedContext] = None
+
         for entry in entries:
             loop_context = context_getter()
 
+            if prepared_context is None or prepared_context.context is not loop_context:
+                prepared_context = self.prepare_context(loop_context)
+
             log_dict(self.debug, 'entry', entry)
 
             # Not calling `self.evaluate_rules` directly - other modules may have overload this shared function,
             # let's use the correct implementation.
-            if not self.shared('evaluate_rules', entry.get('rule', default_rule), context=loop_context):
+            if not self.shared('evaluate_rules', entry.get('rule', default_rule), context=prepared_context):
                 self.debug('denied by rules')
                 continue
 
@@ -418,6 +697,69 @@ class RulesEngine(gluetool.Module):
             if stop_at_first_hit:
                 break
 
+    def _filter_batch(self,
+                      entries: List[EntryType],
+                      context: Union[ContextType, ContextGetterType],
+                      default_rule: str,
+                      stop_at_first_hit: bool
+                     ) -> Iterator[Tuple[EntryType, ContextType]]:  # noqa
+        """
+        Yields entries that are allowed by their rules, evaluating them in a batch.
+
+        Unlike :py:meth:`_filter`, the context is acquired just once, even when a callable is given, and
+        all entries are evaluated with it. Each distinct rule is evaluated just once, and simple rules - see
+        :py:func:`_simple_rule` - are decided by a lookup in the context, without evaluating them at all.
+        Only the truthiness of rules' outcome matters.
+
+        See :py:meth:`_filter` for parameters and return value.
+        """
+
+        if callable(context):
+            context = context()
+
+        prepared_context = self.prepare_context(context)
+
+        outcomes: Dict[str, bool] = {}
+        evaluated, decided = 0, 0
+
+        for entry in entries:
+            rules = entry.get('rule', default_rule)
+
+            log_dict(self.debug, 'entry', entry)
+
+            # Rules are expected to be strings, anything else is not worth remembering.
+            if isinstance(rules, str) and rules in outcomes:
+                outcome = outcomes[rules]
+
+            else:
+                simple_outcome = prepared_context.decide_simple_rule(rules)
+
+                if simple_outcome is not None:
+                    outcome = simple_outcome
+                    decided += 1
+
+                else:
+                    # Not calling `self.evaluate_rules` directly - other modules may have overload this shared
+                    # function, let's use the correct implementation.
+                    outcome = bool(self.shared('evaluate_rules', rules, context=prepared_context))
+                    evaluated += 1
+
+                if isinstance(rules, str):
+                    outcomes[rules] = outcome
+
+            if not outcome:
+                self.debug('denied by rules')
+                continue
+
+            yield entry, context
+
+            if stop_at_first_hit:
+                break
+
+        self.debug('batch of {} entries: {} rules evaluated, {} rules decided by lookup'.format(
+            len(entries), evaluated, decided
+        ))
+
     @cached_property
     def functions(self) -> Dict[str, Callable[..., Any]]:
 
@@ -593,6 +935,24 @@ class RulesEngine(gluetool.Module):
 
         return self._render_user_variables(logger=logger, context=context)
 
+    def prepare_context(self, context: Optional[ContextType] = None) -> PreparedContext:
+        """
+        Prepare eval context for evaluation of rules. The prepared context can be passed to
+        :py:meth:`evaluate_rules` repeatedly, saving the preparation on every call.
+
+        :param dict context: mapping of names and object caller wants to be available to rules. If not set,
+            ``eval_context`` shared function is used to get one.
+        :rtype: PreparedContext
+        """
+
+        # If we don't have a context, get one from the core.
+        if context is None:
+            context = self.shared('eval_context')
+
+        assert context is not None  # to make mypy happy
+
+        return PreparedContext(context)
+
     def evaluate_rules(self, rules: str, context: Optional[ContextType] = None) -> Any:
         """
         Evaluate rules to a single value (usualy bool-ish - ``True``/``False``, (non-)empty string, etc.),
@@ -601,35 +961,19 @@ class RulesEngine(gluetool.Module):
         available to the rules.
 
         :param str rules: rules to evaluate.
-        :param dict context: mapping of names and object caller wants to be available to rules.
+        :param dict context: mapping of names and object caller wants to be available to rules. It may be
+            also a context returned by :py:meth:`prepare_context`, to save the preparation when evaluating
+            many rules with the same context.
         :returns: whatever comes out from rules evaluation.
         """
 
-        def _enhance_strings(variables: ContextType) -> ContextType:
-
-            return {
-                key: MatchableString(value) if isinstance(value, str) else value
-                for key, value in six.iteritems(variables)
-            }
-
-        # If we don't have a context, get one from the core.
-        if context is None:
-            context = self.shared('eval_context')
-
-        assert context is not None  # to make mypy happy
-        custom_locals = _enhance_strings(context)
-
-        # `EVAL_CONTEXT` cannot be `custom_locals` itself - that would be a circular reference.
-        # it must be called first to return the context itself.
-        custom_locals.update({
-            'EVAL_CONTEXT': lambda: AttrDict(custom_locals),
-            'ALL': all,
-            'ANY': any,
-            'EXISTS': lambda name: name in custom_locals
-        })
+        custom_locals = context if isinstance(context, PreparedContext) else self.prepare_context(context)
 
         self.debug('rules: {}'.format(rules))
-        log_dict(self.verbose, 'locals', custom_locals)
+
+        # Formatting the whole context is expensive, don't do it when nobody's going to read it.
+        if self.logger.isEnabledFor(gluetool.log.VERBOSE):
+            log_dict(self.verbose, 'locals', custom_locals)
 
         result = Rules(rules).eval({}, custom_locals)
 
@@ -642,7 +986,8 @@ class RulesEngine(gluetool.Module):
         entries: List[EntryType],
         context: Optional[Union[ContextType, ContextGetterType]] = None,
         default_rule: str = 'True',
-        stop_at_first_hit: bool = False
+        stop_at_first_hit: bool = False,
+        batch: bool = False
     ) -> List[EntryType]:
         """
         Find out what entries of the list are allowed by their rules, and return them.
@@ -664,12 +1009,14 @@ class RulesEngine(gluetool.Module):
         :param str default_rule: If there's no rule in the instruction, this will be used. For example, use ``False``
             to skip instructions without rules.
         :param bool stop_at_first_hit: If set, first entry whose rule evaluated true-ishly is returned immediately.
+        :param bool batch: If set, context is acquired just once and used for all entries, and each distinct rule
+            is evaluated just once. Use when rules do not depend on each other's side effects.
         :rtype: list(dict)
         :returns: List of entries that passed through the filter.
         """
 
         instruction_iterator = self._filter(
-            entries, context=context, default_rule=default_rule, stop_at_first_hit=stop_at_first_hit
+            entries, context=context, default_rule=default_rule, stop_at_first_hit=stop_at_first_hit, batch=batch
         )
 
         return [
@@ -682,7 +1029,8 @@ class RulesEngine(gluetool.Module):
                               context: Optional[Union[ContextType, ContextGetterType]] = None,
                               default_rule: str = 'True',
                               stop_at_first_hit: bool = False,
-                              ignore_unhandled_commands: bool = False
+                              ignore_unhandled_commands: bool = False,
+                              batch: bool = False
                              ) -> None:  # noqa
         """
         Evaluate "instructions", using given callbacks to perform commands ordered by instructions.
@@ -731,13 +1079,15 @@ class RulesEngine(gluetool.Module):
             to skip remaining commands and start with the next instruction.
         :param bool ignore_unhandled_commands: If set, commands without any callbacks will be ignored. otherwise,
             an exception will be raised.
+        :param bool batch: If set, context is acquired just once and used for all instructions, and each distinct
+            rule is evaluated just once. Use when commands do not change the context rules depend on.
         """
 
         # Oops, `stop_at_first_hit` means something different to this method than to `_filter` :/
         # `_filter`'s `stop_at_first_hit` cannot be expressed by parameters of this method,
         # therefore defaulting to `False`, letting `_filter` process all instructions.
         instruction_iterator = self._filter(
-            instructions, context=context, default_rule=default_rule, stop_at_first_hit=False
+            instructions, context=context, default_rule=default_rule, stop_at_first_hit=False, batch=batch
         )
 
         for instruction, instruction_context in instruction_iterator:
@@ -768,3 +1118,7 @@ class RulesEngine(gluetool.Module):
             return
 
         self.info('rules evaluate to: {}'.format(self.evaluate_rules(self.option('rules'))))
+
+    def destroy(self, failure: Optional[gluetool.Failure] = None) -> None:
+
+        log_dict(self.debug, 'compiled rules cache', COMPILED_RULES_CACHE.stats)
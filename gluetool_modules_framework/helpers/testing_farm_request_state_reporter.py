@@ -7,6 +7,7 @@ import gluetool
 from typing import Any, Optional, cast  # noqa
 from gluetool import Failure
 from gluetool.log import log_dict
+from gluetool_modules_framework.helpers.rules_engine import precompile_rules
 
 STATE_QUEUED = 'queued'
 STATE_RUNNING = 'running'
@@ -39,21 +40,21 @@ class TestingFarmRequestStateReporter(gluetool.Module):
         if not self.option('state-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('state-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('state-map'), logger=self.logger))
 
     @gluetool.utils.cached_property
     def overall_result_map(self) -> Any:
         if not self.option('overall-result-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('overall-result-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('overall-result-map'), logger=self.logger))
 
     @gluetool.utils.cached_property
     def summary_map(self) -> Any:
         if not self.option('summary-map'):
             return []
 
-        return gluetool.utils.load_yaml(self.option('summary-map'), logger=self.logger)
+        return precompile_rules(gluetool.utils.load_yaml(self.option('summary-map'), logger=self.logger))
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super(TestingFarmRequestStateReporter, self).__init__(*args, **kwargs)
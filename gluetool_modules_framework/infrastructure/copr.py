@@ -2,10 +2,15 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import collections
+import gzip
+import io
+import os
 import re
 import requests
 import six
 
+from xml.etree import ElementTree
+
 import gluetool
 from gluetool.utils import cached_property, dict_update, render_template
 from gluetool.log import log_dict, log_blob
@@ -18,6 +23,15 @@ from typing import Tuple, cast, Any, Dict, List, Optional, Union  # noqa
 #: :ivar list(str) arches: List of architectures.
 TaskArches = collections.namedtuple('TaskArches', ['arches'])
 
+#: XML namespaces used by repository metadata.
+REPODATA_NAMESPACES = {
+    'repo': 'http://linux.duke.edu/metadata/repo',
+    'common': 'http://linux.duke.edu/metadata/common'
+}
+
+#: Primary repository metadata larger than this (compressed, in bytes) are not downloaded to find checksums.
+MAX_PRIMARY_SIZE = 32 * 1024 * 1024
+
 
 class CoprApi(object):
 
@@ -128,6 +142,68 @@ class CoprApi(object):
         result_url = self._result_url(build_id, chroot_name)
         return ['{}{}.rpm'.format(result_url, file_name) for file_name in file_names]
 
+    def get_checksums(self, build_id: int, chroot_name: str) -> Dict[str, str]:
+        """
+        Find SHA256 checksums of build artifacts in the metadata of the chroot repository.
+
+        :returns: mapping between artifact URLs and their checksums. Empty when the metadata are not available.
+        """
+
+        result_url = self._result_url(build_id, chroot_name)
+
+        if result_url == 'UNKNOWN-COPR-RESULT-DIR-URL':
+            return {}
+
+        repo_url, build_dirname = result_url.rstrip('/').rsplit('/', 1)
+
+        try:
+            repomd = ElementTree.fromstring(self._api_request(
+                '{}/repodata/repomd.xml'.format(repo_url), 'repository metadata', full_url=True
+            ).content)
+
+            primary = repomd.find("repo:data[@type='primary']", REPODATA_NAMESPACES)
+            location = primary.find('repo:location', REPODATA_NAMESPACES) if primary is not None else None
+            size = primary.find('repo:size', REPODATA_NAMESPACES) if primary is not None else None
+
+            if location is None or not location.get('href', '').endswith('.gz'):
+                self.module.debug('[copr API] compressed primary metadata not found')
+                return {}
+
+            if size is not None and int(size.text or 0) > MAX_PRIMARY_SIZE:
+                self.module.debug('[copr API] primary metadata too large, {} bytes'.format(size.text))
+                return {}
+
+            content = self._api_request(
+                '{}/{}'.format(repo_url, location.get('href')), 'primary metadata', full_url=True
+            ).content
+
+            checksums: Dict[str, str] = {}
+
+            with gzip.GzipFile(fileobj=io.BytesIO(content)) as primary_file:
+                for _, element in ElementTree.iterparse(primary_file):
+                    if element.tag != '{{{}}}package'.format(REPODATA_NAMESPACES['common']):
+                        continue
+
+                    checksum = element.find('common:checksum', REPODATA_NAMESPACES)
+                    package_location = element.find('common:location', REPODATA_NAMESPACES)
+
+                    if checksum is not None and checksum.get('type') == 'sha256' and checksum.text \
+                            and package_location is not None:
+                        href = package_location.get('href', '')
+
+                        if os.path.dirname(href) == build_dirname:
+                            checksums['{}/{}'.format(repo_url, href)] = checksum.text
+
+                    element.clear()
+
+        except (gluetool.GlueError, ElementTree.ParseError, EOFError, OSError, ValueError) as exc:
+            self.module.warn('Unable to find checksums in repository metadata: {}'.format(exc))
+            return {}
+
+        log_dict(self.module.debug, '[copr API] checksums', checksums)
+
+        return checksums
+
     def get_repo_url(self, owner: str, project: str, chroot: str) -> str:
         # strip architecture - string following last dash
 
@@ -232,6 +308,10 @@ class CoprTask(object):
             self.srpm_names
         )
 
+    @cached_property
+    def checksums(self) -> Dict[str, str]:
+        return self.copr_api.get_checksums(self.task_id.build_id, self.task_id.chroot_name)
+
     @cached_property
     def task_arches(self) -> TaskArches:
         """
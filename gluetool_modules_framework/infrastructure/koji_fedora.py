@@ -2,7 +2,13 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import collections
+import functools
+import hashlib
+import json
+import os
 import re
+import tempfile
+import time
 import six
 
 import koji
@@ -24,9 +30,19 @@ from gluetool.utils import cached_property, dict_update, wait, normalize_multist
 from gluetool.utils import IncompatibleOptionsError
 
 from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Union, Tuple, Callable, Type, cast, overload  # noqa
+from typing import Iterable  # noqa
 from typing_extensions import TypedDict, Literal, NotRequired
 from gluetool_modules_framework.helpers.rules_engine import ContextType
 
+# lxml is much faster than the builtin HTML parser, use it when available
+try:
+    import lxml  # type: ignore # noqa: F401
+
+    HTML_PARSER = 'lxml'
+
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
 InitDetailsType = TypedDict(
     'InitDetailsType',
     {
@@ -49,6 +65,39 @@ DEFAULT_API_VERSION_RETRY_TIMEOUT = 300
 DEFAULT_API_VERSION_RETRY_TICK = 30
 DEFAULT_TAG_HISTORY_RETRY_TIMEOUT = 300
 DEFAULT_TAG_HISTORY_RETRY_TICK = 30
+DEFAULT_MULTICALL_BATCH_SIZE = 50
+DEFAULT_API_CACHE_TTL = 300
+
+
+#: Koji API methods whose responses never change once they describe a finished object. Each method is
+#: accompanied by a predicate deciding whether a particular response describes such a finished object.
+#:
+#: Note that children of a task are final only when the parent task is closed - callers must not use the cache
+#: for ``getTaskChildren`` of a task that is still running.
+IMMUTABLE_API_METHODS: Dict[str, Callable[[Any], bool]] = {
+    'getTaskInfo': lambda response: bool(response) and response.get('state') == koji.TASK_STATES['CLOSED'],
+    'getTaskChildren': lambda response: bool(response) and all(
+        child.get('state') == koji.TASK_STATES['CLOSED'] for child in response
+    ),
+    'getTaskResult': lambda response: response is not None,
+    'getBuild': lambda response: bool(response) and response.get('state') == koji.BUILD_STATES['COMPLETE'],
+    'listBuildRPMs': lambda response: bool(response),
+    'listArchives': lambda response: bool(response)
+}
+
+#: Koji API methods whose responses may change over time, e.g. when a new build gets tagged. Their responses
+#: are cached for a limited time only, and only when the predicate accepts them - an empty response usually
+#: means the object does not exist *yet*, and callers may be waiting for it to appear.
+#:
+#: Methods polled by callers, like ``queryHistory``, are deliberately missing.
+MUTABLE_API_METHODS: Dict[str, Callable[[Any], bool]] = {
+    'getBuildTarget': bool,
+    'getFullInheritance': bool,
+    'getUser': bool,
+    'listBuilds': bool,
+    'listTagged': bool,
+    'listTaskOutput': bool
+}
 
 
 class NotBuildTaskError(SoftGlueError):
@@ -112,6 +161,10 @@ ImageRepository = NamedTuple(
 )
 
 
+#: Positional and keyword arguments of a single API call.
+ApiCallArgsType = Tuple[Tuple[Any, ...], Dict[str, Any]]
+
+
 #: Represents data we need to initialize a Koji task. A task ID would be enough, but, for some tasks,
 #: we may need to override some data we'd otherwise get from Koji API.
 #:
@@ -183,6 +236,33 @@ def flatten_dict(dictionary: Mapping[Any, Any], parent_key: str = '', separator:
     return dict(items)
 
 
+def _extract_commit_details(parsed_html: BeautifulSoup) -> Dict[str, Any]:
+    """
+    Extract details of a commit from cgit commit web page. Only the details are kept, to make them small
+    enough for caching.
+
+    :param BeautifulSoup parsed_html: parsed commit web page.
+    :returns: mapping with ``branches`` and ``issuer`` keys.
+    """
+
+    try:
+        # `string` is `None` when the element has more than one child, there is no branch name to read then
+        branches = [
+            six.ensure_str(branch.string)
+            for branch in parsed_html.find_all(class_='branch-deco')
+            if branch.string is not None
+        ]
+    except (AttributeError, TypeError):
+        raise GlueError("could not find 'branch-deco' class in html output of cgit, please inspect")
+
+    commit_info = parsed_html.find(class_='commit-info')
+
+    return {
+        'branches': branches,
+        'issuer': re.sub(".*lt;(.*)@.*", "\\1", str(commit_info.find('td'))) if commit_info is not None else None
+    }
+
+
 def _call_api(session: Any, logger: ContextAdapter, method: str, *args: Any, **kwargs: Any) -> Any:
     with Action('query Koji API', parent=Action.current_action(), logger=logger, tags={
         'method': method,
@@ -194,6 +274,332 @@ def _call_api(session: Any, logger: ContextAdapter, method: str, *args: Any, **k
         return method_callable(*args, **kwargs)
 
 
+def _call_api_multi(
+    session: Any,
+    logger: ContextAdapter,
+    method: str,
+    calls: List[ApiCallArgsType],
+    batch_size: int,
+    return_exceptions: bool = False
+) -> Tuple[List[Any], int]:
+    """
+    Call the same API method with different arguments, packing the calls into as few requests as possible
+    with Koji's multicall. When the session does not support multicall, or batching is disabled, calls are
+    issued one by one.
+
+    :param session: Koji session.
+    :param logger: logger to use.
+    :param str method: API method to call.
+    :param list calls: positional and keyword arguments of each call.
+    :param int batch_size: maximal number of calls packed into a single request. Use ``0`` to disable batching.
+    :param bool return_exceptions: if set, exceptions raised by calls are returned as their results instead
+        of being raised.
+    :returns: tuple of two items, results of calls - in the same order as ``calls`` - and the number of requests
+        sent to the server.
+    """
+
+    def _result(call: Callable[[], Any]) -> Any:
+        if not return_exceptions:
+            return call()
+
+        try:
+            return call()
+
+        except Exception as exc:
+            return exc
+
+    multicall = getattr(session, 'multicall', None)
+
+    if batch_size < 2 or len(calls) < 2 or not callable(multicall):
+        return [
+            _result(functools.partial(_call_api, session, logger, method, *args, **kwargs))
+            for args, kwargs in calls
+        ], len(calls)
+
+    with Action('query Koji API', parent=Action.current_action(), logger=logger, tags={
+        'method': method,
+        'multicall': len(calls),
+        'batch-size': batch_size
+    }):
+        with multicall(strict=False, batch=batch_size) as multicall_session:
+            virtual_calls = [
+                getattr(multicall_session, method)(*args, **kwargs) for args, kwargs in calls
+            ]
+
+    # Faults are raised when the result of a particular call is accessed.
+    return [
+        _result(lambda: virtual_call.result) for virtual_call in virtual_calls
+    ], -(-len(calls) // batch_size)
+
+
+class DiskApiCacheStore(object):
+    """
+    Stores cached API responses in a local directory, one JSON file per response.
+
+    :param str dirpath: directory to keep the files in.
+    """
+
+    def __init__(self, dirpath: str) -> None:
+
+        self.dirpath = dirpath
+
+        os.makedirs(self.dirpath, exist_ok=True)
+
+    def _filepath(self, key: str) -> str:
+
+        return os.path.join(self.dirpath, '{}.json'.format(key))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+
+        try:
+            with open(self._filepath(key), 'r') as f:
+                return cast(Dict[str, Any], json.load(f))
+
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set(self, key: str, record: Dict[str, Any], ttl: int) -> None:
+
+        # Write into a temporary file first, and rename it then - other pipelines may be reading the file
+        # at the same time.
+        with tempfile.NamedTemporaryFile('w', dir=self.dirpath, suffix='.tmp', delete=False) as f:
+            try:
+                json.dump(record, f)
+
+            except Exception:
+                f.close()
+                os.unlink(f.name)
+
+                raise
+
+        os.replace(f.name, self._filepath(key))
+
+
+class MemcachedApiCacheStore(object):
+    """
+    Stores cached API responses in Memcached, via the cache provided by ``memcached`` module.
+
+    :param cache: cache object, as returned by ``cache`` shared function.
+    """
+
+    def __init__(self, cache: Any) -> None:
+
+        self._cache = cache
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+
+        return cast(Optional[Dict[str, Any]], self._cache.get('koji-api/{}'.format(key)))
+
+    def set(self, key: str, record: Dict[str, Any], ttl: int) -> None:
+
+        self._cache.set('koji-api/{}'.format(key), record, expire=ttl)
+
+
+class KojiApiCache(LoggerMixin, object):
+    """
+    Cross-pipeline cache of Koji API responses.
+
+    Responses of methods listed in :py:data:`IMMUTABLE_API_METHODS` are cached for good, but only when they
+    describe a finished object, e.g. a closed task or a complete build. Non-empty responses of methods listed in
+    :py:data:`MUTABLE_API_METHODS` are cached for ``ttl`` seconds. Responses of other methods are never cached.
+
+    The cache also keeps details extracted from dist-git commit pages, see :py:meth:`get_commit_details`.
+
+    :param store: object storing the cached responses, :py:class:`DiskApiCacheStore` or
+        :py:class:`MemcachedApiCacheStore`.
+    :param str hub_url: URL of the Koji hub, to keep responses of different instances apart.
+    :param int ttl: how long should responses of mutable methods be cached. ``0`` disables their caching.
+    :param logger: logger to use.
+    """
+
+    def __init__(self, store: Any, hub_url: str, ttl: int, logger: ContextAdapter) -> None:
+
+        super(KojiApiCache, self).__init__(logger)
+
+        self._store = store
+        self._hub_url = hub_url
+        self._ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, method: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+
+        return hashlib.sha256(
+            json.dumps([self._hub_url, method, args, kwargs], sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    def is_cacheable(self, method: str) -> bool:
+
+        return method in IMMUTABLE_API_METHODS or (method in MUTABLE_API_METHODS and self._ttl > 0)
+
+    def get(self, method: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[bool, Any]:
+        """
+        Find cached response of the API call.
+
+        :returns: tuple of two items, whether the response was found and the response itself.
+        """
+
+        if not self.is_cacheable(method):
+            return False, None
+
+        try:
+            record = self._store.get(self._key(method, args, kwargs))
+
+        except Exception as exc:
+            self.warn('failed to read cached response of {}: {}'.format(method, exc))
+            record = None
+
+        if record is None or (record['expires'] is not None and record['expires'] < time.time()):
+            self.misses += 1
+
+            return False, None
+
+        self.hits += 1
+
+        return True, record['response']
+
+    def set(self, method: str, args: Tuple[Any, ...], kwargs: Dict[str, Any], response: Any) -> None:
+        """
+        Store response of the API call, if the method and the response are cacheable.
+        """
+
+        if method in IMMUTABLE_API_METHODS:
+            if not IMMUTABLE_API_METHODS[method](response):
+                return
+
+            ttl = 0
+
+        elif method in MUTABLE_API_METHODS and self._ttl > 0:
+            if not MUTABLE_API_METHODS[method](response):
+                return
+
+            ttl = self._ttl
+
+        else:
+            return
+
+        record = {
+            'expires': time.time() + ttl if ttl else None,
+            'response': response
+        }
+
+        try:
+            self._store.set(self._key(method, args, kwargs), record, ttl)
+
+        # Responses we cannot serialize, or a store failing for whatever reason - neither is fatal, we just
+        # won't have the response cached.
+        except Exception as exc:
+            self.warn('failed to cache response of {}: {}'.format(method, exc))
+
+    def get_commit_details(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Find cached details of a dist-git commit.
+
+        :param str url: URL of the commit web page.
+        :returns: details as stored by :py:meth:`set_commit_details`, or ``None`` if not cached.
+        """
+
+        try:
+            record = self._store.get(self._key('commit-details', (url,), {}))
+
+        except Exception as exc:
+            self.warn('failed to read cached details of commit {}: {}'.format(url, exc))
+            return None
+
+        if record is None:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+
+        return cast(Dict[str, Any], record['response'])
+
+    def set_commit_details(self, url: str, details: Dict[str, Any]) -> None:
+        """
+        Store details of a dist-git commit. Commits do not change, therefore the details never expire.
+
+        :param str url: URL of the commit web page.
+        :param dict details: details extracted from the commit web page.
+        """
+
+        try:
+            self._store.set(self._key('commit-details', (url,), {}), {'expires': None, 'response': details}, 0)
+
+        except Exception as exc:
+            self.warn('failed to cache details of commit {}: {}'.format(url, exc))
+
+    def call_api(
+        self,
+        session: Any,
+        logger: ContextAdapter,
+        method: str,
+        *args: Any,
+        use_cache: bool = True,
+        **kwargs: Any
+    ) -> Any:
+        """
+        Call API method, unless its response is already cached.
+
+        :param bool use_cache: if unset, the cache is neither searched nor updated.
+        """
+
+        if not use_cache:
+            return _call_api(session, logger, method, *args, **kwargs)
+
+        found, response = self.get(method, args, kwargs)
+
+        if found:
+            return response
+
+        response = _call_api(session, logger, method, *args, **kwargs)
+
+        self.set(method, args, kwargs, response)
+
+        return response
+
+    def call_api_multi(
+        self,
+        session: Any,
+        logger: ContextAdapter,
+        method: str,
+        calls: List[ApiCallArgsType],
+        batch_size: int,
+        return_exceptions: bool = False
+    ) -> Tuple[List[Any], int]:
+        """
+        Call the same API method with different arguments, sending only calls whose responses are not cached.
+
+        See :py:func:`_call_api_multi` for parameters and return value.
+        """
+
+        results: List[Any] = [None] * len(calls)
+        missing: List[int] = []
+
+        for index, (args, kwargs) in enumerate(calls):
+            found, response = self.get(method, args, kwargs)
+
+            if found:
+                results[index] = response
+
+            else:
+                missing.append(index)
+
+        responses, requests_count = _call_api_multi(
+            session, logger, method, [calls[index] for index in missing], batch_size,
+            return_exceptions=return_exceptions
+        )
+
+        for index, response in zip(missing, responses):
+            if not isinstance(response, Exception):
+                self.set(method, calls[index][0], calls[index][1], response)
+
+            results[index] = response
+
+        return results, requests_count
+
+
 class KojiTask(LoggerMixin, object):
     """
     Provides abstraction of a koji build task, specified by task ID. For initialization
@@ -261,8 +667,23 @@ class KojiTask(LoggerMixin, object):
     def _call_api(self, method: Literal['queryHistory'], *args: Any, **kwargs: Any) -> TagHistoryType:  # noqa F811
         pass
 
-    def _call_api(self, method: str, *args: Any, **kwargs: Any) -> Any:  # noqa F811
-        return _call_api(self.session, self.logger, method, *args, **kwargs)
+    def _call_api(self, method: str, *args: Any, use_cache: bool = True, **kwargs: Any) -> Any:  # noqa F811
+        if self._module._api_cache is None:
+            return _call_api(self.session, self.logger, method, *args, **kwargs)
+
+        return self._module._api_cache.call_api(
+            self.session, self.logger, method, *args, use_cache=use_cache, **kwargs
+        )
+
+    def _call_api_multi(
+        self,
+        method: str,
+        calls: List[ApiCallArgsType],
+        return_exceptions: bool = False
+    ) -> List[Any]:
+        return self._module._call_api_multi(
+            method, calls, session=self.session, logger=self.logger, return_exceptions=return_exceptions
+        )
 
     def _assign_build(self, build_id: Optional[int]) -> None:
 
@@ -393,7 +814,11 @@ class KojiTask(LoggerMixin, object):
         :rtype: list(dict)
         """
 
-        subtasks = cast(List[TaskInfoType], self._call_api('getTaskChildren', self.id, request=True))
+        # Running task may still spawn new children, its current children are not final.
+        subtasks = cast(List[TaskInfoType], self._call_api(
+            'getTaskChildren', self.id, request=True,
+            use_cache=self._task_info['state'] == koji.TASK_STATES['CLOSED']
+        ))
         log_dict(self.debug, 'subtasks', subtasks)
 
         return subtasks
@@ -629,14 +1054,22 @@ class KojiTask(LoggerMixin, object):
         :raises gluetool.glue.GlueError: In case previous tag search cannot be performed.
         """
 
+        if '<no build target available>' in tags:
+            raise GlueError('Cannot check for previous tag as build target does not exist')
+
         previous_tags = []
 
-        for tag in tags:
-            if tag == '<no build target available>':
-                raise GlueError('Cannot check for previous tag as build target does not exist')
+        # Inheritance of all tags is queried at once, errors are handled tag by tag.
+        inheritances = self._call_api_multi(
+            'getFullInheritance', [((tag,), {}) for tag in tags], return_exceptions=True
+        )
 
+        for tag, inheritance in zip(tags, inheritances):
             try:
-                previous_tags.append(self._call_api('getFullInheritance', tag)[0]['name'])
+                if isinstance(inheritance, Exception):
+                    raise inheritance
+
+                previous_tags.append(inheritance[0]['name'])
             except (KeyError, IndexError, koji.GenericError):
                 self.warn("Failed to find inheritance tree for tag '{}'".format(tag), sentry=True)
 
@@ -739,15 +1172,35 @@ class KojiTask(LoggerMixin, object):
             assert self.destination_tag is not None
             tags = [self.destination_tag, self.target]
 
-        for tag in tags:
+        calls: List[ApiCallArgsType] = [
+            ((tag, None, True), {'latest': 2, 'package': self.component}) for tag in tags
+        ]
+
+        # With multicalls, all tags are queried at once, and the first tag - in the given order - with some builds
+        # wins. Without them, tags are queried one by one, stopping at the first hit.
+        def _list_tagged(call: ApiCallArgsType) -> Any:
             try:
-                builds = self._call_api('listTagged', tag, None, True, latest=2, package=self.component)
+                return self._call_api('listTagged', *call[0], **call[1])
             except koji.GenericError as error:
+                return error
+
+        tagged_builds: Iterable[Any]
+
+        if self._module._multicall_enabled:
+            tagged_builds = self._call_api_multi('listTagged', calls, return_exceptions=True)
+
+        else:
+            tagged_builds = (_list_tagged(call) for call in calls)
+
+        for tag, builds in zip(tags, tagged_builds):
+            if isinstance(builds, koji.GenericError):
                 self.warn(
-                    "ignoring error while listing latest builds tagged to '{}': {}".format(tag, error),
+                    "ignoring error while listing latest builds tagged to '{}': {}".format(tag, builds),
                     sentry=True
                 )
                 continue
+            if isinstance(builds, Exception):
+                raise builds
             if builds:
                 break
         else:
@@ -922,11 +1375,11 @@ class KojiTask(LoggerMixin, object):
 
         artifacts = {}
 
-        for task in self._build_arch_subtasks:
-            task_id = task['id']
+        task_ids = [task['id'] for task in self._build_arch_subtasks]
 
-            task_output = self._call_api('listTaskOutput', task_id)
+        task_outputs = self._call_api_multi('listTaskOutput', [((task_id,), {}) for task_id in task_ids])
 
+        for task_id, task_output in zip(task_ids, task_outputs):
             log_dict(self.debug, 'task output of subtask {}'.format(task_id), task_output)
 
             artifacts[task_id] = task_output
@@ -1089,11 +1542,15 @@ class KojiTask(LoggerMixin, object):
         """
         rpms: List[Dict[str, Any]] = []
 
-        for task in self._build_arch_subtasks:
+        task_ids = [task['id'] for task in self._build_arch_subtasks]
+
+        task_results = self._call_api_multi('getTaskResult', [((task_id,), {}) for task_id in task_ids])
+
+        for task_id, task_result in zip(task_ids, task_results):
             try:
-                rpms.extend(self._call_api('getTaskResult', task['id'])['rpms'])
+                rpms.extend(task_result['rpms'])
             except AttributeError:
-                self.warn("No rpms found for task '{}'".format(task['id']))
+                self.warn("No rpms found for task '{}'".format(task_id))
 
         return ['/'.join([self.pkgs_url, 'work', str(rpm)]) for rpm in rpms]
 
@@ -1502,9 +1959,13 @@ class BrewTask(KojiTask):
         return component, git_hash
 
     @cached_property
-    def _parsed_commit_html(self) -> Optional[Result[Union[BeautifulSoup, bool], str]]:
+    def _commit_details(self) -> Optional[Dict[str, Any]]:
         """
-        :returns: BeatifulSoup4 parsed html from cgit for given component and commit hash
+        Details of the commit the task was built from, extracted from cgit commit web page. Because the same
+        commit is often inspected by many pipelines, the details are cached when the Koji API cache is enabled.
+
+        :returns: mapping with ``branches`` (list of branch names) and ``issuer`` (committer's user name, or
+            ``None`` when the page has no commit info), or ``None`` if the commit page was not found.
         """
 
         component, git_hash = self.source_members
@@ -1539,8 +2000,18 @@ class BrewTask(KojiTask):
         # The dt=2 parameter removes diffs from the commit url, making it lighter
         overall_urls = [url + '&dt=2' for url in overall_urls]
 
+        api_cache = self._module._api_cache
+
         # get git commit html
         for url in overall_urls:
+            if api_cache:
+                details = api_cache.get_commit_details(url)
+
+                if details is not None:
+                    log_dict(self.debug, "cached details of commit '{}'".format(url), details)
+
+                    return details
+
             # Using `wait` for retries would be much easier if we wouldn't be interested
             # in checking another URL - that splits errors into two sets, with different
             # solutions: the first one are "accepted" errors (e.g. URL is wrong), and we
@@ -1556,7 +2027,7 @@ class BrewTask(KojiTask):
                         res = req.get(url, timeout=self._module.option('commit-fetch-timeout'))
 
                     if res.ok:
-                        return Result.Ok(BeautifulSoup(res.content, 'html.parser'))
+                        return Result.Ok(BeautifulSoup(res.content, HTML_PARSER))
 
                     # Special case - no such URL, we should stop dealing with this one and try another.
                     # Tell `wait` control code to quit.
@@ -1596,7 +2067,12 @@ class BrewTask(KojiTask):
             if ret is True:
                 continue
 
-            return cast(Result[Union[BeautifulSoup, bool], str], ret)
+            details = _extract_commit_details(cast(BeautifulSoup, ret))
+
+            if api_cache:
+                api_cache.set_commit_details(url, details)
+
+            return details
 
         return None
 
@@ -1728,14 +2204,10 @@ class BrewTask(KojiTask):
             if git_branch:
                 return git_branch
 
-        if self._parsed_commit_html is None:
+        if self._commit_details is None:
             return None
 
-        try:
-            branches = [branch.string for branch in self._parsed_commit_html.find_all(class_='branch-deco')]  # type: ignore  # noqa
-            return six.ensure_str(' '.join(branches))
-        except AttributeError:
-            raise GlueError("could not find 'branch-deco' class in html output of cgit, please inspect")
+        return six.ensure_str(' '.join(self._commit_details['branches']))
 
     @cached_property
     def issuer(self) -> str:
@@ -1752,19 +2224,15 @@ class BrewTask(KojiTask):
 
         self.info("Automation user detected, need to get git commit issuer")
 
-        if self._parsed_commit_html is None:
+        if self._commit_details is None:
             self.warn('could not find git commit issuer', sentry=True)
             return self.owner
 
-        assert isinstance(self._parsed_commit_html, BeautifulSoup)
-        commit_info = self._parsed_commit_html.find(class_='commit-info')
-        if commit_info is None:
+        if self._commit_details['issuer'] is None:
             self.warn('could not find commit-info element', sentry=True)
             return self.owner
-        issuer_element = commit_info.find('td')
-        issuer = re.sub(".*lt;(.*)@.*", "\\1", str(issuer_element))
 
-        return issuer
+        return cast(str, self._commit_details['issuer'])
 
     @cached_property
     def rhel(self) -> str:
@@ -2094,6 +2562,15 @@ class Koji(gluetool.Module):
                 'help': 'Wait timeout for task to become non-waiting and closed (default: %(default)s)',
                 'type': int,
                 'default': 60,
+            },
+            'multicall-batch-size': {
+                'help': """
+                        Maximal number of API calls packed into a single multicall request. Use ``0`` to disable
+                        multicalls (default: %(default)s).
+                        """,
+                'metavar': 'COUNT',
+                'type': int,
+                'default': DEFAULT_MULTICALL_BATCH_SIZE
             }
         }),
         ('Baseline options', {
@@ -2141,6 +2618,30 @@ class Koji(gluetool.Module):
                 'default': DEFAULT_COMMIT_FETCH_TICKS
             }
         }),
+        ('API cache options', {
+            'api-cache': {
+                'help': """
+                        If set, responses of Koji API and details of dist-git commits are cached across pipelines,
+                        either in a local directory or in Memcached (provided by ``memcached`` module)
+                        (default: none).
+                        """,
+                'choices': ['disk', 'memcached']
+            },
+            'api-cache-dir': {
+                'help': 'Directory for the ``disk`` API cache (default: %(default)s).',
+                'metavar': 'DIR',
+                'default': '~/.cache/gluetool-modules/koji-api'
+            },
+            'api-cache-ttl': {
+                'help': """
+                        How long should be cached responses of API methods whose responses may change, e.g.
+                        ``listTagged``. Use ``0`` to disable their caching (default: %(default)s).
+                        """,
+                'metavar': 'SECONDS',
+                'type': int,
+                'default': DEFAULT_API_CACHE_TTL
+            }
+        }),
         ('Retry_Options', {
             'api-version-retry-timeout': {
                 'help': """
@@ -2188,6 +2689,12 @@ class Koji(gluetool.Module):
         self._session = None
         self._tasks: List[KojiTask] = []
 
+        # number of API calls issued via multicalls, and number of requests they took
+        self._multicall_calls = 0
+        self._multicall_requests = 0
+
+        self._api_cache: Optional[KojiApiCache] = None
+
     @cached_property
     def _valid_methods(self) -> List[str]:
         return gluetool.utils.normalize_multistring_option(self.option('valid-methods'))
@@ -2222,14 +2729,82 @@ class Koji(gluetool.Module):
         return task
 
     def _call_api(self, method: str, *args: Any, **kwargs: Any) -> Any:
-        return _call_api(self._session, self.logger, method, *args, **kwargs)
+        if self._api_cache is None:
+            return _call_api(self._session, self.logger, method, *args, **kwargs)
+
+        return self._api_cache.call_api(self._session, self.logger, method, *args, **kwargs)
+
+    def _create_api_cache(self) -> Optional[KojiApiCache]:
+
+        if self.option('api-cache') == 'disk':
+            store: Any = DiskApiCacheStore(gluetool.utils.normalize_path(self.option('api-cache-dir')))
+
+        elif self.option('api-cache') == 'memcached':
+            self.require_shared('cache')
+
+            store = MemcachedApiCacheStore(self.shared('cache'))
+
+        else:
+            return None
+
+        return KojiApiCache(store, self.option('url'), self.option('api-cache-ttl') or 0, self.logger)
+
+    @property
+    def _multicall_enabled(self) -> bool:
+        return (self.option('multicall-batch-size') or 0) >= 2
+
+    def _call_api_multi(
+        self,
+        method: str,
+        calls: List[ApiCallArgsType],
+        session: Optional[Any] = None,
+        logger: Optional[ContextAdapter] = None,
+        return_exceptions: bool = False
+    ) -> List[Any]:
+        """
+        Call the same API method with different arguments, using multicalls to save round trips to the server.
+
+        :param str method: API method to call.
+        :param list calls: positional and keyword arguments of each call.
+        :param session: Koji session to use instead of the module's one.
+        :param logger: logger to use instead of the module's one.
+        :param bool return_exceptions: if set, exceptions raised by calls are returned as their results.
+        :returns: results of calls, in the same order as ``calls``.
+        """
+
+        results, requests_count = (self._api_cache.call_api_multi if self._api_cache else _call_api_multi)(
+            session or self._session,
+            logger or self.logger,
+            method,
+            calls,
+            self.option('multicall-batch-size') or 0,
+            return_exceptions=return_exceptions
+        )
+
+        if 0 < requests_count < len(calls):
+            (logger or self.logger).debug('{}: {} calls in {} requests'.format(method, len(calls), requests_count))
+
+            self._multicall_calls += len(calls)
+            self._multicall_requests += requests_count
+
+        return results
 
     def _objects_to_builds(
         self,
         name: str,
         object_ids: Optional[Union[List[int], List[str]]],
-        finder: Callable[..., List[Dict[str, Any]]]
+        method: str,
+        call_args: Callable[[Any], ApiCallArgsType]
     ) -> List[Dict[str, Any]]:
+        """
+        Find builds for given objects, e.g. build IDs or NVRs.
+
+        :param str name: name of objects, for logging.
+        :param list object_ids: objects to find builds for.
+        :param str method: API method to call for each object.
+        :param callable call_args: given an object, returns positional and keyword arguments of the API call.
+        :rtype: list(dict)
+        """
 
         if not object_ids:
             return []
@@ -2238,8 +2813,11 @@ class Koji(gluetool.Module):
 
         builds: List[Dict[str, Any]] = []
 
-        for object_id in object_ids:
-            build = finder(object_id)
+        responses = self._call_api_multi(method, [call_args(object_id) for object_id in object_ids])
+
+        for object_id, response in zip(object_ids, responses):
+            # Some methods return a single build, some return a list of builds.
+            build = response if isinstance(response, list) else [response]
 
             log_dict(self.debug, "for '{}' found".format(object_id), build)
 
@@ -2299,26 +2877,20 @@ class Koji(gluetool.Module):
         builds += self._objects_to_builds(
             'build',
             build_ids,
-            lambda build_id: [self._call_api('getBuild', build_id)]
+            'getBuild',
+            lambda build_id: ((build_id,), {})
         )
         builds += self._objects_to_builds(
             'nvr',
             nvrs,
-            lambda nvr: [self._call_api('getBuild', nvr)]
+            'getBuild',
+            lambda nvr: ((nvr,), {})
         )
         builds += self._objects_to_builds(
             'name',
             names,
-            lambda name: cast(
-                List[Dict[str, Any]],
-                self._call_api(
-                    'listTagged',
-                    self.option('tag'),
-                    package=name,
-                    inherit=True,
-                    latest=True
-                )
-            )
+            'listTagged',
+            lambda name: ((self.option('tag'),), {'package': name, 'inherit': True, 'latest': True})
         )
 
         # Now extract task IDs.
@@ -2482,6 +3054,8 @@ class Koji(gluetool.Module):
             return Result.Ok(version)
 
         self._session = koji.ClientSession(url)
+        self._api_cache = self._create_api_cache()
+
         version = gluetool.utils.wait(
             "getting api version",
             _api_version,
@@ -2510,6 +3084,20 @@ class Koji(gluetool.Module):
                 else:
                     self.warn('Baseline build was not found')
 
+    def destroy(self, failure: Optional[gluetool.Failure] = None) -> None:
+
+        if self._api_cache:
+            self.debug('API cache: {} hits, {} misses'.format(self._api_cache.hits, self._api_cache.misses))
+
+        if not self._multicall_calls:
+            return
+
+        self.debug('multicalls: {} API calls in {} requests, {} round trips saved'.format(
+            self._multicall_calls,
+            self._multicall_requests,
+            self._multicall_calls - self._multicall_requests
+        ))
+
 
 class Brew(Koji, (gluetool.Module)):
     """
@@ -2641,7 +3229,8 @@ class Brew(Koji, (gluetool.Module)):
         builds = self._objects_to_builds(
             'build',
             build_ids,
-            lambda build_id: cast(List[Dict[str, Any]], [self._call_api('getBuild', build_id)])
+            'getBuild',
+            lambda build_id: ((build_id,), {})
         )
 
         # Check each build - if it does have task_id, it passes through. If it does not have task_id,
@@ -109,12 +109,13 @@ class Cache(LoggerMixin, object):
         with self._lock:
             return cast(bool, self._client.add(ensure_binary(key), value, noreply=False))
 
-    def set(self, key: str, value: Any) -> bool:
+    def set(self, key: str, value: Any, expire: int = 0) -> bool:
         """
         Set a value of a given key.
 
         :param str key: cache key.
         :param value: desired value of the key.
+        :param int expire: number of seconds until the key expires, ``0`` means it never expires.
         :rtype: bool
         :returns: ``True`` when the value was successfully changed, ``False`` otherwise.
         """
@@ -122,7 +123,7 @@ class Cache(LoggerMixin, object):
         log_dict(self.debug, "set '{}'".format(key), value)
 
         with self._lock:
-            return cast(bool, self._client.set(ensure_binary(key), value, noreply=False))
+            return cast(bool, self._client.set(ensure_binary(key), value, expire=expire, noreply=False))
 
     def cas(self, key: str, value: Any, tag: bytes) -> Optional[bool]:
         """
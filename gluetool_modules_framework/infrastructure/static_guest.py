@@ -59,7 +59,8 @@ class StaticGuest(NetworkedGuest):
             self.wait_alive(
                 boot_timeout=module.option('boot-timeout'), boot_tick=2,
                 connect_timeout=module.option('connect-timeout'), connect_tick=2,
-                echo_timeout=module.option('echo-timeout'), echo_tick=2)
+                echo_timeout=module.option('echo-timeout'), echo_tick=2,
+                single_probe=bool(module.option('single-probe')))
 
         except (socket.gaierror, GlueError) as error:
             raise GlueError("Error connecting to guest '{}': {}".format(self, error))
@@ -153,6 +154,13 @@ class CIStaticGuest(gluetool.Module):
             },
             'compose': {
                 'help': 'Compose name to force in the TestingEnvironment.'
+            },
+            'single-probe': {
+                'help': """
+                    Check guest shell and boot process together, with a single command, instead of running
+                    a command for each check.
+                """,
+                'action': 'store_true'
             }
         }),
         ('Timeouts', {
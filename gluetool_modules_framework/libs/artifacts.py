@@ -7,7 +7,7 @@ from pathlib import Path
 import gluetool
 
 # Type annotations
-from typing import TYPE_CHECKING, cast, Any, List, Optional, Tuple, Union  # noqa
+from typing import TYPE_CHECKING, cast, Any, Dict, List, Optional, Tuple, Union  # noqa
 
 if TYPE_CHECKING:
     from gluetool.log import ContextAdapter  # noqa
@@ -65,6 +65,28 @@ def artifacts_location(module: gluetool.Module, local_path: str, logger: Optiona
     return local_path
 
 
+def cached_urls(module: gluetool.Module,
+                guest: Any,
+                urls: List[str],
+                checksums: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    If we have access to ``cache_urls`` shared function, return URLs of the cached artifacts the guest should
+    download instead of the given ones. Otherwise, return the input URLs.
+
+    :param module: module asking for the URLs.
+    :param guest: guest which is going to download the artifacts.
+    :param urls: URLs of artifacts.
+    :param checksums: expected SHA256 digests of artifacts, by their URLs.
+    """
+
+    if not urls or not module.has_shared('cache_urls'):
+        return urls
+
+    mapping = cast(Dict[str, str], module.shared('cache_urls', guest, urls, checksums=checksums))
+
+    return [mapping.get(url, url) for url in urls]
+
+
 def package_list_path(pkglist: Union[str, PathLike[str]] = DEFAULT_PACKAGE_LIST, *,
                       basepath: Optional[Union[str, PathLike[str]]] = None) -> PathLike[str]:
     """
@@ -84,7 +106,8 @@ def package_list_path(pkglist: Union[str, PathLike[str]] = DEFAULT_PACKAGE_LIST,
 
 
 def packages_download_cmd(download_path: str, rpm_urls: Optional[List[str]] = None,
-                          rpm_urls_file: Optional[str] = None, *, pkglist: str = DEFAULT_PACKAGE_LIST) -> str:
+                          rpm_urls_file: Optional[str] = None, *, pkglist: str = DEFAULT_PACKAGE_LIST,
+                          parallel: int = 1) -> str:
     """
     Helper to generate a command to download package files to a directory.
 
@@ -92,17 +115,28 @@ def packages_download_cmd(download_path: str, rpm_urls: Optional[List[str]] = No
     :param rpm_urls: List of RPM URLs to fetch.
     :param rpm_urls_file: Path to a file on the target containing the list of URLs to download.
     :patam pkglist: Optional override for the location of the list of downloaded packages.
+    :param parallel: Number of ``curl`` processes downloading packages in parallel.
     :raises :py:class:`ValueError` if incorrect arguments are passed in.
     """
 
     if (rpm_urls is None) is (rpm_urls_file is None):
         raise ValueError("Exactly one of 'rpm_urls' or 'rpm_urls_file' is required.")
 
+    if parallel < 1:
+        raise ValueError("'parallel' must be a positive number.")
+
     # Base curl command, which outputs the downloaded filename to a file
     curl_cmd = 'curl -sL --retry 5 --remote-name-all -w "%{http_code} %{url_effective} %{filename_effective}\\n"'
 
     if rpm_urls is not None:
-        curl_cmd = '{} {}'.format(curl_cmd, ' '.join(rpm_urls))
+        if parallel > 1 and len(rpm_urls) > 1:
+            # One URL per curl process - output lines of processes downloading multiple URLs would get mixed
+            # in the shared pipe, while a single short line is written atomically.
+            curl_cmd = 'echo {} | xargs -n1 -P{} {}'.format(' '.join(rpm_urls), parallel, curl_cmd)
+        else:
+            curl_cmd = '{} {}'.format(curl_cmd, ' '.join(rpm_urls))
+    elif parallel > 1:
+        curl_cmd = 'cat {} | xargs -n1 -P{} {}'.format(rpm_urls_file, parallel, curl_cmd)
     else:
         curl_cmd = 'cat {} | xargs -n1 {}'.format(rpm_urls_file, curl_cmd)
 
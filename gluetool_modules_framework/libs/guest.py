@@ -10,21 +10,126 @@ the modules.
 
 import logging
 import os
+import shlex
 import socket
+import subprocess
+import tarfile
 import tempfile
+import time
 import six
 
 from functools import partial
 from gluetool.log import LoggerMixin
 from gluetool.result import Result
 from gluetool.utils import Command
+from gluetool_modules_framework.libs.ssh_client import SSHClient, is_connection_error
 from gluetool_modules_framework.libs.testing_environment import TestingEnvironment
 
 import gluetool
 
 # Type annotations
 # pylint: disable=unused-import,wrong-import-order
-from typing import cast, Any, Callable, Dict, List, Optional, Tuple, Union  # noqa
+from typing import cast, Any, Callable, Dict, IO, Iterable, List, Optional, Tuple, Union  # noqa
+
+
+#: Script checking the guest is alive in a single command. Prints the message to echo, the init system and status
+#: of the boot process, followed by failed units if the system is degraded.
+PROBE_SCRIPT = """echo '{msg}'
+if type systemctl >/dev/null 2>&1; then
+    status="$(systemctl is-system-running 2>/dev/null)"
+    echo "systemctl $status"
+    if [ "$status" = degraded ]; then systemctl --plain --no-pager --failed; fi
+elif type initctl >/dev/null 2>&1; then
+    echo "initctl $(initctl status rc 2>/dev/null)"
+else
+    echo unknown
+fi"""
+
+
+class CountingWriter(object):
+    """
+    Write-only file-like object, counting bytes written into the wrapped stream.
+    """
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        self._stream = stream
+        self.count = 0
+
+    def write(self, data: bytes) -> int:
+        self._stream.write(data)
+        self.count += len(data)
+
+        return len(data)
+
+
+class CountingReader(object):
+    """
+    Read-only file-like object, counting bytes read from the wrapped stream or from an iterable of chunks.
+    """
+
+    def __init__(self, stream: Union[IO[bytes], Iterable[bytes]]) -> None:
+        self._stream = stream
+        self._chunks = iter(stream) if not hasattr(stream, 'read') else None
+        self._buffer = b''
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if self._chunks is None:
+            data = cast(IO[bytes], self._stream).read(size)
+
+        else:
+            while size < 0 or len(self._buffer) < size:
+                chunk = next(self._chunks, None)
+
+                if chunk is None:
+                    break
+
+                self._buffer += chunk
+
+            if size < 0:
+                data, self._buffer = self._buffer, b''
+
+            else:
+                data, self._buffer = self._buffer[:size], self._buffer[size:]
+
+        self.count += len(data)
+
+        return data
+
+
+def write_tar_stream(stream: Any, srcs: List[str], compress: bool = False) -> None:
+    """
+    Write a tar archive of given files and directories into a stream. Each path is stored under its base name,
+    with its permissions.
+
+    :param stream: file-like object to write into, it needs to provide ``write`` method only.
+    :param list(str) srcs: paths to archive.
+    :param bool compress: if set, the archive is compressed with gzip.
+    """
+
+    with tarfile.open(fileobj=stream, mode='w|gz' if compress else 'w|') as archive:
+        for src in srcs:
+            archive.add(src, arcname=os.path.basename(os.path.normpath(src)))
+
+
+def extract_tar_stream(stream: Any, dst: str, compress: bool = False) -> None:
+    """
+    Extract a tar archive read from a stream into a directory, keeping permissions of extracted files.
+
+    :param stream: file-like object to read from, it needs to provide ``read`` method only.
+    :param str dst: directory to extract into, created when it does not exist.
+    :param bool compress: if set, the archive is expected to be compressed with gzip.
+    """
+
+    os.makedirs(dst, exist_ok=True)
+
+    with tarfile.open(fileobj=stream, mode='r|gz' if compress else 'r|') as archive:
+        # `tar` filter keeps permissions, but refuses members leading outside of `dst`
+        if hasattr(tarfile, 'tar_filter'):
+            archive.extractall(dst, filter='tar')
+
+        else:
+            archive.extractall(dst)
 
 
 class GuestConnectionError(gluetool.GlueError):
@@ -160,6 +265,30 @@ class Guest(LoggerMixin, object):
 
         raise NotImplementedError()
 
+    def copy_many_to(self, srcs: List[str], dst: str, compress: bool = False, **kwargs: Any) -> int:
+        """
+        Copy files and trees from local filesystem into a directory on the guest, at once.
+
+        :param list(str) srcs: paths to copy, each is copied under its base name.
+        :param str dst: directory on the guest, created when it does not exist.
+        :param bool compress: if set, data are compressed during the transfer.
+        :returns: number of bytes transferred.
+        """
+
+        raise NotImplementedError()
+
+    def copy_many_from(self, srcs: List[str], dst: str, compress: bool = False, **kwargs: Any) -> int:
+        """
+        Copy files and trees from the guest into a directory on local filesystem, at once.
+
+        :param list(str) srcs: paths on the guest to copy, each is copied under its base name.
+        :param str dst: local directory, created when it does not exist.
+        :param bool compress: if set, data are compressed during the transfer.
+        :returns: number of bytes transferred.
+        """
+
+        raise NotImplementedError()
+
     def wait(self,
              label: str,
              check: gluetool.utils.WaitCheckType[Any],
@@ -178,6 +307,48 @@ class Guest(LoggerMixin, object):
 
         return gluetool.utils.wait(label, check, timeout=timeout, tick=tick, logger=self.logger)
 
+    def wait_backoff(self,
+                     label: str,
+                     check: gluetool.utils.WaitCheckType[Any],
+                     timeout: Optional[int] = None,
+                     tick: int = 1,
+                     max_tick: int = 30) -> Any:
+        """
+        Like :py:meth:`wait`, but the time between checks doubles after each failed check, starting with ``tick``
+        seconds and up to ``max_tick`` seconds. Conditions expected to pass soon are noticed sooner, without
+        checking too often when they take longer.
+
+        :param str label: printable label used for logging.
+        :param callable check: called to test the condition, see :py:meth:`wait`.
+        :param int timeout: fail after this many seconds. ``None`` means test forever.
+        :param int tick: time before the second check.
+        :param int max_tick: maximal time between checks.
+        :raises GlueError: when ``timeout`` elapses while condition did not pass the check.
+        """
+
+        end_time = time.time() + timeout if timeout is not None else None
+
+        self.debug("waiting for condition '{}', timeout {}, check every {} to {} seconds".format(
+            label, '{} seconds'.format(timeout) if timeout is not None else 'infinite', tick, max_tick
+        ))
+
+        while end_time is None or time.time() < end_time:
+            result = check()
+
+            if result.is_ok:
+                return result.unwrap()
+
+            delay = min(tick, end_time - time.time()) if end_time is not None else tick
+
+            self.debug("check failed with '{}', sleeping for {:.0f} seconds".format(result.value, max(delay, 0)))
+
+            if delay > 0:
+                time.sleep(delay)
+
+            tick = min(tick * 2, max_tick)
+
+        raise gluetool.GlueError("Condition '{}' failed to pass within given time".format(label))
+
     def create_file(self, dst: str, content: str) -> None:
         """
         Given the name and content, create a file on the guest.
@@ -226,10 +397,26 @@ class NetworkedGuest(Guest):
     :param str username: SSH username (default: root).
     :param str key: path to a key file.
     :param list(str) options: list of 'key=value' strings, passed as '-o' options to ssh.
+    :param str control_path_dir: if set, commands and copies share a single SSH master connection,
+      its control socket is created in this directory.
+    :param int control_persist: how long should the master connection stay open when not used, in seconds.
+    :param str ssh_backend: how to run commands and copies, ``openssh`` runs ``ssh`` and ``scp`` commands,
+      ``paramiko`` uses a persistent in-process connection, see :py:class:`libs.ssh_client.SSHClient`.
     """
 
     DEFAULT_SSH_PORT = 22
 
+    #: Available SSH backends.
+    SSH_BACKEND_OPENSSH = 'openssh'
+    SSH_BACKEND_PARAMIKO = 'paramiko'
+
+    #: Default time an unused master connection is kept open.
+    DEFAULT_CONTROL_PERSIST = 600
+
+    #: Unix socket paths are limited to 108 bytes, and ssh appends a random suffix to the socket path
+    #: while setting up the master connection. Longer directories are not used for control sockets.
+    MAX_CONTROL_PATH_DIR_LENGTH = 40
+
     # pylint: disable=too-many-arguments
     def __init__(self,
                  module: gluetool.Module,
@@ -239,6 +426,9 @@ class NetworkedGuest(Guest):
                  username: Optional[str] = None,
                  key: Optional[str] = None,
                  options: Optional[List[str]] = None,
+                 control_path_dir: Optional[str] = None,
+                 control_persist: int = DEFAULT_CONTROL_PERSIST,
+                 ssh_backend: str = SSH_BACKEND_OPENSSH,
                  **kwargs: Any
                 ) -> None:  # noqa
 
@@ -271,9 +461,44 @@ class NetworkedGuest(Guest):
         self._ssh += options
         self._scp += options
 
+        # Commands not using the master connection, e.g. long-running port forwarding.
+        self._ssh_no_master = self._ssh[:]
+
+        #: Path to the control socket of the master connection, ``None`` when connections are not shared.
+        self.control_path: Optional[str] = None
+
+        #: Number of commands and copies performed over the current master connection.
+        self.connection_commands = 0
+
+        self._control_path_tempdir: Optional[str] = None
+
+        if control_path_dir is not None:
+            control_path_dir = os.path.abspath(control_path_dir)
+
+            if len(control_path_dir) > self.MAX_CONTROL_PATH_DIR_LENGTH:
+                control_path_dir = self._control_path_tempdir = tempfile.mkdtemp(prefix='ssh-')
+
+            # `%C` is expanded by ssh to a hash of local and remote hostnames, port and username
+            self.control_path = os.path.join(control_path_dir, 'ssh-%C')
+
+            control_options = sshize_options([
+                'ControlMaster=auto',
+                'ControlPath={}'.format(self.control_path),
+                'ControlPersist={:d}'.format(control_persist)
+            ])
+
+            self._ssh += control_options
+            self._scp += control_options
+
+        self.ssh_backend = ssh_backend
+        self._ssh_client: Optional[SSHClient] = None
+
         self._supports_systemctl: Optional[bool] = None
         self._supports_initctl: Optional[bool] = None
 
+        #: Python interpreters detected by Ansible, ``None`` when not detected yet.
+        self.ansible_interpreters: Optional[List[str]] = None
+
     def __repr__(self) -> str:
 
         username = getattr(self, 'username', '<unknown username>')
@@ -284,6 +509,15 @@ class NetworkedGuest(Guest):
             getattr(self, 'port', '<unknown port>')
         )
 
+    def reset_facts(self) -> None:
+        """
+        Forget facts detected on the guest, e.g. when the guest was rebooted or restored from a snapshot.
+        """
+
+        self.debug('forgetting guest facts')
+
+        self.ansible_interpreters = None
+
     def _is_allowed_degraded(self, service: str) -> bool:
         # pylint: disable=unused-argument,no-self-use
         """
@@ -307,6 +541,9 @@ class NetworkedGuest(Guest):
 
     def _execute(self, cmd: List[str], **kwargs: Any) -> gluetool.utils.ProcessOutput:
 
+        if self.control_path is not None:
+            self.connection_commands += 1
+
         try:
             return Command(cmd, logger=self.logger).run(**kwargs)
 
@@ -318,14 +555,96 @@ class NetworkedGuest(Guest):
 
             raise exc
 
+    def _ssh_option(self, name: str) -> Optional[str]:
+        """
+        Return value of an SSH option given to the guest, or ``None`` if it was not given.
+        """
+
+        for option in self.options:
+            key, _, value = option.partition('=')
+
+            if key.strip().lower() == name.lower():
+                return value.strip()
+
+        return None
+
+    def _warn_ignored_options(self, action: str, options: Dict[str, Any]) -> None:
+        """
+        Warn about options the in-process SSH client cannot honor.
+        """
+
+        ignored = sorted(name for name, value in options.items() if value is not None)
+
+        if ignored:
+            self.warn('{} options ignored by {} SSH backend: {}'.format(
+                action, self.SSH_BACKEND_PARAMIKO, ', '.join(ignored)
+            ))
+
+    def _run_ssh_client(
+        self,
+        action: Callable[[SSHClient], gluetool.utils.ProcessOutput]
+    ) -> gluetool.utils.ProcessOutput:
+        """
+        Run an action using the in-process SSH client, connecting to the guest when needed.
+        """
+
+        if self._ssh_client is None:
+            assert self.hostname
+
+            connect_timeout, keepalive_interval = self._ssh_option('ConnectTimeout'), \
+                self._ssh_option('ServerAliveInterval')
+
+            self._ssh_client = SSHClient(
+                self.logger, self.hostname, port=self.port, username=self.username, key=self.key,
+                connect_timeout=int(connect_timeout) if connect_timeout else None,
+                keepalive_interval=int(keepalive_interval) if keepalive_interval else None
+            )
+
+        self.connection_commands += 1
+
+        try:
+            return action(self._ssh_client)
+
+        except gluetool.GlueError:
+            raise
+
+        except Exception as exc:
+            if is_connection_error(exc):
+                raise GuestConnectionError(self)
+
+            raise
+
     def execute(self,
                 cmd: str,
                 ssh_options: Optional[List[str]] = None,
                 connection_timeout: Optional[int] = None,
                 **kwargs: Any) -> gluetool.utils.ProcessOutput:
+        """
+        Execute a command on the guest.
+
+        With ``paramiko`` backend, ``stdout_callback`` and ``stderr_callback`` keyword arguments can be used
+        to receive chunks of the command output as they arrive. ``ssh_options`` and other keyword arguments,
+        e.g. ``env``, are not supported, and a warning is emitted when they are used.
+        """
 
         # pylint: disable=arguments-differ
 
+        if self.ssh_backend == self.SSH_BACKEND_PARAMIKO:
+            self.debug("execute: '{}'".format(cmd))
+
+            stdout_callback = kwargs.pop('stdout_callback', None)
+            stderr_callback = kwargs.pop('stderr_callback', None)
+
+            self._warn_ignored_options('execute', dict(kwargs, ssh_options=ssh_options or None))
+
+            return self._run_ssh_client(partial(
+                SSHClient.execute,
+                cmd=cmd,
+                stdout_callback=stdout_callback,
+                stderr_callback=stderr_callback,
+                alive_interval=connection_timeout
+            ))
+
         ssh_options = ssh_options or []
 
         if connection_timeout is not None:
@@ -349,6 +668,36 @@ class NetworkedGuest(Guest):
         assert self.hostname
         return self._execute(self._ssh + sshize_options(ssh_options) + [self.hostname] + [cmd], **kwargs)
 
+    def close_connection(self) -> None:
+        """
+        Close the master connection shared by commands and copies, if there is any.
+        """
+
+        if self._ssh_client is not None:
+            self.debug('closing connection, {} commands used it'.format(self.connection_commands))
+
+            self._ssh_client.close()
+            self._ssh_client = None
+            self.connection_commands = 0
+
+        if self.control_path is None or not self.hostname:
+            return
+
+        self.debug('closing master connection, {} commands used it'.format(self.connection_commands))
+
+        try:
+            Command(self._ssh + ['-O', 'exit', self.hostname], logger=self.logger).run()
+
+        except gluetool.GlueCommandError as exc:
+            # ssh fails when there is no master connection, e.g. it was never opened or it has already expired
+            self.debug('failed to close master connection: {}'.format(exc.output.stderr))
+
+        self.connection_commands = 0
+
+        if self._control_path_tempdir is not None and not os.listdir(self._control_path_tempdir):
+            os.rmdir(self._control_path_tempdir)
+            self._control_path_tempdir = None
+
     def _discover_rc_support(self) -> None:
 
         self._supports_systemctl = False
@@ -413,7 +762,7 @@ class NetworkedGuest(Guest):
             if output.stdout.strip() == msg:
                 return Result.Ok(True)
 
-        except gluetool.GlueCommandError:
+        except (gluetool.GlueCommandError, GuestConnectionError):
             self.debug('echo attempt failed, ignoring error')
 
         return Result.Error('echo failed')
@@ -437,15 +786,28 @@ class NetworkedGuest(Guest):
 
         status = self._get_rc_status('systemctl is-system-running', **kwargs)
 
+        def _failed_units() -> str:
+            output = self.execute('systemctl --plain --no-pager --failed', **kwargs)
+
+            assert output.stdout is not None
+            return output.stdout
+
+        return self._check_systemctl_status(status, _failed_units)
+
+    def _check_systemctl_status(self, status: str, failed_units: Callable[[], str]) -> Result[bool, str]:
+        """
+        Check whether boot process finished using status reported by ``systemctl is-system-running``.
+
+        :param str status: reported status.
+        :param callable failed_units: returns report of ``systemctl --failed``, called when the system is degraded.
+        """
+
         if status == 'running':
             self.debug('systemctl reports ready')
             return Result.Ok(True)
 
         if status == 'degraded':
-            output = self.execute('systemctl --plain --no-pager --failed', **kwargs)
-
-            assert output.stdout is not None
-            report = output.stdout.strip().split('\n')
+            report = failed_units().strip().split('\n')
 
             degraded_services = [line.strip() for line in report if line.startswith(' ')]
             if not degraded_services:
@@ -484,7 +846,12 @@ class NetworkedGuest(Guest):
         Check whether boot process finished using ``initctl``.
         """
 
-        status = self._get_rc_status('initctl status rc', **kwargs)
+        return self._check_initctl_status(self._get_rc_status('initctl status rc', **kwargs))
+
+    def _check_initctl_status(self, status: str) -> Result[bool, str]:
+        """
+        Check whether boot process finished using status reported by ``initctl status rc``.
+        """
 
         if status == 'rc stop/waiting':
             self.debug('initctl reports ready')
@@ -492,6 +859,43 @@ class NetworkedGuest(Guest):
 
         return Result.Error('initctl reports not ready')
 
+    def _check_probe(self, **kwargs: Any) -> Result[bool, str]:
+        """
+        Check whether remote shell is available and boot process finished, running a single script which reports
+        both, and which discovers the init system on the way.
+
+        All keyword arguments are passed directly to :py:ref:`execute` method.
+        """
+
+        msg = 'guest {} is alive'.format(self.hostname)
+
+        try:
+            output = self.execute(PROBE_SCRIPT.format(msg=msg), **kwargs)
+
+        except (gluetool.GlueCommandError, GuestConnectionError):
+            self.debug('probe attempt failed, ignoring error')
+            return Result.Error('probe failed')
+
+        assert output.stdout is not None
+        lines = output.stdout.split('\n')
+
+        if lines[0].strip() != msg:
+            return Result.Error('echo failed')
+
+        rc, _, status = (lines[1] if len(lines) > 1 else '').strip().partition(' ')
+
+        self._supports_systemctl = rc == 'systemctl'
+        self._supports_initctl = rc == 'initctl'
+
+        if self._supports_systemctl:
+            return self._check_systemctl_status(status, lambda: '\n'.join(lines[2:]))
+
+        if self._supports_initctl:
+            return self._check_initctl_status(status)
+
+        self.warn("Don't know how to check boot process status - assume it finished and hope for the best")
+        return Result.Ok(True)
+
     def wait_alive(self,
                    connect_socket_timeout: int = 10,
                    connect_timeout: Optional[int] = None,
@@ -499,11 +903,34 @@ class NetworkedGuest(Guest):
                    echo_timeout: Optional[int] = None,
                    echo_tick: int = 30,
                    boot_timeout: Optional[int] = None,
-                   boot_tick: int = 10
+                   boot_tick: int = 10,
+                   single_probe: bool = False
                   ) -> None:  # noqa
+        """
+        Wait for the guest to become alive: reachable over network, with a working shell, and with its boot
+        process finished.
+
+        :param bool single_probe: if set, the connectivity is checked with exponential backoff, starting at 1 second
+            up to ``connect_tick`` seconds, and the shell and boot process are checked together by a single command,
+            every ``boot_tick`` seconds for at most ``echo_timeout`` and ``boot_timeout`` seconds.
+        """
 
         self.debug('waiting for guest to become alive')
 
+        # the guest might have been rebooted
+        self.reset_facts()
+
+        if single_probe:
+            self.wait_backoff('connectivity', partial(self._check_connectivity, connect_socket_timeout),
+                              timeout=connect_timeout, tick=1, max_tick=connect_tick)
+
+            probe_timeout = echo_timeout + boot_timeout \
+                if echo_timeout is not None and boot_timeout is not None else None
+
+            self.wait('guest alive', partial(self._check_probe, connection_timeout=echo_tick),
+                      timeout=probe_timeout, tick=boot_tick)
+            return
+
         # Step #1: check connectivity first - let's see whether ssh port is connectable
         self.wait('connectivity', partial(self._check_connectivity, connect_socket_timeout),
                   timeout=connect_timeout, tick=connect_tick)
@@ -536,10 +963,45 @@ class NetworkedGuest(Guest):
         """
         raise NotImplementedError
 
+    def forward_remote_port(self,
+                            remote_port: int,
+                            local_port: int,
+                            local_host: str = '127.0.0.1') -> 'subprocess.Popen[bytes]':
+        """
+        Start a process forwarding a port on the guest to a port reachable from the worker, like ``ssh -R`` does.
+
+        The process always runs ``ssh``, no matter which SSH backend is used, over its own connection rather than
+        the shared master connection, therefore the forwarding ends once the process is terminated.
+
+        :param int remote_port: port on the guest.
+        :param int local_port: port on the worker side.
+        :param str local_host: host the forwarded connections are made to, from the worker.
+        :returns: the forwarding process, it is up to the caller to terminate it.
+        """
+
+        assert self.hostname
+
+        self.debug('forwarding guest port {} to {}:{}'.format(remote_port, local_host, local_port))
+
+        return subprocess.Popen(
+            self._ssh_no_master + [
+                '-N',
+                '-o', 'ExitOnForwardFailure=yes',
+                '-R', '{}:{}:{}'.format(remote_port, local_host, local_port),
+                self.hostname
+            ],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
     def copy_to(self, src: str, dst: str, recursive: bool = False, **kwargs: Any) -> gluetool.utils.ProcessOutput:
 
         self.debug("copy to the guest: '{}' => '{}'".format(src, dst))
 
+        if self.ssh_backend == self.SSH_BACKEND_PARAMIKO:
+            self._warn_ignored_options('copy', kwargs)
+
+            return self._run_ssh_client(partial(SSHClient.copy_to, src=src, dst=dst, recursive=recursive))
+
         cmd = self._scp[:]
 
         if recursive:
@@ -553,6 +1015,11 @@ class NetworkedGuest(Guest):
 
         self.debug("copy from the guest: '{}' => '{}'".format(src, dst))
 
+        if self.ssh_backend == self.SSH_BACKEND_PARAMIKO:
+            self._warn_ignored_options('copy', kwargs)
+
+            return self._run_ssh_client(partial(SSHClient.copy_from, src=src, dst=dst, recursive=recursive))
+
         cmd = self._scp[:]
 
         if recursive:
@@ -561,3 +1028,86 @@ class NetworkedGuest(Guest):
         cmd += ['{}@{}:{}'.format(self.username, self.hostname, src), dst]
 
         return self._execute(cmd, **kwargs)
+
+    def _execute_tar(self, cmd: str, **kwargs: Any) -> None:
+        """
+        Run a ``tar`` command on the guest, with its input or output connected to a local archive file
+        by ``stdin`` or ``stdout`` keyword argument.
+        """
+
+        if self.ssh_backend == self.SSH_BACKEND_PARAMIKO:
+            stdin, stdout = kwargs.pop('stdin', None), kwargs.pop('stdout', None)
+
+            self._warn_ignored_options('copy', kwargs)
+
+            self._run_ssh_client(partial(SSHClient.execute, cmd=cmd, stdin=stdin, stdout=stdout))
+            return
+
+        assert self.hostname
+
+        self._execute(self._ssh + [self.hostname, cmd], **kwargs)
+
+    def copy_many_to(self, srcs: List[str], dst: str, compress: bool = False, **kwargs: Any) -> int:
+        """
+        Copy files and trees into a directory on the guest, sending a tar archive over a single SSH session.
+        """
+
+        self.debug("copy to the guest: {} => '{}'".format(', '.join("'{}'".format(src) for src in srcs), dst))
+
+        cmd = 'mkdir -p {dst} && tar -x{z}pf - --no-same-owner -C {dst}'.format(
+            dst=shlex.quote(dst), z='z' if compress else ''
+        )
+
+        with tempfile.TemporaryFile() as archive:
+            stream = CountingWriter(archive)
+
+            write_tar_stream(stream, srcs, compress=compress)
+
+            archive.seek(0)
+
+            self._execute_tar(cmd, stdin=archive, **kwargs)
+
+        self.debug('transferred {} bytes'.format(stream.count))
+
+        return stream.count
+
+    def copy_many_from(self, srcs: List[str], dst: str, compress: bool = False, **kwargs: Any) -> int:
+        """
+        Copy files and trees from the guest into a local directory, receiving a tar archive over a single SSH session.
+        """
+
+        self.debug("copy from the guest: {} => '{}'".format(', '.join("'{}'".format(src) for src in srcs), dst))
+
+        def _member(src: str) -> str:
+            dirpath, name = os.path.split(os.path.normpath(src))
+
+            # Relative `-C` would be relative to the directory of the previous member, start from the initial one.
+            if not os.path.isabs(dirpath):
+                dirpath = '"$PWD"/{}'.format(shlex.quote(dirpath or '.'))
+
+            else:
+                dirpath = shlex.quote(dirpath)
+
+            return '-C {} {}'.format(dirpath, shlex.quote(name))
+
+        cmd = 'tar -c{}f - {}'.format('z' if compress else '', ' '.join(_member(src) for src in srcs))
+
+        with tempfile.TemporaryFile() as archive:
+            self._execute_tar(cmd, stdout=archive, **kwargs)
+
+            archive.seek(0)
+            stream = CountingReader(archive)
+
+            try:
+                extract_tar_stream(stream, dst, compress=compress)
+
+            except tarfile.TarError as exc:
+                raise gluetool.GlueError('Failed to extract files copied from the guest: {}'.format(exc))
+
+            # count whatever is left after the end of archive as well, tar pads archives with zeros
+            while stream.read(1024 * 1024):
+                pass
+
+        self.debug('transferred {} bytes'.format(stream.count))
+
+        return stream.count
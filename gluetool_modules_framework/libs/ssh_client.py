@@ -0,0 +1,354 @@
+# Copyright Contributors to the Testing Farm project.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+In-process SSH client, an alternative to running ``ssh`` and ``scp`` commands for every remote action.
+
+A single connection is kept open for each guest, commands run in their own channels, therefore multiple
+commands can run concurrently over the same connection. Requires `paramiko <https://www.paramiko.org/>`_.
+"""
+
+import os
+import select
+import socket
+import stat
+import threading
+import time
+
+import gluetool
+import six
+
+from gluetool.log import LoggerMixin
+
+# Type annotations
+from typing import cast, Any, Callable, IO, List, Optional  # noqa
+
+try:
+    import paramiko
+
+except ImportError:
+    paramiko = None
+
+
+#: Size of chunks read from command outputs.
+CHUNK_SIZE = 32768
+
+#: How often to check a running command for its output and exit status, in seconds.
+POLL_INTERVAL = 0.1
+
+#: Called with chunks of command output as they arrive.
+OutputCallback = Callable[[str], None]
+
+
+class SSHClient(LoggerMixin, object):
+    """
+    Persistent SSH connection to a guest.
+
+    The connection is opened with the first command, and kept open until :py:meth:`close` is called. Host keys
+    are not verified, like with ``StrictHostKeyChecking=no`` used for guests by default.
+
+    :param gluetool.log.ContextAdapter logger: logger to use.
+    :param str hostname: guest hostname.
+    :param int port: SSH port.
+    :param str username: SSH username.
+    :param str key: path to a private key.
+    :param int connect_timeout: timeout for establishing the connection, in seconds.
+    :param int keepalive_interval: if set, a keepalive message is sent when nothing was sent over the connection
+        for this many seconds, like ``ServerAliveInterval`` option of ``ssh`` does.
+    """
+
+    def __init__(self,
+                 logger: gluetool.log.ContextAdapter,
+                 hostname: str,
+                 port: int = 22,
+                 username: Optional[str] = None,
+                 key: Optional[str] = None,
+                 connect_timeout: Optional[int] = None,
+                 keepalive_interval: Optional[int] = None) -> None:
+
+        super(SSHClient, self).__init__(logger)
+
+        if paramiko is None:
+            raise gluetool.GlueError('In-process SSH client requires paramiko package')
+
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.key = key
+        self.connect_timeout = connect_timeout
+        self.keepalive_interval = keepalive_interval
+
+        self._client: Optional[Any] = None
+        self._lock = threading.Lock()
+
+        # Replies to global requests are not matched with requests, only one check may run at a time.
+        self._alive_lock = threading.Lock()
+
+    @property
+    def _transport(self) -> Any:
+        """
+        Transport of the connection, connecting to the guest if not connected yet or if the connection was lost.
+        """
+
+        with self._lock:
+            if self._client is None or not self._client.get_transport() or \
+                    not self._client.get_transport().is_active():
+
+                self.debug('connecting to {}:{}'.format(self.hostname, self.port))
+
+                client = paramiko.SSHClient()
+                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+                client.connect(
+                    self.hostname,
+                    port=self.port,
+                    username=self.username,
+                    key_filename=self.key,
+                    timeout=self.connect_timeout,
+                    allow_agent=False,
+                    look_for_keys=self.key is None
+                )
+
+                if self.keepalive_interval:
+                    client.get_transport().set_keepalive(self.keepalive_interval)
+
+                self._client = client
+
+            return self._client.get_transport()
+
+    def _sftp(self) -> Any:
+        return paramiko.SFTPClient.from_transport(self._transport)
+
+    def close(self) -> None:
+        """
+        Close the connection.
+        """
+
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def _check_alive(self, transport: Any, timeout: int) -> None:
+        """
+        Check the guest still responds, by sending a keepalive request and waiting for the reply.
+
+        :raises paramiko.SSHException: when the guest did not reply in ``timeout`` seconds. The connection is closed.
+        """
+
+        with self._alive_lock:
+            # ``global_request`` waits for the reply without any timeout, therefore it runs in its own thread.
+            # Any reply, even a failure, means the guest is alive.
+            request = threading.Thread(
+                target=transport.global_request,
+                args=('keepalive@openssh.com',),
+                kwargs={'wait': True}
+            )
+            request.daemon = True
+            request.start()
+            request.join(timeout)
+
+            if request.is_alive() or not transport.is_active():
+                # closing the transport releases the waiting thread as well
+                transport.close()
+
+                raise paramiko.SSHException('Guest {} did not respond for {} seconds'.format(self.hostname, timeout))
+
+    def execute(self,
+                cmd: str,
+                stdout_callback: Optional[OutputCallback] = None,
+                stderr_callback: Optional[OutputCallback] = None,
+                alive_interval: Optional[int] = None,
+                stdin: Optional[IO[bytes]] = None,
+                stdout: Optional[IO[bytes]] = None) -> gluetool.utils.ProcessOutput:
+        """
+        Run a command in a new channel.
+
+        :param str cmd: command to run.
+        :param callable stdout_callback: called with chunks of standard output as they arrive.
+        :param callable stderr_callback: called with chunks of error output as they arrive.
+        :param int alive_interval: if set, and the command produces no output for this many seconds, check the guest
+            still responds, like ``ServerAliveInterval`` and ``ServerAliveCountMax=1`` options of ``ssh`` do.
+            Commands of a responding guest are never interrupted, no matter how long they run quietly.
+        :param stdin: if set, content of this binary file is sent to the standard input of the command, which is
+            closed then.
+        :param stdout: if set, standard output is written into this binary file instead of being returned.
+        :raises gluetool.GlueCommandError: when the command exits with non-zero exit code.
+        :raises paramiko.SSHException: when the guest stopped responding.
+        """
+
+        channel = self._transport.open_session(timeout=self.connect_timeout)
+
+        stdout_chunks: List[bytes] = []
+        stderr: List[bytes] = []
+
+        # Chunk of stdin not accepted by the channel yet.
+        pending = b''
+
+        try:
+            channel.exec_command(cmd)
+
+            last_activity = time.time()
+
+            while True:
+                if channel.recv_ready():
+                    data = channel.recv(CHUNK_SIZE)
+                    last_activity = time.time()
+
+                    if stdout is not None:
+                        stdout.write(data)
+
+                    else:
+                        stdout_chunks.append(data)
+
+                    if stdout_callback:
+                        stdout_callback(six.ensure_str(data, errors='replace'))
+
+                elif channel.recv_stderr_ready():
+                    data = channel.recv_stderr(CHUNK_SIZE)
+                    stderr.append(data)
+                    last_activity = time.time()
+
+                    if stderr_callback:
+                        stderr_callback(six.ensure_str(data, errors='replace'))
+
+                elif channel.exit_status_ready():
+                    break
+
+                elif stdin is not None and channel.send_ready():
+                    pending = pending or stdin.read(CHUNK_SIZE)
+
+                    if pending:
+                        pending = pending[channel.send(pending):]
+
+                    else:
+                        channel.shutdown_write()
+                        stdin = None
+
+                    last_activity = time.time()
+
+                elif alive_interval and time.time() - last_activity >= alive_interval:
+                    self._check_alive(channel.get_transport(), alive_interval)
+                    last_activity = time.time()
+
+                else:
+                    # The channel is not signalled by every event, e.g. by the exit status, therefore wait just
+                    # for a short while, and check the channel again.
+                    select.select([channel], [], [], POLL_INTERVAL)
+
+            exit_code = channel.recv_exit_status()
+
+        finally:
+            channel.close()
+
+        output = gluetool.utils.ProcessOutput(
+            [cmd], exit_code,
+            six.ensure_str(b''.join(stdout_chunks), errors='replace') if stdout is None else None,
+            six.ensure_str(b''.join(stderr), errors='replace'),
+            {}
+        )
+
+        if exit_code != 0:
+            raise gluetool.GlueCommandError([cmd], output)
+
+        return output
+
+    def copy_to(self, src: str, dst: str, recursive: bool = False) -> gluetool.utils.ProcessOutput:
+        """
+        Copy a file or a tree to the guest, using SFTP. Like ``scp``, if ``dst`` is a directory, ``src`` is copied
+        into it.
+        """
+
+        sftp = self._sftp()
+
+        try:
+            try:
+                if stat.S_ISDIR(sftp.stat(dst).st_mode):
+                    dst = os.path.join(dst, os.path.basename(os.path.normpath(src)))
+
+            except IOError:
+                pass
+
+            if os.path.isdir(src):
+                if not recursive:
+                    raise gluetool.GlueError("Cannot copy directory '{}' without recursive flag".format(src))
+
+                self._put_tree(sftp, src, dst)
+
+            else:
+                sftp.put(src, dst)
+                sftp.chmod(dst, stat.S_IMODE(os.stat(src).st_mode))
+
+        finally:
+            sftp.close()
+
+        return gluetool.utils.ProcessOutput(['sftp put', src, dst], 0, '', '', {})
+
+    def _put_tree(self, sftp: Any, src: str, dst: str) -> None:
+        try:
+            sftp.mkdir(dst)
+
+        except IOError:
+            # already exists
+            pass
+
+        for name in os.listdir(src):
+            src_path, dst_path = os.path.join(src, name), os.path.join(dst, name)
+
+            if os.path.isdir(src_path):
+                self._put_tree(sftp, src_path, dst_path)
+
+            else:
+                sftp.put(src_path, dst_path)
+                sftp.chmod(dst_path, stat.S_IMODE(os.stat(src_path).st_mode))
+
+    def copy_from(self, src: str, dst: str, recursive: bool = False) -> gluetool.utils.ProcessOutput:
+        """
+        Copy a file or a tree from the guest, using SFTP. Like ``scp``, if ``dst`` is a directory, ``src`` is copied
+        into it.
+        """
+
+        sftp = self._sftp()
+
+        try:
+            if os.path.isdir(dst):
+                dst = os.path.join(dst, os.path.basename(os.path.normpath(src)))
+
+            if stat.S_ISDIR(sftp.stat(src).st_mode):
+                if not recursive:
+                    raise gluetool.GlueError("Cannot copy directory '{}' without recursive flag".format(src))
+
+                self._get_tree(sftp, src, dst)
+
+            else:
+                sftp.get(src, dst)
+                os.chmod(dst, stat.S_IMODE(sftp.stat(src).st_mode))
+
+        finally:
+            sftp.close()
+
+        return gluetool.utils.ProcessOutput(['sftp get', src, dst], 0, '', '', {})
+
+    def _get_tree(self, sftp: Any, src: str, dst: str) -> None:
+        os.makedirs(dst, exist_ok=True)
+
+        for attrs in sftp.listdir_attr(src):
+            src_path, dst_path = os.path.join(src, attrs.filename), os.path.join(dst, attrs.filename)
+
+            if stat.S_ISDIR(attrs.st_mode):
+                self._get_tree(sftp, src_path, dst_path)
+
+            else:
+                sftp.get(src_path, dst_path)
+                os.chmod(dst_path, stat.S_IMODE(attrs.st_mode))
+
+
+def is_connection_error(exc: Exception) -> bool:
+    """
+    Decide whether an exception raised by :py:class:`SSHClient` means the guest could not be reached.
+    """
+
+    if isinstance(exc, (socket.error, EOFError)):
+        return True
+
+    return paramiko is not None and isinstance(exc, paramiko.SSHException)
@@ -4,6 +4,8 @@
 import collections
 import re
 import os
+import shlex
+import uuid
 import gluetool
 from gluetool import SoftGlueError
 from gluetool.log import log_dict
@@ -24,6 +26,9 @@ import gluetool_modules_framework.libs.guest # noqa
 #: Step callback type
 StepCallbackType = Callable[[str, gluetool.utils.ProcessOutput], Optional[str]]
 
+#: Batch parser type - given items and output of a batch command, returns items which failed.
+BatchParserType = Callable[[List[str], gluetool.utils.ProcessOutput], List[str]]
+
 #: Describes one command used to SUT installtion
 #:
 #: :ivar str label: Label used for logging.
@@ -34,8 +39,10 @@ StepCallbackType = Callable[[str, gluetool.utils.ProcessOutput], Optional[str]]
 #: :ivar Callable callback: Callback to additional processing of command output.
 #: :ivar bool local: If set to True, run the step locally on the worker.
 #: :ivar dict env: Environment variables to set for the command execution.
+#: :ivar bool batch: If set, the command is executed just once, with all items substituted at once.
+#: :ivar Callable batch_parser: Callback finding failed items in the output of a failed batch command.
 SUTStep = collections.namedtuple(
-    'SUTStep', ['label', 'command', 'items', 'ignore_exception', 'callback', 'local', 'env']
+    'SUTStep', ['label', 'command', 'items', 'ignore_exception', 'callback', 'local', 'env', 'batch', 'batch_parser']
 )
 
 # Pattern for dnf commands which will be extended with --allowerasing
@@ -45,6 +52,23 @@ ALLOW_ERASING_PATTERN = re.compile(r'\s(install|update|downgrade)\s')
 
 INSTALL_COMMANDS_FILE = 'sut_install_commands.sh'
 
+#: Message reported by ``rpm -q`` for packages which are not installed.
+RPM_NOT_INSTALLED_PATTERN = re.compile(r'^package (.+) is not installed$', re.MULTILINE)
+
+
+def rpm_query_failed_items(items: List[str], output: gluetool.utils.ProcessOutput) -> List[str]:
+    """
+    Batch parser for ``rpm -q`` steps, finds packages reported as not installed.
+
+    :param list(str) items: packages queried by the command.
+    :param gluetool.utils.ProcessOutput output: output of the command.
+    :returns: packages which are not installed.
+    """
+
+    not_installed = set(RPM_NOT_INSTALLED_PATTERN.findall(output.stdout or ''))
+
+    return [item for item in items if item in not_installed]
+
 
 class SUTInstallationFailedError(ArtifactFingerprintsMixin, SoftGlueError):
     def __init__(
@@ -76,18 +100,30 @@ class SUTInstallationFailedError(ArtifactFingerprintsMixin, SoftGlueError):
 
 
 class SUTInstallation(object):
+    """
+    Installation of the system under test, a sequence of steps executed on the guest.
+
+    :param gluetool.Module module: module running the installation.
+    :param str log_dirpath: directory for installation logs.
+    :param artifact: artifact being installed, used for reporting.
+    :param logger: logger to use.
+    :param bool single_session: if set, consecutive remote steps are compiled into a single script, executed
+        over one SSH session, instead of running one command per SSH session.
+    """
 
     def __init__(self,
                  module: gluetool.Module,
                  log_dirpath: str,
                  artifact: Any,
-                 logger: Optional[Union[gluetool.log.ContextAdapter, gluetool.log.LoggerMixin]] = None) -> None:
+                 logger: Optional[Union[gluetool.log.ContextAdapter, gluetool.log.LoggerMixin]] = None,
+                 single_session: bool = False) -> None:
 
         self.module = module
         self.log_dirpath = log_dirpath
         self.artifact = artifact
         self.steps: List[SUTStep] = []
         self.logger = logger or gluetool.log.Logging.get_logger()
+        self.single_session = single_session
 
     def add_step(self,
                  label: str,
@@ -96,7 +132,16 @@ class SUTInstallation(object):
                  ignore_exception: bool = False,
                  callback: Optional[StepCallbackType] = None,
                  local: bool = False,
-                 env: Optional[Dict[str, str]] = None) -> None:
+                 env: Optional[Dict[str, str]] = None,
+                 batch: bool = False,
+                 batch_parser: Optional[BatchParserType] = None) -> None:
+        """
+        Add a step to the installation.
+
+        In the batch mode, ``command`` is executed once, with all items, separated by spaces, substituted for
+        the placeholder. When such a command fails, ``batch_parser`` is used to find out which items failed.
+        Without the parser, or when the parser cannot tell, the command is executed once more for each item.
+        """
 
         if not items:
             items = []
@@ -104,12 +149,160 @@ class SUTInstallation(object):
         if not isinstance(items, list):
             items = [items]
 
-        self.steps.append(SUTStep(label, command, items, ignore_exception, callback, local, env or {}))
+        self.steps.append(
+            SUTStep(label, command, items, ignore_exception, callback, local, env or {}, batch, batch_parser)
+        )
+
+    @staticmethod
+    def _translate_command(command: str, dnf_present: bool) -> str:
+
+        # replace yum with dnf in case dnf is present on guest
+        if dnf_present and command.startswith('yum'):
+            command = '{}{}'.format('dnf', command[3:])
+
+        # always use `--allowerasing` with `dnf` commands
+        if 'dnf ' in command:
+            if re.search(ALLOW_ERASING_PATTERN, command):
+                command = re.sub(ALLOW_ERASING_PATTERN, r' \1 --allowerasing ', command)
+
+        return command
+
+    @staticmethod
+    def _step_commands(step: SUTStep, command: str) -> List[Tuple[Optional[str], str]]:
+        """
+        Commands executed by a step, together with items they were created for.
+        """
+
+        if not step.items:
+            return [(None, command)]
+
+        if step.batch:
+            return [(None, command.format(' '.join(step.items)))]
+
+        # `step.command` contains `{}` to indicate place where item is substitute.
+        # e.g 'yum install -y {}'.format('ksh')
+        return [(item, command.format(item)) for item in step.items]
+
+    @staticmethod
+    def _log_filepath(log_dirpath: str, index: int, step: SUTStep) -> str:
+
+        return os.path.join(log_dirpath, '{}-{}.txt'.format(index, step.label.replace(' ', '-')))
+
+    @staticmethod
+    def _executor(guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+                  step: SUTStep) -> Callable[[List[str]], ProcessOutput]:
+
+        # our `command` is assigned to this `cmd`, and here we convert it
+        # to string to work with guest.execute
+        # kwargs hack is to make executor do not pass env parameters if not needed
+        def executor(cmd: List[str]) -> ProcessOutput:
+            kwargs = {'env': step.env} if step.env else {}
+            if step.local:
+                return Command(['bash', '-c', cmd[0]]).run(**kwargs)
+            else:
+                return guest.execute(cmd[0], **kwargs)
+
+        return executor
+
+    def _run_command(self,
+                     guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+                     step: SUTStep,
+                     item: Optional[str],
+                     command: str,
+                     log_filepath: str,
+                     executor: Callable[[List[str]], ProcessOutput],
+                     logs_location: Optional[str],
+                     dnf_present: bool) -> Optional[Result[None, SUTInstallationFailedError]]:
+        """
+        Run a single command of a step, and decide whether the installation failed.
+
+        :returns: ``None`` when the installation may continue, or an error describing the failure.
+        """
+
+        command_failed, error_message, output = run_and_log(
+            [command],  # `command` is a string, we need to send it as List[str]
+            log_filepath,
+            executor=executor,
+            callback=step.callback,
+            label=step.label
+        )
+
+        if not command_failed or step.ignore_exception:
+            return None
+
+        if step.batch and step.items:
+            failed_items = step.batch_parser(step.items, output) if step.batch_parser else []
+
+            if failed_items:
+                guest.warn('Following items have failed: {}'.format(','.join(failed_items)))
+
+                item = failed_items[0]
+
+            else:
+                # cannot tell which items failed, run the command for each item, logging into its own file
+                item_log_filepath = '{}-items{}'.format(*os.path.splitext(log_filepath))
+
+                for item, item_command in self._step_commands(
+                    step._replace(batch=False), self._translate_command(step.command, dnf_present)
+                ):
+                    result = self._run_command(
+                        guest, step._replace(batch=False), item, item_command, item_log_filepath,
+                        self._executor(guest, step), logs_location, dnf_present
+                    )
+
+                    if result is not None:
+                        return result
+
+                # every item passed on its own, e.g. the batch failed because of a transient error
+                return None
+
+        if item is not None and error_message:
+            self.logger.error(error_message)
+
+        return Error(
+            SUTInstallationFailedError(
+                self.artifact,
+                guest,
+                items=item,
+                reason=error_message,
+                installation_logs=self.log_dirpath,
+                installation_logs_location=logs_location
+            )
+        )
 
     def run(self,
             guest: gluetool_modules_framework.libs.guest.NetworkedGuest) -> Result[None, SUTInstallationFailedError]:
 
-        commands = []
+        if not os.path.exists(self.log_dirpath):
+            os.mkdir(self.log_dirpath)
+
+        logs_location = artifacts_location(self.module, self.log_dirpath, logger=guest.logger)
+
+        commands: List[str] = []
+
+        if self.single_session:
+            result = self._run_single_session(guest, logs_location, commands)
+
+        else:
+            result = self._run_commands(guest, logs_location, commands)
+
+        if result is not None:
+            return result
+
+        # record the install commands
+        with open(os.path.join(self.log_dirpath, INSTALL_COMMANDS_FILE), 'a') as f:
+            for command in commands:
+                f.write(command + '\n')
+
+        return Ok(None)
+
+    def _run_commands(self,
+                      guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+                      logs_location: Optional[str],
+                      commands: List[str]) -> Optional[Result[None, SUTInstallationFailedError]]:
+        """
+        Run steps one command at a time.
+        """
 
         try:
             guest.execute('command -v dnf')
@@ -117,109 +310,325 @@ class SUTInstallation(object):
         except gluetool.glue.GlueCommandError:
             dnf_present = False
 
-        if not os.path.exists(self.log_dirpath):
-            os.mkdir(self.log_dirpath)
+        for i, step in enumerate(self.steps):
+            guest.info(step.label)
 
-        logs_location = artifacts_location(self.module, self.log_dirpath, logger=guest.logger)
+            result = self._run_local_step(guest, i, step, dnf_present, logs_location, commands)
+
+            if result is not None:
+                return result
+
+        return None
+
+    def _run_local_step(self,
+                        guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+                        index: int,
+                        step: SUTStep,
+                        dnf_present: bool,
+                        logs_location: Optional[str],
+                        commands: List[str]) -> Optional[Result[None, SUTInstallationFailedError]]:
+        """
+        Run all commands of a step, each command on its own, locally or over a new SSH session.
+        """
+
+        log_filepath = self._log_filepath(self.log_dirpath, index, step)
+        executor = self._executor(guest, step)
+
+        for item, command in self._step_commands(step, self._translate_command(step.command, dnf_present)):
+            commands.append(command)
+
+            result = self._run_command(
+                guest, step, item, command, log_filepath, executor, logs_location, dnf_present
+            )
+
+            if result is not None:
+                return result
+
+        return None
+
+    def _run_single_session(self,
+                            guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+                            logs_location: Optional[str],
+                            commands: List[str]) -> Optional[Result[None, SUTInstallationFailedError]]:
+        """
+        Run steps with as few SSH sessions as possible.
+
+        Consecutive remote steps are grouped into sessions, each session executed as a single script. A session
+        ends with a step with a callback, because the callback may fail the installation, and the following steps
+        must not run in such case. Local steps are executed on the worker, one command at a time.
+        """
+
+        dnf_present: Optional[bool] = None
+
+        session: List[Tuple[int, SUTStep]] = []
+
+        def _flush() -> Optional[Result[None, SUTInstallationFailedError]]:
+            nonlocal dnf_present
+
+            if not session:
+                return None
+
+            dnf_present, result = self._run_session(guest, session, logs_location, commands)
+
+            del session[:]
+
+            return result
 
         for i, step in enumerate(self.steps):
+            if not step.local:
+                session.append((i, step))
+
+                if step.callback is None:
+                    continue
+
+                result = _flush()
+
+                if result is not None:
+                    return result
+
+                continue
+
+            result = _flush()
+
+            if result is not None:
+                return result
+
+            if dnf_present is None:
+                try:
+                    guest.execute('command -v dnf')
+                    dnf_present = True
+                except gluetool.glue.GlueCommandError:
+                    dnf_present = False
+
             guest.info(step.label)
 
-            log_filename = '{}-{}.txt'.format(i, step.label.replace(' ', '-'))
-            log_filepath = os.path.join(self.log_dirpath, log_filename)
-
-            command = step.command
-
-            # replace yum with dnf in case dnf is present on guest
-            if dnf_present and command.startswith('yum'):
-                command = '{}{}'.format('dnf', command[3:])
-
-            # always use `--allowerasing` with `dnf` commands
-            if 'dnf ' in command:
-                if re.search(ALLOW_ERASING_PATTERN, command):
-                    command = re.sub(ALLOW_ERASING_PATTERN, r' \1 --allowerasing ', command)
-
-            # our `command` is assigned to this `cmd`, and here we convert it
-            # to string to work with guest.execute
-            # kwargs hack is to make executor do not pass env parameters if not needed
-            def executor(cmd: List[str]) -> ProcessOutput:
-                kwargs = {'env': step.env} if step.env else {}
-                if step.local:
-                    return Command(['bash', '-c', cmd[0]]).run(**kwargs)
-                else:
-                    return guest.execute(cmd[0], **kwargs)
-
-            if not step.items:
-                commands.append(command)
-                command_failed, error_message, output = run_and_log(
-                    [command],  # `command` is a string, we need to send it as List[str]
-                    log_filepath,
-                    executor=executor,
-                    callback=step.callback,
-                    label=step.label
-                )
+            result = self._run_local_step(guest, i, step, dnf_present, logs_location, commands)
 
-                if command_failed and not step.ignore_exception:
-                    return Error(
-                        SUTInstallationFailedError(
-                            self.artifact,
-                            guest,
-                            reason=error_message,
-                            installation_logs=self.log_dirpath,
-                            installation_logs_location=logs_location
-                        )
-                    )
+            if result is not None:
+                return result
 
-            for item in step.items:
-                # `step.command` contains `{}` to indicate place where item is substitute.
-                # e.g 'yum install -y {}'.format('ksh')
-                final_command = command.format(item)
-                commands.append(final_command)
-
-                command_failed, error_message, output = run_and_log(
-                    [final_command],  # `final_command` is a string, we need to send it as List[str]
-                    log_filepath,
-                    executor=executor,
-                    callback=step.callback,
-                    label=step.label
-                )
+        return _flush()
 
-                if not command_failed:
-                    continue
+    def _run_session(
+        self,
+        guest: gluetool_modules_framework.libs.guest.NetworkedGuest,
+        steps: List[Tuple[int, SUTStep]],
+        logs_location: Optional[str],
+        commands: List[str]
+    ) -> Tuple[bool, Optional[Result[None, SUTInstallationFailedError]]]:
+        """
+        Compile steps into a single script, execute it, and process outputs of its commands as if they were
+        executed one by one.
 
-                if step.ignore_exception:
-                    continue
+        Every command runs in its own subshell, its output is enclosed by markers carrying its index and exit
+        code. The script stops after the first failed command of a step whose failures are not ignored.
 
-                if error_message:
-                    self.logger.error(error_message)
-
-                    return Error(
-                        SUTInstallationFailedError(
-                            self.artifact,
-                            guest,
-                            items=item,
-                            reason=error_message,
-                            installation_logs=self.log_dirpath,
-                            installation_logs_location=logs_location
-                        )
-                    )
+        :returns: whether ``dnf`` is present on the guest, and ``None`` or an error describing the failure.
+        """
 
-                return Error(
-                    SUTInstallationFailedError(
-                        self.artifact,
-                        guest,
-                        items=item,
-                        installation_logs=self.log_dirpath,
-                        installation_logs_location=logs_location
-                    )
+        session = SUTSession(steps)
+
+        guest.info('running {} in a single session'.format(', '.join(step.label for _, step in steps)))
+
+        try:
+            output = guest.execute('bash -c {}'.format(shlex.quote(session.script)))
+
+        except gluetool.glue.GlueCommandError as exc:
+            output = exc.output
+
+        dnf_present, outputs, leftover = session.parse(output)
+
+        announced = set()
+        recovered = False
+
+        for index, (i, step, item, yum_command, dnf_command) in enumerate(session.commands):
+            if i not in announced:
+                guest.info(step.label)
+                announced.add(i)
+
+            command = dnf_command if dnf_present else yum_command
+            commands.append(command)
+
+            command_output = outputs.get(index)
+
+            # The session stopped after a batch command which failed, but whose items then passed one by one.
+            # Following commands did not run, run them on their own.
+            if command_output is None and recovered:
+                result = self._run_command(
+                    guest, step, item, command, self._log_filepath(self.log_dirpath, i, step),
+                    self._executor(guest, step), logs_location, dnf_present
                 )
 
-        # record the install commands
-        with open(os.path.join(self.log_dirpath, INSTALL_COMMANDS_FILE), 'a') as f:
-            for command in commands:
-                f.write(command + '\n')
+                if result is not None:
+                    return dnf_present, result
 
-        return Ok(None)
+                continue
+
+            # The session ended before reporting the result of this command. Report it as a failure, with whatever
+            # output the session produced, no matter whether the step ignores failures: following commands did
+            # not run either.
+            if command_output is None:
+                command_output = ProcessOutput([command], output.exit_code or 1, leftover[0], leftover[1], {})
+
+                step = step._replace(ignore_exception=False)
+
+            def executor(cmd: List[str], command_output: ProcessOutput = command_output) -> ProcessOutput:
+                if command_output.exit_code != 0:
+                    raise gluetool.glue.GlueCommandError(cmd, command_output)
+
+                return command_output
+
+            result = self._run_command(
+                guest, step, item, command, self._log_filepath(self.log_dirpath, i, step), executor, logs_location,
+                dnf_present
+            )
+
+            if result is not None:
+                return dnf_present, result
+
+            if command_output.exit_code != 0 and not step.ignore_exception:
+                recovered = True
+
+        return dnf_present, None
+
+
+class SUTSession(object):
+    """
+    Script running multiple SUT installation commands in a single shell session.
+
+    :param list steps: pairs of step indices and steps.
+    """
+
+    def __init__(self, steps: List[Tuple[int, SUTStep]]) -> None:
+
+        self.token = '__SUT_{}'.format(uuid.uuid4().hex)
+
+        #: Commands of the session: index of step, step, item, command for yum and command for dnf.
+        self.commands: List[Tuple[int, SUTStep, Optional[str], str, str]] = []
+
+        for i, step in steps:
+            yum_commands = SUTInstallation._step_commands(
+                step, SUTInstallation._translate_command(step.command, False)
+            )
+            dnf_commands = SUTInstallation._step_commands(
+                step, SUTInstallation._translate_command(step.command, True)
+            )
+
+            for (item, yum_command), (_, dnf_command) in zip(yum_commands, dnf_commands):
+                self.commands.append((i, step, item, yum_command, dnf_command))
+
+    def _marker(self, *fields: Any) -> str:
+
+        return '_'.join([self.token] + [str(field) for field in fields])
+
+    @property
+    def script(self) -> str:
+
+        lines = [
+            'if command -v dnf >/dev/null 2>&1; then sut_dnf=1; else sut_dnf=0; fi',
+            'echo "{}_$sut_dnf"'.format(self._marker('DNF'))
+        ]
+
+        for index, (_, step, _, yum_command, dnf_command) in enumerate(self.commands):
+            env = ''.join(
+                'export {}={}; '.format(name, shlex.quote(value)) for name, value in sorted(step.env.items())
+            )
+
+            begin = shlex.quote(self._marker('BEGIN', index))
+            end = self._marker('END', index)
+
+            lines += [
+                'echo {0}; echo {0} >&2'.format(begin)
+            ]
+
+            if yum_command == dnf_command:
+                lines += ['({}{}\n) </dev/null'.format(env, yum_command)]
+
+            else:
+                lines += [
+                    'if [ "$sut_dnf" = 1 ]; then',
+                    '({}{}\n) </dev/null'.format(env, dnf_command),
+                    'else',
+                    '({}{}\n) </dev/null'.format(env, yum_command),
+                    'fi'
+                ]
+
+            # The newline separates the marker from output not terminated by a newline, and it is removed
+            # when parsing the output.
+            lines += [
+                'sut_rc=$?',
+                'printf "\\n%s_%s\\n" {0} "$sut_rc"; printf "\\n%s_%s\\n" {0} "$sut_rc" >&2'.format(end)
+            ]
+
+            if not step.ignore_exception:
+                lines += ['[ "$sut_rc" = 0 ] || exit "$sut_rc"']
+
+        return '\n'.join(lines) + '\n'
+
+    def _split(self, stream: str) -> Tuple[Dict[int, Tuple[str, int]], str]:
+        """
+        Split output stream of the session into outputs of commands.
+
+        :returns: mapping between command indices and their outputs and exit codes, and the output following
+            the last finished command.
+        """
+
+        outputs: Dict[int, Tuple[str, int]] = {}
+        leftover = stream
+
+        for index in range(len(self.commands)):
+            begin = '{}\n'.format(self._marker('BEGIN', index))
+            end = '\n{}_'.format(self._marker('END', index))
+
+            start = leftover.find(begin)
+
+            if start == -1:
+                break
+
+            start += len(begin)
+            stop = leftover.find(end, start)
+
+            if stop == -1:
+                leftover = leftover[start:]
+                break
+
+            exit_code, _, rest = leftover[stop + len(end):].partition('\n')
+
+            outputs[index] = (leftover[start:stop], int(exit_code))
+            leftover = rest
+
+        return outputs, leftover
+
+    def parse(self, output: ProcessOutput) -> Tuple[bool, Dict[int, ProcessOutput], Tuple[str, str]]:
+        """
+        Parse output of the session.
+
+        :returns: whether ``dnf`` is present on the guest, outputs of commands which finished, and standard
+            and error outputs following the last finished command.
+        """
+
+        stdout = output.stdout or ''
+        stderr = output.stderr or ''
+
+        dnf_present = '{}_1\n'.format(self._marker('DNF')) in stdout
+
+        stdouts, stdout_leftover = self._split(stdout)
+        stderrs, stderr_leftover = self._split(stderr)
+
+        outputs = {}
+
+        for index, (stdout, exit_code) in stdouts.items():
+            _, _, _, yum_command, dnf_command = self.commands[index]
+
+            outputs[index] = ProcessOutput(
+                [dnf_command if dnf_present else yum_command],
+                exit_code,
+                stdout,
+                stderrs.get(index, ('', exit_code))[0],
+                {}
+            )
+
+        return dnf_present, outputs, (stdout_leftover, stderr_leftover)
 
 
 def check_ansible_sut_installation(ansible_output: Dict[str, Any],
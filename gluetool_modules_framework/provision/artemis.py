@@ -604,7 +604,11 @@ class ArtemisGuest(NetworkedGuest):
                                            port=port,
                                            username=username,
                                            key=key,
-                                           options=options)
+                                           options=options,
+                                           control_path_dir=(workdir or '.') if module.option('ssh-multiplexing')
+                                           else None,
+                                           ssh_backend=module.option('ssh-backend')
+                                           or NetworkedGuest.SSH_BACKEND_OPENSSH)
         assert module.api
 
         self.artemis_id = guestname
@@ -760,6 +764,8 @@ class ArtemisGuest(NetworkedGuest):
 
         self.info("image snapshot '{}' restored".format(snapshot.name))
 
+        self.reset_facts()
+
         return self
 
     def _release_snapshots(self) -> None:
@@ -781,6 +787,7 @@ class ArtemisGuest(NetworkedGuest):
         # TFT-3841 - make sure guest destroy is not interrupted
         with self._module.shared('pipeline_cancellation_lock') or nullcontext():
             self.stop_guest_logging()
+            self.close_connection()
 
             if self._module.option('keep'):
                 self.api.dump_events(self)
@@ -1044,6 +1051,21 @@ class ArtemisProvisioner(gluetool.Module):
             'ssh-key': {
                 'help': 'SSH key that is used to connect to the machine',
                 'type': str
+            },
+            'ssh-multiplexing': {
+                'help': """
+                        Share a single SSH connection between all commands and copies for each guest. The control
+                        socket is created in the guest working directory.
+                        """,
+                'action': 'store_true'
+            },
+            'ssh-backend': {
+                'help': """
+                        How to run commands and copy files on guests, ``openssh`` runs ``ssh`` and ``scp`` commands,
+                        ``paramiko`` keeps a connection open in the pipeline process (default: %(default)s).
+                        """,
+                'choices': (NetworkedGuest.SSH_BACKEND_OPENSSH, NetworkedGuest.SSH_BACKEND_PARAMIKO),
+                'default': NetworkedGuest.SSH_BACKEND_OPENSSH
             }
         }),
         ('Provisioning options', {
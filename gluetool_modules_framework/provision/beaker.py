@@ -47,6 +47,7 @@ from gluetool.result import Result
 from gluetool.utils import cached_property, normalize_bool_option, normalize_multistring_option, normalize_path, \
     load_yaml, dict_update
 from gluetool_modules_framework.libs.guest import NetworkedGuest
+from gluetool_modules_framework.helpers.rules_engine import precompile_rules
 
 import gluetool_modules_framework.libs
 from gluetool_modules_framework.libs import strptime
@@ -208,7 +209,8 @@ class BeakerGuest(NetworkedGuest):
                 connect_timeout=self._module.option('activation-timeout'),
                 connect_tick=self._module.option('activation-tick'),
                 echo_timeout=self._module.option('echo-timeout'), echo_tick=self._module.option('echo-tick'),
-                boot_timeout=self._module.option('boot-timeout'), boot_tick=self._module.option('boot-tick')
+                boot_timeout=self._module.option('boot-timeout'), boot_tick=self._module.option('boot-tick'),
+                single_probe=bool(self._module.option('single-probe'))
             )
 
         except GlueError as exc:
@@ -454,6 +456,13 @@ class BeakerProvisioner(gluetool.Module):
             'setup-provisioned': {
                 'help': "Setup guests after provisioning them. See 'guest-setup' module.",
                 'action': 'store_true'
+            },
+            'single-probe': {
+                'help': """
+                        Check guest shell and boot process together, with a single command, instead of running
+                        a command for each check.
+                        """,
+                'action': 'store_true'
             }
         }),
         ('Workarounds', {
@@ -549,7 +558,7 @@ class BeakerProvisioner(gluetool.Module):
         if not self.option('degraded-services-map'):
             return []
 
-        return load_yaml(self.option('degraded-services-map'), logger=self.logger)
+        return precompile_rules(load_yaml(self.option('degraded-services-map'), logger=self.logger))
 
     @cached_property
     def static_guests(self) -> List[GuestDefinition]:
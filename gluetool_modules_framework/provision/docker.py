@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import random
+import shlex
+import tempfile
 import time
 
 import gluetool
@@ -308,6 +310,60 @@ class DockerGuest(gluetool_modules_framework.libs.guest.Guest):
 
         return self._execute_shell(['docker', 'cp', '{}:{}'.format(self._container.id, src), dst])
 
+    def copy_many_to(self, srcs: List[str], dst: str, compress: bool = False, **kwargs: Any) -> int:
+        """
+        Copy files and trees into a directory in the container, uploading a single tar archive via Docker API.
+        """
+
+        self.debug("copy to the guest: {} => '{}'".format(', '.join("'{}'".format(src) for src in srcs), dst))
+
+        # Docker API extracts the archive into an existing directory only
+        self.execute('mkdir -p {}'.format(shlex.quote(dst)))
+
+        assert self._container is not None
+
+        # Docker API wants to know the size of the archive, spool it into a file rather than keep it in memory
+        with tempfile.TemporaryFile() as archive:
+            stream = gluetool_modules_framework.libs.guest.CountingWriter(archive)
+
+            gluetool_modules_framework.libs.guest.write_tar_stream(stream, srcs, compress=compress)
+
+            archive.seek(0)
+
+            if not self._container.put_archive(dst, archive):
+                raise GlueError("Failed to copy files to '{}' in the container".format(dst))
+
+        self.debug('transferred {} bytes'.format(stream.count))
+
+        return stream.count
+
+    def copy_many_from(self, srcs: List[str], dst: str, compress: bool = False, **kwargs: Any) -> int:
+        """
+        Copy files and trees from the container into a local directory, downloading tar archives via Docker API.
+        Docker API does not compress the archives, ``compress`` is ignored.
+        """
+
+        self.debug("copy from the guest: {} => '{}'".format(', '.join("'{}'".format(src) for src in srcs), dst))
+
+        if self._container is None:
+            self._create_container()
+
+        assert self._container is not None
+
+        count = 0
+
+        for src in srcs:
+            chunks, _ = self._container.get_archive(src)
+            stream = gluetool_modules_framework.libs.guest.CountingReader(chunks)
+
+            gluetool_modules_framework.libs.guest.extract_tar_stream(stream, dst)
+
+            count += stream.count
+
+        self.debug('transferred {} bytes'.format(count))
+
+        return count
+
     def add_volume(self, host_path: str, guest_path: str, mode: str = 'ro') -> None:
         """
         Add a volume that should be mounted when running a command.
@@ -389,6 +389,65 @@ def test_detect_ansible_interpreter(module, local_guest, monkeypatch):
     ], logger=local_guest.logger)
 
 
+def test_detect_ansible_interpreter_cached(module, local_guest, monkeypatch):
+    mock_output = MagicMock(exit_code=0, stdout='/usr/bin/python3', stderr='')
+
+    mock_command_init = MagicMock(return_value=None)
+    mock_command_run = MagicMock(return_value=mock_output)
+
+    monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
+    monkeypatch.setattr(gluetool.utils.Command, 'run', mock_command_run)
+
+    assert module.detect_ansible_interpreter(local_guest) == ['/usr/bin/python3']
+    assert module.detect_ansible_interpreter(local_guest) == ['/usr/bin/python3']
+
+    assert mock_command_run.call_count == 1
+
+    # e.g. a reboot
+    local_guest.reset_facts()
+
+    assert module.detect_ansible_interpreter(local_guest) == ['/usr/bin/python3']
+
+    assert mock_command_run.call_count == 2
+
+
+def test_detect_ansible_interpreter_failed_not_cached(module, local_guest, monkeypatch):
+    mock_command_init = MagicMock(return_value=None)
+    mock_command_run = MagicMock(side_effect=gluetool.GlueCommandError([], MagicMock(stdout='')))
+
+    monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
+    monkeypatch.setattr(gluetool.utils.Command, 'run', mock_command_run)
+
+    assert module.detect_ansible_interpreter(local_guest) == []
+    assert module.detect_ansible_interpreter(local_guest) == []
+
+    assert mock_command_run.call_count == 2
+
+
+def test_detect_ansible_interpreter_empty_not_cached(module, local_guest, monkeypatch):
+    mock_command_init = MagicMock(return_value=None)
+    mock_command_run = MagicMock(return_value=MagicMock(exit_code=0, stdout='/usr/bin/false', stderr=''))
+
+    monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
+    monkeypatch.setattr(gluetool.utils.Command, 'run', mock_command_run)
+
+    assert module.detect_ansible_interpreter(local_guest) == []
+    assert local_guest.ansible_interpreters is None
+
+    mock_command_run.return_value = MagicMock(exit_code=0, stdout='/usr/bin/python3', stderr='')
+
+    interpreters = module.detect_ansible_interpreter(local_guest)
+
+    assert interpreters == ['/usr/bin/python3']
+    assert mock_command_run.call_count == 2
+
+    # callers get a copy, modifying it does not change the cached interpreters
+    interpreters.append('/usr/bin/python2')
+
+    assert module.detect_ansible_interpreter(local_guest) == ['/usr/bin/python3']
+    assert mock_command_run.call_count == 2
+
+
 def test_render_extra_variables_templates(module, monkeypatch):
     templates = []
 
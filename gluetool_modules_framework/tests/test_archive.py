@@ -12,6 +12,7 @@ from mock import MagicMock, call
 
 import gluetool
 import gluetool_modules_framework.helpers.archive
+import gluetool_modules_framework.helpers.hide_secrets
 from gluetool_modules_framework.helpers.archive import Archive
 
 from . import create_module, check_loadable, patch_shared
@@ -97,7 +98,7 @@ def test_execute_destroy_ssh(monkeypatch, module):
     mock_shutil_copy2 = MagicMock()
     mock_shutil_rmtree = MagicMock()
     mock_requests = MagicMock()
-    mock_requests_head = mock_requests.return_value.__enter__.return_value.head
+    mock_requests_head = mock_requests.return_value.__enter__.return_value.Session.return_value.head
     mock_requests_head.return_value.status_code = 200
 
     monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
@@ -182,7 +183,7 @@ def test_destroy_daemon(monkeypatch, module):
     mock_shutil_copy2 = MagicMock()
     mock_shutil_rmtree = MagicMock()
     mock_requests = MagicMock()
-    mock_requests_head = mock_requests.return_value.__enter__.return_value.head
+    mock_requests_head = mock_requests.return_value.__enter__.return_value.Session.return_value.head
     mock_requests_head.return_value.status_code = 200
 
     monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
@@ -257,7 +258,7 @@ def test_execute_destroy_local(monkeypatch, module):
     mock_shutil_copy2 = MagicMock()
     mock_shutil_rmtree = MagicMock()
     mock_requests = MagicMock()
-    mock_requests_head = mock_requests.return_value.__enter__.return_value.head
+    mock_requests_head = mock_requests.return_value.__enter__.return_value.Session.return_value.head
     mock_requests_head.return_value.status_code = 200
 
     monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
@@ -331,7 +332,7 @@ def test_execute_destroy_s3(monkeypatch, module):
     mock_shutil_copy2 = MagicMock()
     mock_shutil_rmtree = MagicMock()
     mock_requests = MagicMock()
-    mock_requests_head = mock_requests.return_value.__enter__.return_value.head
+    mock_requests_head = mock_requests.return_value.__enter__.return_value.Session.return_value.head
     mock_requests_head.return_value.status_code = 200
 
     monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
@@ -401,7 +402,7 @@ def test_parallel_archiving(monkeypatch, module, log):
     mock_shutil_copy2 = MagicMock()
     mock_shutil_rmtree = MagicMock()
     mock_requests = MagicMock()
-    mock_requests_head = mock_requests.return_value.__enter__.return_value.head
+    mock_requests_head = mock_requests.return_value.__enter__.return_value.Session.return_value.head
     mock_requests_head.return_value.status_code = 200
 
     monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
@@ -459,3 +460,298 @@ def test_parallel_archiving(monkeypatch, module, log):
     mock_shutil_copy2.assert_called_with(
         '/archive-source-progress', '/tmp/dir/archive-source-progress', follow_symlinks=False
     )
+
+
+def test_destroy_batch_rsync(monkeypatch, module):
+    module._config['archive-mode'] = 'ssh'
+    module._config['batch-rsync'] = True
+
+    manifests = []
+
+    def _command_init(self, cmd, logger=None):
+        # Manifest is removed once rsync finishes, read it while we can
+        for arg in cmd:
+            if arg.startswith('--files-from='):
+                with open(arg[len('--files-from='):], 'r') as f:
+                    manifests.append(f.read().split('\0'))
+
+        self.executable = cmd
+
+    rsync_commands = []
+
+    def _run(self, *args, **kwargs):
+        rsync_commands.append(self.executable)
+        return 'Ok'
+
+    monkeypatch.setattr(gluetool.utils.Command, '__init__', _command_init)
+    monkeypatch.setattr(gluetool.utils.Command, 'run', _run)
+    monkeypatch.setattr(os.path, 'exists', lambda _: True)
+    monkeypatch.setattr(os.path, 'isdir', lambda path: path == '/dir-archive-source')
+    monkeypatch.setattr(gluetool_modules_framework.helpers.archive, 'glob', _mock_glob)
+
+    module._request_id = 'request-id'
+    module.archive_stage('destroy')
+
+    batch_commands = [cmd for cmd in rsync_commands if any(arg.startswith('--files-from=') for arg in cmd)]
+
+    assert len(batch_commands) == 1
+    assert batch_commands[0][:4] == ['rsync', '--rsync-option', '--timeout=10', '--recursive']
+    assert batch_commands[0][-3:] == ['--from0', '/', 'https://artifacts.example.com:/artifacts-root/request-id/']
+
+    assert manifests == [[
+        'archive-source',
+        'dir-archive-source',
+        'dir-archive-source/1',
+        'dir-archive-source/2',
+        'dir-archive-source/3',
+        'archive-excludes/exclude-2'
+    ]]
+
+    # entries with destination are still synced one by one
+    assert ['rsync', '--rsync-option', '--timeout=10', '--chmod=666', '/env-archive-source',
+            'https://artifacts.example.com:/artifacts-root/request-id/env-dest'] in rsync_commands
+    assert ['rsync', '--rsync-option', '--timeout=10', '/archive-source',
+            'https://artifacts.example.com:/artifacts-root/request-id/dest'] in rsync_commands
+
+
+def test_source_signature(tmpdir):
+    directory = tmpdir.mkdir('dir')
+    log = directory.join('log.txt')
+    log.write('foo')
+
+    signature = gluetool_modules_framework.helpers.archive.source_signature(str(directory))
+
+    assert signature[:2] == (1, 3)
+    assert gluetool_modules_framework.helpers.archive.source_signature(str(log))[:2] == (1, 3)
+    assert gluetool_modules_framework.helpers.archive.source_signature(str(tmpdir.join('missing'))) is None
+
+    log.write('foobar')
+    assert gluetool_modules_framework.helpers.archive.source_signature(str(directory)) != signature
+
+
+def test_progress_change_tracking(monkeypatch, module, tmpdir):
+    progress_log = tmpdir.join('progress.log')
+    progress_log.write('foo')
+
+    mock_command_init = MagicMock(return_value=None)
+    mock_generate_results = MagicMock()
+
+    entry = MagicMock(id='entry', stage='running', state='ok', result='undefined', results=None)
+    refreshed_results = [['test1']]
+
+    def refresh_test_schedule_entry_results(schedule_entry):
+        schedule_entry.results = list(refreshed_results[-1])
+
+    monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
+    monkeypatch.setattr(gluetool.utils.Command, 'run', MagicMock(return_value='Ok'))
+    monkeypatch.setattr(module, 'source_destination_map', lambda: {'progress': [{'source': str(progress_log)}]})
+
+    patch_shared(monkeypatch, module, {'test_schedule': [entry]}, callables={
+        'hide_secrets': MagicMock(),
+        'generate_results': mock_generate_results,
+        'refresh_test_schedule_entry_results': refresh_test_schedule_entry_results
+    })
+
+    module._request_id = 'request-id'
+
+    # disabled by default, everything is synced and regenerated
+    module.archive_stage('progress')
+    module.archive_stage('progress')
+    assert mock_command_init.call_count == 2
+    assert mock_generate_results.call_count == 2
+
+    module._config['progress-change-tracking'] = True
+
+    module.archive_stage('progress')
+    assert mock_command_init.call_count == 3
+    assert mock_generate_results.call_count == 3
+
+    # nothing changed, nothing to do
+    module.archive_stage('progress')
+    assert mock_command_init.call_count == 3
+    assert mock_generate_results.call_count == 3
+
+    progress_log.write('foobar')
+
+    module.archive_stage('progress')
+    assert mock_command_init.call_count == 4
+    assert mock_generate_results.call_count == 3
+
+    refreshed_results.append(['test1', 'test2'])
+
+    module.archive_stage('progress')
+    assert mock_command_init.call_count == 4
+    assert mock_generate_results.call_count == 4
+
+
+def _s3_upload_sources(tmpdir):
+    logs = tmpdir.mkdir('logs')
+    logs.join('a.log').write('a')
+    logs.mkdir('plan').join('b.log').write('b')
+
+    tmpdir.join('results.xml').write('results')
+
+    return logs, tmpdir.join('results.xml')
+
+
+def test_s3_uploads_boto3(monkeypatch, module, tmpdir):
+    logs, results = _s3_upload_sources(tmpdir)
+
+    mock_boto3 = MagicMock()
+    mock_client = mock_boto3.client.return_value
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.archive, 'boto3', mock_boto3)
+    patch_shared(monkeypatch, module, {}, callables={'hide_secrets': MagicMock()})
+
+    module._config['s3-upload-workers'] = 4
+    module._config['s3-multipart-threshold'] = 8
+    module._config['aws-endpoint-url'] = 'http://localhost:9000'
+    module._request_id = 'request-id'
+
+    module.run_s3_uploads([
+        (str(logs), None), (str(results), 'results/results.xml'), (str(results), 'results/latest/')
+    ])
+
+    mock_boto3.client.assert_called_once_with(
+        's3',
+        region_name='aws-region',
+        aws_access_key_id='aws-access-key-id',
+        aws_secret_access_key='aws-secret',
+        endpoint_url='http://localhost:9000'
+    )
+
+    logs_key = os.path.join('artifacts-root', 'request-id', str(logs).lstrip('/'))
+
+    assert sorted(upload.args[:3] for upload in mock_client.upload_file.call_args_list) == sorted([
+        (os.path.join(str(logs), 'a.log'), 'aws-s3-bucket', os.path.join(logs_key, 'a.log')),
+        (os.path.join(str(logs), 'plan', 'b.log'), 'aws-s3-bucket', os.path.join(logs_key, 'plan', 'b.log')),
+        (str(results), 'aws-s3-bucket', 'artifacts-root/request-id/results/results.xml'),
+        (str(results), 'aws-s3-bucket', 'artifacts-root/request-id/results/latest/results.xml')
+    ])
+
+
+def test_s3_uploads_cli(monkeypatch, module, tmpdir):
+    logs, results = _s3_upload_sources(tmpdir)
+
+    mock_command_init = MagicMock(return_value=None)
+    mock_command_run = MagicMock(side_effect=[gluetool.GlueCommandError(['aws'], MagicMock(exit_code=1)), 'Ok'])
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.archive, 'boto3', None)
+    monkeypatch.setattr(gluetool.utils.Command, '__init__', mock_command_init)
+    monkeypatch.setattr(gluetool.utils.Command, 'run', mock_command_run)
+    patch_shared(monkeypatch, module, {}, callables={'hide_secrets': MagicMock()})
+
+    module._config['s3-upload-workers'] = 2
+    module._request_id = 'request-id'
+
+    # the first upload fails and is retried
+    module.run_s3_uploads([(str(results), 'results.xml')])
+
+    assert mock_command_init.call_args_list == [
+        call(['aws', 's3', 'cp', '--aws-option', str(results),
+              's3://aws-s3-bucket/artifacts-root/request-id/results.xml'], logger=module.logger)
+    ] * 2
+
+
+def test_verify_archivations(monkeypatch, module, log):
+    available = {
+        'https://artifacts.example.com/results.xml': [200],
+        'https://artifacts.example.com/logs/a.log': [404, 200],
+        'https://artifacts.example.com/logs/b.log': [404, 404, 404]
+    }
+
+    def _head(target, allow_redirects=False):
+        assert allow_redirects is True
+
+        statuses = available[target]
+        return MagicMock(status_code=statuses.pop(0) if len(statuses) > 1 else statuses[0])
+
+    mock_requests = MagicMock()
+    mock_session = mock_requests.return_value.__enter__.return_value.Session.return_value
+    mock_session.head.side_effect = _head
+
+    monkeypatch.setattr(gluetool.utils, 'requests', mock_requests)
+
+    module._config['verify-timeout'] = 3
+
+    module.verify_archivations(['/results.xml', '/logs/a.log', '/logs/b.log', '/logs/a.log'])
+
+    heads = [head.args[0] for head in mock_session.head.call_args_list]
+
+    # verified targets are not checked again
+    assert heads.count('https://artifacts.example.com/results.xml') == 1
+    assert heads.count('https://artifacts.example.com/logs/a.log') == 2
+    assert heads.count('https://artifacts.example.com/logs/b.log') > 2
+
+    mock_session.close.assert_called_once_with()
+
+    assert log.match(
+        levelno=logging.ERROR,
+        message='Failed to verify archivation of 1 of 3 targets, e.g. https://artifacts.example.com/logs/b.log'
+    )
+
+
+def test_clone_snapshot(monkeypatch, module, tmpdir, log):
+    source = tmpdir.mkdir('source')
+    source.join('live.log').write('secret')
+    source.join('link').mksymlinkto('live.log')
+
+    snapshot_dir = tmpdir.mkdir('snapshot')
+
+    module._config['source-snapshot-method'] = 'clone'
+
+    def _hide_secrets_replace(search_path, keep_records=True):
+        assert keep_records is False
+
+        path = os.path.join(search_path, 'live.log')
+
+        with open(path + '.tmp', 'w') as f:
+            f.write('hidden')
+
+        os.replace(path + '.tmp', path)
+
+    patch_shared(monkeypatch, module, {}, callables={'hide_secrets': _hide_secrets_replace})
+
+    module._copy_source(str(source), str(snapshot_dir.join('source')))
+
+    snapshot_log = snapshot_dir.join('source', 'live.log')
+
+    assert snapshot_log.read() == 'secret'
+    assert os.readlink(str(snapshot_dir.join('source', 'link'))) == 'live.log'
+    assert sum(module._snapshot_bytes.values()) == len('secret')
+
+    module._hide_secrets(str(snapshot_dir.join('source')), snapshot=True)
+
+    # the original file is intact, no matter how the snapshot was created
+    assert snapshot_log.read() == 'hidden'
+    assert source.join('live.log').read() == 'secret'
+
+
+def test_clone_snapshot_copy(monkeypatch, module, tmpdir):
+    module._config['source-snapshot-method'] = 'clone'
+
+    # filesystem does not support reflinks
+    monkeypatch.setattr(gluetool_modules_framework.helpers.archive.fcntl, 'ioctl', MagicMock(side_effect=OSError))
+
+    hide_secrets_module = create_module(gluetool_modules_framework.helpers.hide_secrets.HideSecrets)[1]
+    hide_secrets_module._config.update({'retry-tick': 1, 'retry-timeout': 5, 'workers': 1})
+    hide_secrets_module.add_secrets('secret')
+
+    patch_shared(monkeypatch, module, {}, callables={'hide_secrets': hide_secrets_module.hide_secrets})
+
+    for name, content in (('secret.log', 'foo secret\n'), ('clean.log', 'foo\n')):
+        source, snapshot = tmpdir.join(name), tmpdir.join('snapshot-{}'.format(name))
+        source.write(content)
+
+        module._copy_source(str(source), str(snapshot))
+        module._hide_secrets(str(snapshot), snapshot=True)
+
+        # the live log is being written in the meantime
+        source.write('bar secret\n', mode='a')
+
+        assert snapshot.read() == content.replace('secret', 'hidden')
+        assert snapshot.stat().nlink == 1
+        assert source.read() == content + 'bar secret\n'
+
+    assert module._snapshot_bytes == {'cloned': 0, 'copied': len('foo secret\n') + len('foo\n')}
+    assert hide_secrets_module._scan_records == {}
@@ -236,9 +236,9 @@ def test_api_call(monkeypatch, module, log):
 
 
 @pytest.mark.parametrize('scenario', ['successful'], indirect=True)
-def test_pipeline_cancelled(module, scenario, log):
+def test_pipeline_cancelled(module, scenario, log, tmpdir):
     environment, guest, snapshot, exception = scenario
-    module.provision(environment)
+    module.provision(environment, workdir=str(tmpdir))
     assert log.match(levelno=logging.INFO, message='Created guest request with environment:\n{}')
     for key in guest.keys():
         assert getattr(module.guests[0], key) == guest[key]
@@ -255,11 +255,11 @@ def test_pipeline_cancelled(module, scenario, log):
 
 
 @pytest.mark.parametrize('scenario', ['pipeline_cancelled'], indirect=True)
-def test_pipeline_cancelled_before_provision_finished(module, scenario, log):
+def test_pipeline_cancelled_before_provision_finished(module, scenario, log, tmpdir):
     environment, guest, snapshot, exception = scenario
 
     with pytest.raises(GlueError, match="Guest couldn't be provisioned: Pipeline was cancelled, aborting"):
-        module.provision(environment)
+        module.provision(environment, workdir=str(tmpdir))
 
     assert log.match(levelno=logging.INFO, message='Created guest request with environment:\n{}')
 
@@ -648,10 +648,10 @@ def test_expand_post_install_script(module, input_script, expected_script):
 
 
 @pytest.mark.parametrize('scenario', ['successful'], indirect=True)
-def test_guest_destroy_acquires_pipeline_lock(monkeypatch, module, scenario):
+def test_guest_destroy_acquires_pipeline_lock(monkeypatch, module, scenario, tmpdir):
     """Test that guest.destroy() properly acquires the pipeline cancellation lock"""
     environment, _, _, _ = scenario
-    module.provision(environment)
+    module.provision(environment, workdir=str(tmpdir))
 
     # Mock the shared method to track calls
     mock_lock = MagicMock()
@@ -670,10 +670,10 @@ def test_guest_destroy_acquires_pipeline_lock(monkeypatch, module, scenario):
 
 
 @pytest.mark.parametrize('scenario', ['successful'], indirect=True)
-def test_guest_destroy_fallback_to_nullcontext(monkeypatch, module, scenario):
+def test_guest_destroy_fallback_to_nullcontext(monkeypatch, module, scenario, tmpdir):
     """Test that guest.destroy() falls back to nullcontext when no lock is available"""
     environment, _, _, _ = scenario
-    module.provision(environment)
+    module.provision(environment, workdir=str(tmpdir))
 
     # Mock shared to return None (no lock available)
     patch_shared(monkeypatch, module, {
@@ -685,10 +685,10 @@ def test_guest_destroy_fallback_to_nullcontext(monkeypatch, module, scenario):
 
 
 @pytest.mark.parametrize('scenario', ['successful'], indirect=True)
-def test_guest_destroy_operations_within_lock_context(monkeypatch, module, scenario):
+def test_guest_destroy_operations_within_lock_context(monkeypatch, module, scenario, tmpdir):
     """Test that guest destroy operations happen within the lock context"""
     environment, _, _, _ = scenario
-    module.provision(environment)
+    module.provision(environment, workdir=str(tmpdir))
 
     # Track the order of operations
     call_order = []
@@ -1,8 +1,18 @@
 # Copyright Contributors to the Testing Farm project.
 # SPDX-License-Identifier: Apache-2.0
 
+import http.server
+import shutil
+import threading
+
 import pytest
-from gluetool_modules_framework.libs.artifacts import splitFilename
+
+from gluetool.utils import Command
+
+from gluetool_modules_framework.libs.artifacts import packages_download_cmd, splitFilename
+
+CURL_CMD = 'curl -sL --retry 5 --remote-name-all -w "%{http_code} %{url_effective} %{filename_effective}\\n"'
+AWK_CMD = 'awk -v pkglist="pkglist" \'{if ($1 == "200") {print "Downloaded:", $2; print $3 >> pkglist}}\''
 
 
 @pytest.mark.parametrize('nevr,parsed_nevr', [
@@ -84,3 +94,65 @@ from gluetool_modules_framework.libs.artifacts import splitFilename
 ])
 def test_splitFilename(nevr, parsed_nevr):
     assert splitFilename(nevr) == parsed_nevr
+
+
+@pytest.mark.parametrize('kwargs, expected', [
+    ({'rpm_urls': ['a', 'b', 'c']}, 'cd dir && {} a b c | {}'.format(CURL_CMD, AWK_CMD)),
+    (
+        {'rpm_urls': ['a', 'b', 'c'], 'parallel': 2},
+        'cd dir && echo a b c | xargs -n1 -P2 {} | {}'.format(CURL_CMD, AWK_CMD)
+    ),
+    ({'rpm_urls': ['a'], 'parallel': 2}, 'cd dir && {} a | {}'.format(CURL_CMD, AWK_CMD)),
+    ({'rpm_urls_file': 'urls'}, 'cd dir && cat urls | xargs -n1 {} | {}'.format(CURL_CMD, AWK_CMD)),
+    ({'rpm_urls_file': 'urls', 'parallel': 4}, 'cd dir && cat urls | xargs -n1 -P4 {} | {}'.format(CURL_CMD, AWK_CMD)),
+])
+def test_packages_download_cmd(kwargs, expected):
+    assert packages_download_cmd('dir', **kwargs) == expected
+
+
+def test_packages_download_cmd_invalid():
+    with pytest.raises(ValueError):
+        packages_download_cmd('dir')
+
+    with pytest.raises(ValueError):
+        packages_download_cmd('dir', rpm_urls=['a'], parallel=0)
+
+
+@pytest.mark.skipif(shutil.which('curl') is None, reason='curl not available')
+@pytest.mark.parametrize('parallel', [1, 4])
+def test_packages_download_cmd_run(tmpdir, parallel):
+    origin_dir = tmpdir.mkdir('origin')
+
+    # enough packages for output of a multi-URL curl process to exceed its stdout buffer
+    names = ['pkg{}.rpm'.format(i) for i in range(400)]
+
+    for name in names:
+        origin_dir.join(name).write(name)
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super(Handler, self).__init__(*args, directory=str(origin_dir), **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    urls = ['http://127.0.0.1:{}/{}'.format(server.server_address[1], name) for name in names + ['missing.rpm']]
+
+    try:
+        tmpdir.join('urls').write(' '.join(urls))
+
+        for i, kwargs in enumerate([{'rpm_urls': urls}, {'rpm_urls_file': str(tmpdir.join('urls'))}]):
+            download_dir = tmpdir.mkdir('download-{}'.format(i))
+
+            Command(['bash', '-c', packages_download_cmd(str(download_dir), parallel=parallel, **kwargs)]).run()
+
+            # failed downloads are not recorded
+            assert sorted(download_dir.join('pkglist').read().splitlines()) == sorted(names)
+            assert all(download_dir.join(name).read() == name for name in names)
+
+    finally:
+        server.shutdown()
+        server.server_close()
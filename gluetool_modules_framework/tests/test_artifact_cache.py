@@ -0,0 +1,365 @@
+# Copyright Contributors to the Testing Farm project.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import http.server
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+from mock import MagicMock
+
+import gluetool
+from gluetool.utils import Command
+
+from gluetool_modules_framework.helpers.artifact_cache import ArtifactCache, file_digest
+from gluetool_modules_framework.helpers.install_repository import InstallRepository
+from gluetool_modules_framework.libs.artifacts import cached_urls
+
+from . import create_module, patch_shared
+
+
+@pytest.fixture(name='origin')
+def fixture_origin(tmpdir):
+    """
+    HTTP server serving artifacts, recording requested paths and response codes.
+    """
+
+    origin_dir = tmpdir.mkdir('origin')
+    requested = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super(Handler, self).__init__(*args, directory=str(origin_dir), **kwargs)
+
+        def send_response(self, code, message=None):
+            requested.append((self.path, code))
+            super(Handler, self).send_response(code, message=message)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1]), origin_dir, requested
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(name='module')
+def fixture_module(tmpdir):
+    _, module = create_module(ArtifactCache)
+
+    module._config.update({
+        'cache-dir': str(tmpdir.join('cache')),
+        'download-workers': 4,
+        'download-timeout': 10,
+        'listen-address': '127.0.0.1',
+        'listen-port': 0,
+        'guest-url': 'http://127.0.0.1:{port}',
+        'guest-check-timeout': 5
+    })
+
+    yield module
+
+    module.destroy()
+
+
+@pytest.fixture(name='guest')
+def fixture_guest():
+    """
+    Guest running commands locally.
+    """
+
+    return MagicMock(name='guest0', execute=MagicMock(side_effect=lambda cmd: Command(['bash', '-c', cmd]).run()))
+
+
+def test_cache_urls(module, guest, origin, tmpdir):
+    origin_url, origin_dir, requested = origin
+
+    for name in ('foo-1.0-1.noarch.rpm', 'bar-1.0-1.noarch.rpm'):
+        origin_dir.join(name).write(name * 1000)
+
+    urls = ['{}/{}'.format(origin_url, name) for name in ('foo-1.0-1.noarch.rpm', 'bar-1.0-1.noarch.rpm')]
+
+    mapping = module.cache_urls(guest, urls)
+
+    assert sorted(mapping.keys()) == sorted(urls)
+
+    for url, cached_url in mapping.items():
+        name = url.split('/')[-1]
+        digest = hashlib.sha256((name * 1000).encode()).hexdigest()
+
+        assert cached_url == 'http://127.0.0.1:{}/{}/{}'.format(module.server_port, digest, name)
+        assert requests.get(cached_url).content == (name * 1000).encode()
+        assert file_digest(module.content_path(digest)) == digest
+
+    # downloaded just once
+    assert module.cache_urls(guest, urls) == mapping
+    assert len(requested) == 2
+
+    # another pipeline sharing the cache directory does not download the artifacts either, it just checks
+    # they did not change
+    _, another_module = create_module(ArtifactCache)
+    another_module._config.update(module._config)
+
+    try:
+        another_mapping = another_module.cache_urls(guest, urls)
+
+    finally:
+        another_module.destroy()
+
+    # the same content, served by another server
+    def _paths(mapping):
+        return [url.split('/', 3)[3] for url in mapping.values()]
+
+    assert _paths(another_mapping) == _paths(mapping)
+    assert [code for _, code in requested] == [200, 200, 304, 304]
+
+    assert requests.get('http://127.0.0.1:{}/{}/foo.rpm'.format(module.server_port, '0' * 64)).status_code == 404
+
+
+def test_cache_urls_filename(module, guest, origin, tmpdir):
+    origin_url, origin_dir, _ = origin
+
+    for name in ('libstdc++-1.0-1.x86_64.rpm', 'gcc-c++-1.0-1.x86_64.rpm'):
+        origin_dir.join(name).write(name)
+
+    # the second URL is already encoded
+    urls = [
+        '{}/libstdc++-1.0-1.x86_64.rpm'.format(origin_url),
+        '{}/gcc-c%2B%2B-1.0-1.x86_64.rpm?foo=bar'.format(origin_url)
+    ]
+
+    mapping = module.cache_urls(guest, urls)
+
+    assert [cached_url.split('/')[-1] for cached_url in mapping.values()] == [
+        'libstdc++-1.0-1.x86_64.rpm', 'gcc-c%2B%2B-1.0-1.x86_64.rpm'
+    ]
+
+    # the guest saves files from the cache under the same names it would get from the original URLs
+    def _download(dirname, urls):
+        download_dir = tmpdir.mkdir(dirname)
+
+        Command(['curl', '-sSf', '--remote-name-all'] + urls).run(cwd=str(download_dir))
+
+        return sorted(os.listdir(str(download_dir)))
+
+    assert _download('direct', urls) == _download('cached', list(mapping.values()))
+
+
+def _pipeline(module):
+    _, another_module = create_module(ArtifactCache)
+    another_module._config.update(module._config)
+
+    return another_module
+
+
+def test_cache_urls_revalidate(module, guest, origin):
+    origin_url, origin_dir, requested = origin
+
+    origin_dir.join('foo.rpm').write('foo')
+
+    urls = ['{}/foo.rpm'.format(origin_url)]
+
+    module.cache_urls(guest, urls)
+
+    # the artifact changed since it was cached by the previous pipeline
+    origin_dir.join('foo.rpm').write('new foo')
+    os.utime(str(origin_dir.join('foo.rpm')), (time.time() + 10, time.time() + 10))
+
+    another_module = _pipeline(module)
+
+    try:
+        mapping = another_module.cache_urls(guest, urls)
+
+    finally:
+        another_module.destroy()
+
+    assert mapping[urls[0]].split('/')[3] == hashlib.sha256(b'new foo').hexdigest()
+    assert [code for _, code in requested] == [200, 200]
+
+    # with a known checksum, the server is not asked at all
+    another_module = _pipeline(module)
+
+    try:
+        another_module.cache_urls(guest, urls, checksums={urls[0]: hashlib.sha256(b'new foo').hexdigest()})
+
+    finally:
+        another_module.destroy()
+
+    assert len(requested) == 2
+
+
+def test_cache_urls_no_validators(module, guest, origin, monkeypatch):
+    origin_url, origin_dir, requested = origin
+
+    origin_dir.join('foo.rpm').write('foo')
+
+    urls = ['{}/foo.rpm'.format(origin_url)]
+
+    module.cache_urls(guest, urls)
+
+    # without validators, content cached by another pipeline cannot be trusted
+    module._update_index(urls[0], {'digest': hashlib.sha256(b'foo').hexdigest()})
+
+    another_module = _pipeline(module)
+
+    try:
+        another_module.cache_urls(guest, urls)
+
+    finally:
+        another_module.destroy()
+
+    assert [code for _, code in requested] == [200, 200]
+
+
+def test_cache_urls_exception(module, guest, origin, monkeypatch):
+    origin_url, origin_dir, requested = origin
+
+    origin_dir.join('foo.rpm').write('foo')
+
+    urls = ['{}/foo.rpm'.format(origin_url)]
+
+    monkeypatch.setattr(module, '_fetch', MagicMock(side_effect=KeyError('unexpected')))
+
+    assert module.cache_urls(guest, urls) == {urls[0]: urls[0]}
+    guest.warn.assert_called_once_with(
+        "Failed to cache '{}': 'unexpected', guest will download it directly".format(urls[0])
+    )
+
+
+def test_cache_urls_failed(module, guest, origin):
+    origin_url, origin_dir, requested = origin
+
+    origin_dir.join('foo.rpm').write('foo')
+
+    urls = ['{}/foo.rpm'.format(origin_url), '{}/missing.rpm'.format(origin_url)]
+
+    mapping = module.cache_urls(guest, urls, checksums={urls[0]: '0' * 64})
+
+    # checksum mismatch and download failure, both URLs are left untouched
+    assert mapping == {url: url for url in urls}
+
+    assert guest.warn.call_count == 2
+
+
+def test_unreachable(module, guest, origin):
+    origin_url, _, requested = origin
+
+    guest.execute.side_effect = gluetool.GlueCommandError(['curl'], MagicMock(exit_code=7))
+    module._config['guest-check-timeout'] = 1
+
+    urls = ['{}/foo.rpm'.format(origin_url)]
+
+    assert module.cache_urls(guest, urls) == {urls[0]: urls[0]}
+    assert not requested
+
+
+def test_unreachable_tunnel(module, guest):
+    guest.name = 'guest0'
+    guest.execute.side_effect = gluetool.GlueCommandError(['curl'], MagicMock(exit_code=7))
+
+    module._config.update({
+        'reverse-tunnel': True, 'reverse-tunnel-port': 8642, 'listen-address': None, 'guest-check-timeout': 1
+    })
+
+    assert module.listen_address == '127.0.0.1'
+    assert module.guest_url(guest) is None
+
+    # the tunnel is not needed anymore
+    guest.forward_remote_port.assert_called_once_with(8642, module.server_port)
+    guest.forward_remote_port.return_value.terminate.assert_called_once_with()
+    assert module._tunnels == {}
+
+
+@pytest.mark.parametrize('options, expected', [
+    ({}, '0.0.0.0'),
+    ({'reverse-tunnel': True}, '127.0.0.1'),
+    ({'reverse-tunnel': True, 'listen-address': '10.0.0.1'}, '10.0.0.1'),
+    ({'listen-address': '10.0.0.1'}, '10.0.0.1')
+])
+def test_listen_address(module, options, expected):
+    module._config.update(dict({'listen-address': None}, **options))
+
+    assert module.listen_address == expected
+
+
+def test_cached_urls(guest, monkeypatch):
+    _, install_module = create_module(InstallRepository)
+
+    assert cached_urls(install_module, guest, ['foo', 'bar']) == ['foo', 'bar']
+
+    patch_shared(monkeypatch, install_module, {'cache_urls': {'foo': 'cached-foo', 'bar': 'bar'}})
+
+    assert cached_urls(install_module, guest, ['foo', 'bar']) == ['cached-foo', 'bar']
+
+    install_module.shared = MagicMock(return_value={'foo': 'cached-foo'})
+
+    assert cached_urls(install_module, guest, ['foo'], checksums={'foo': 'a' * 64}) == ['cached-foo']
+    install_module.shared.assert_called_once_with('cache_urls', guest, ['foo'], checksums={'foo': 'a' * 64})
+
+
+def test_worker_address(module):
+    guest = MagicMock(hostname='127.0.0.1', port=22)
+
+    assert module._worker_address(guest) == '127.0.0.1'
+
+
+def test_index(module, tmpdir):
+    os.makedirs(module.cache_dir)
+
+    module._update_index('foo', {'digest': 'a' * 64, 'etag': '"foo"'})
+    module._update_index('bar', {'digest': 'b' * 64})
+
+    assert module._load_index() == {'foo': {'digest': 'a' * 64, 'etag': '"foo"'}, 'bar': {'digest': 'b' * 64}}
+
+    # entries of unknown format are ignored
+    tmpdir.join('cache', 'index.json').write('{"foo": "' + 'a' * 64 + '"}')
+
+    assert module._load_index() == {}
+
+
+def test_prune(module):
+    now = time.time()
+
+    def _content(digest, size, age):
+        path = module.content_path(digest)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+        os.utime(path, (now - age, now - age))
+
+        module._update_index(digest, {'digest': digest})
+
+    module._config.update({
+        'max-size': 1,
+        'max-age': 1
+    })
+
+    # used by the pipeline, never removed
+    _content('a' * 64, 1024 * 1024, 10 * 24 * 3600)
+    module._verified['a' * 64] = True
+
+    # too old
+    _content('b' * 64, 10, 2 * 24 * 3600)
+
+    # recently used, but exceeding the size limit
+    _content('c' * 64, 512 * 1024, 3600)
+    _content('d' * 64, 768 * 1024, 7200)
+
+    _content('e' * 64, 10, 60)
+
+    module._prune()
+
+    assert sorted(module._load_index()) == ['a' * 64, 'c' * 64, 'e' * 64]
+    assert not os.path.exists(module.content_path('b' * 64))
+    assert not os.path.exists(module.content_path('d' * 64))
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import concurrent.futures
+import gzip
 import logging
 
 import pytest
@@ -81,6 +82,35 @@ Finish: clean chroot
 Finish: run
 '''
 
+REPOMD = '''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo" xmlns:rpm="http://linux.duke.edu/metadata/rpm">
+  <data type="primary">
+    <location href="repodata/0123-primary.xml.gz"/>
+    <size>{size}</size>
+  </data>
+</repomd>
+'''
+
+PRIMARY = '''<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="3">
+  <package type="rpm">
+    <name>pycho</name>
+    <checksum type="sha256" pkgid="YES">{}</checksum>
+    <location href="00802020-pycho/pycho-0.84-1.fc28.x86_64.rpm"/>
+  </package>
+  <package type="rpm">
+    <name>pycho</name>
+    <checksum type="sha256" pkgid="YES">{}</checksum>
+    <location href="00802020-pycho/pycho-0.84-1.fc28.x86_64.src.rpm"/>
+  </package>
+  <package type="rpm">
+    <name>pycho</name>
+    <checksum type="sha256" pkgid="YES">{}</checksum>
+    <location href="00700000-pycho/pycho-0.83-1.fc28.x86_64.rpm"/>
+  </package>
+</metadata>
+'''.format('a' * 64, 'b' * 64, 'c' * 64)
+
 
 PROJECT_BUILDS = {
     'items': [
@@ -402,3 +432,53 @@ def test_expired(module, monkeypatch):
 
     with pytest.raises(gluetool.SoftGlueError, match=r"Error looking up rpm urls for 802020:fedora-28-x86_64, failed or expired build?"):
         module.execute()
+
+
+def _mock_repodata(monkeypatch, repomd, primary):
+    class dummy_request(object):
+
+        def __init__(self, source, content=None):
+            self.source = source
+            self.content = str(self.source) if content is None else content
+            self.status_code = 200
+
+        def json(self):
+            return self.source
+
+    def mocked_get(url):
+        if 'api_3/build-chroot' in url:
+            return dummy_request(BUILD_TASK_INFO)
+
+        if url.endswith('/fedora-28-x86_64/repodata/repomd.xml'):
+            return dummy_request(None, content=repomd)
+
+        if url.endswith('/fedora-28-x86_64/repodata/0123-primary.xml.gz'):
+            return dummy_request(None, content=primary)
+
+        return dummy_request(BUILD_INFO)
+
+    monkeypatch.setattr(gluetool_modules_framework.infrastructure.copr.requests, 'get', mocked_get)
+
+
+def test_checksums(module, monkeypatch):
+    _mock_repodata(monkeypatch, REPOMD.format(size=1024).encode(), gzip.compress(PRIMARY.encode()))
+
+    result_url = BUILD_TASK_INFO['result_url']
+
+    assert module.copr_api().get_checksums(802020, 'fedora-28-x86_64') == {
+        '{}pycho-0.84-1.fc28.x86_64.rpm'.format(result_url): 'a' * 64,
+        '{}pycho-0.84-1.fc28.x86_64.src.rpm'.format(result_url): 'b' * 64
+    }
+
+
+def test_checksums_too_large(module, monkeypatch):
+    _mock_repodata(monkeypatch, REPOMD.format(size=1024 * 1024 * 1024).encode(), gzip.compress(PRIMARY.encode()))
+
+    assert module.copr_api().get_checksums(802020, 'fedora-28-x86_64') == {}
+
+
+def test_checksums_invalid(module, monkeypatch, log):
+    _mock_repodata(monkeypatch, REPOMD.format(size=1024).encode(), PRIMARY.encode())
+
+    assert module.copr_api().get_checksums(802020, 'fedora-28-x86_64') == {}
+    assert log.match(message="Unable to find checksums in repository metadata: Not a gzipped file (b'<?')")
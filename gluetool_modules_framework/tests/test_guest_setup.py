@@ -111,7 +111,7 @@ def test_missing_required_shared(module, monkeypatch):
         'run_playbook': None
     })
 
-    assert_shared('evaluate_rules', module.execute)
+    assert_shared('evaluate_filter', module.execute)
 
 
 def test_setup(log, module, local_guest, monkeypatch, tmpdir):
@@ -175,7 +175,8 @@ def test_playbook_map(module, monkeypatch):
             'CONFIG_ROOT': '/some-config-root'
         }
     }, callables={
-        'evaluate_rules': rules_engine.evaluate_rules
+        'evaluate_rules': rules_engine.evaluate_rules,
+        'evaluate_filter': rules_engine.evaluate_filter
     })
 
     def load_yaml(path, logger):
@@ -203,3 +204,196 @@ def test_playbook_map(module, monkeypatch):
         None,
         gluetool_modules_framework.libs.guest_setup.GuestSetupStage.PRE_ARTIFACT_INSTALLATION
     ) == (['/some-config-root/default.yaml'], {'key': 'value'})
+
+
+MERGED_STDOUT = """PLAY [guest-setup stage pre-artifact-installation] ****
+
+PLAY [foo] ****
+TASK [foo task] ****
+
+PLAY [guest-setup stage pre-artifact-installation-workarounds] ****
+
+PLAY [bar] ****
+TASK [bar task] ****
+"""
+
+
+def test_split_merged_output():
+    split = MERGED_STDOUT.index('PLAY [guest-setup stage pre-artifact-installation-workarounds]')
+
+    assert gluetool_modules_framework.helpers.guest_setup.split_merged_output('warning\n' + MERGED_STDOUT) == {
+        'pre-artifact-installation': 'warning\n' + MERGED_STDOUT[:split],
+        'pre-artifact-installation-workarounds': MERGED_STDOUT[split:]
+    }
+
+    assert gluetool_modules_framework.helpers.guest_setup.split_merged_output('') == {}
+
+
+@pytest.mark.parametrize('merge_stages, error', [
+    (['pre-artifact-installation+foo'], 'Unknown stage in merged stages: pre-artifact-installation\\+foo'),
+    (['pre-artifact-installation-workarounds+artifact-installation'], 'Stage artifact-installation cannot be merged'),
+    (['pre-artifact-installation'], 'Merged stages must be two or more consecutive stages'),
+    (['pre-artifact-installation+post-artifact-installation'], 'Merged stages must be two or more consecutive stages'),
+    (
+        ['pre-artifact-installation+pre-artifact-installation-workarounds'] * 2,
+        'Stages cannot be merged more than once'
+    )
+])
+def test_merge_stages_sanity(module, merge_stages, error):
+    module._config['merge-stages'] = merge_stages
+
+    with pytest.raises(gluetool.GlueError, match=error):
+        module.sanity()
+
+
+@pytest.fixture(name='merged_module')
+def fixture_merged_module(module, monkeypatch):
+    module._config.update({
+        'playbooks': ['foo.yml', 'pre-artifact-installation-workarounds:bar.yml'],
+        'extra-vars': ['key=val', 'pre-artifact-installation-workarounds:key=val'],
+        'merge-stages': ['pre-artifact-installation+pre-artifact-installation-workarounds']
+    })
+
+    module.sanity()
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.guest_setup, 'artifacts_location',
+                        MagicMock(return_value='dummy-location'))
+
+    return module
+
+
+def test_setup_merged(merged_module, local_guest, monkeypatch, tmpdir):
+    fact_cache_dirpath = str(
+        tmpdir.join('ansible-facts-pre-artifact-installation+pre-artifact-installation-workarounds')
+    )
+
+    def dummy_run_playbook(playbook, guest, env=None, **kwargs):
+        assert gluetool.utils.load_yaml(playbook) == [
+            {
+                'name': 'guest-setup stage pre-artifact-installation',
+                'hosts': 'all',
+                'gather_facts': False,
+                'tags': ['always'],
+                'tasks': [
+                    {'name': 'set guest setup stage', 'set_fact': {'GUEST_SETUP_STAGE': 'pre-artifact-installation'}}
+                ]
+            },
+            {
+                'import_playbook': os.path.join(os.getcwd(), 'foo.yml'),
+                'tags': ['pre-artifact-installation']
+            },
+            {
+                'name': 'guest-setup stage pre-artifact-installation-workarounds',
+                'hosts': 'all',
+                'gather_facts': False,
+                'tags': ['always'],
+                'tasks': [
+                    {
+                        'name': 'set guest setup stage',
+                        'set_fact': {'GUEST_SETUP_STAGE': 'pre-artifact-installation-workarounds'}
+                    }
+                ]
+            },
+            {
+                'import_playbook': os.path.join(os.getcwd(), 'bar.yml'),
+                'tags': ['pre-artifact-installation-workarounds']
+            }
+        ]
+
+        # stage variables stay extra variables
+        assert kwargs['variables'] == {'key': 'val'}
+
+        # facts are cached per merged run, and never reused
+        assert env['ANSIBLE_CACHE_PLUGIN'] == 'jsonfile'
+        assert env['ANSIBLE_CACHE_PLUGIN_CONNECTION'] == fact_cache_dirpath
+        assert not os.path.exists(fact_cache_dirpath)
+
+        os.makedirs(fact_cache_dirpath)
+
+        assert kwargs['log_filepath'] == str(
+            tmpdir.join('guest-setup-output-pre-artifact-installation+pre-artifact-installation-workarounds.txt')
+        )
+
+        return MagicMock(execution_output=MagicMock(stdout=MERGED_STDOUT, stderr='some warning'))
+
+    run_playbook = MagicMock(side_effect=dummy_run_playbook)
+
+    patch_shared(monkeypatch, merged_module, {
+        'detect_ansible_interpreter': []
+    }, callables={
+        'run_playbook': run_playbook
+    })
+
+    outputs = {
+        stage: merged_module.setup_guest(local_guest, stage=stage, log_dirpath=str(tmpdir)).unwrap()
+        for stage in gluetool_modules_framework.libs.guest_setup.STAGES_ORDERED[:2]
+    }
+
+    # both stages played by a single run
+    run_playbook.assert_called_once()
+
+    for stage, stage_outputs in outputs.items():
+        assert len(stage_outputs) == 1
+        assert stage_outputs[0].stage == stage
+        assert stage_outputs[0].log_path == str(tmpdir.join('guest-setup-output-{}.txt'.format(stage.value)))
+
+    pre_log = tmpdir.join('guest-setup-output-pre-artifact-installation.txt').read()
+    workarounds_log = tmpdir.join('guest-setup-output-pre-artifact-installation-workarounds.txt').read()
+
+    assert 'foo task' in pre_log and 'bar task' not in pre_log and 'some warning' not in pre_log
+    assert 'bar task' in workarounds_log and 'some warning' in workarounds_log
+
+    # next setup plays the stages again
+    merged_module.setup_guest(local_guest, log_dirpath=str(tmpdir))
+
+    assert run_playbook.call_count == 2
+
+
+def test_setup_merged_failure(merged_module, local_guest, monkeypatch, tmpdir):
+    exc = gluetool.GlueError('Failure during Ansible playbook execution')
+    exc.ansible_output = MagicMock(stdout=MERGED_STDOUT, stderr='')
+
+    patch_shared(monkeypatch, merged_module, {
+        'detect_ansible_interpreter': []
+    }, callables={
+        'run_playbook': MagicMock(side_effect=exc)
+    })
+
+    stage = gluetool_modules_framework.libs.guest_setup.GuestSetupStage
+
+    # the first stage finished, the failure belongs to the second one
+    assert merged_module.setup_guest(
+        local_guest, stage=stage.PRE_ARTIFACT_INSTALLATION, log_dirpath=str(tmpdir)
+    ).is_ok
+
+    with pytest.raises(gluetool.GlueError, match='Failure during Ansible playbook execution'):
+        merged_module.setup_guest(local_guest, stage=stage.PRE_ARTIFACT_INSTALLATION_WORKAROUNDS,
+                                  log_dirpath=str(tmpdir))
+
+    assert not merged_module._merged_results
+
+
+def test_setup_merged_different_variables(merged_module, local_guest, monkeypatch, tmpdir, log):
+    merged_module._config['extra-vars'] = ['key=val']
+
+    run_playbook = MagicMock(return_value=MagicMock(execution_output=MagicMock(stdout='', stderr='')))
+
+    patch_shared(monkeypatch, merged_module, {
+        'detect_ansible_interpreter': []
+    }, callables={
+        'run_playbook': run_playbook
+    })
+
+    for stage in gluetool_modules_framework.libs.guest_setup.STAGES_ORDERED[:2]:
+        assert merged_module.setup_guest(local_guest, stage=stage, log_dirpath=str(tmpdir)).is_ok
+
+    # stages played one by one
+    assert log.match(message='variables of merged stages differ, playing stages separately')
+    assert [call[0][0] for call in run_playbook.call_args_list] == [
+        [os.path.join(os.getcwd(), 'foo.yml')],
+        [os.path.join(os.getcwd(), 'bar.yml')]
+    ]
+    assert [call[1]['variables'] for call in run_playbook.call_args_list] == [
+        {'key': 'val', 'GUEST_SETUP_STAGE': 'pre-artifact-installation'},
+        {'GUEST_SETUP_STAGE': 'pre-artifact-installation-workarounds'}
+    ]
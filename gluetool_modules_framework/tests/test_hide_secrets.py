@@ -1,13 +1,17 @@
 # Copyright Contributors to the Testing Farm project.
 # SPDX-License-Identifier: Apache-2.0
 
+import io
 import pytest
 import os
+import shutil
 import tempfile
 
 from gluetool.utils import dump_yaml
 
-from gluetool_modules_framework.helpers.hide_secrets import HideSecrets
+import gluetool_modules_framework.helpers.hide_secrets
+
+from gluetool_modules_framework.helpers.hide_secrets import HideSecrets, compile_secrets, scrub_stream
 from gluetool_modules_framework.libs.testing_environment import TestingEnvironment
 
 from . import create_module, patch_shared
@@ -241,3 +245,173 @@ def test_hide_secrets_argument(monkeypatch, module):
         # Check all secrets are now 'hidden'
         with open(os.path.join(tmpdir, 'testfile.txt'), 'r') as f:
             assert f.read() == file_contents_censored
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 64, 4096])
+def test_scrub_stream_chunks(chunk_size):
+    pattern, max_length = compile_secrets(['foo', 'foobar', 'a\nb', ''])
+    source = io.BytesIO(b'xfoobarx foo a\n    b foofoo fo')
+    output = io.BytesIO()
+
+    assert scrub_stream(source, pattern, max_length, output=output, chunk_size=chunk_size) == 5
+    assert output.getvalue() == b'xhiddenx hidden hidden hiddenhidden fo'
+
+
+def test_hide_secrets_rewrite(module):
+    with tempfile.TemporaryDirectory(prefix='hide_secrets', dir=ASSETS_DIR) as tmpdir:
+        clean_filepath = os.path.join(tmpdir, 'clean.txt')
+        secret_filepath = os.path.join(tmpdir, 'secret.sh')
+
+        with open(clean_filepath, 'w') as f:
+            f.write('nothing to see here')
+
+        with open(secret_filepath, 'w') as f:
+            f.write('echo foo')
+
+        os.chmod(secret_filepath, 0o755)
+        clean_inode = os.stat(clean_filepath).st_ino
+        secret_inode = os.stat(secret_filepath).st_ino
+
+        module.add_secrets('foo')
+        module.hide_secrets(search_path=tmpdir)
+
+        # clean files are left untouched, files with secrets are replaced
+        assert os.stat(clean_filepath).st_ino == clean_inode
+        assert os.stat(secret_filepath).st_ino != secret_inode
+        assert os.stat(secret_filepath).st_mode & 0o777 == 0o755
+        assert sorted(os.listdir(tmpdir)) == ['clean.txt', 'secret.sh']
+
+        with open(secret_filepath, 'r') as f:
+            assert f.read() == 'echo hidden'
+
+
+@pytest.mark.parametrize('skip_binary, expected', [
+    (False, b'\0\1hidden'),
+    (True, b'\0\1foo')
+])
+def test_hide_secrets_binary(module, skip_binary, expected):
+    with tempfile.TemporaryDirectory(prefix='hide_secrets', dir=ASSETS_DIR) as tmpdir:
+        module._config['skip-binary-files'] = skip_binary
+
+        with open(os.path.join(tmpdir, 'binary'), 'wb') as f:
+            f.write(b'\0\1foo')
+
+        module.add_secrets('foo')
+        module.hide_secrets(search_path=tmpdir)
+
+        with open(os.path.join(tmpdir, 'binary'), 'rb') as f:
+            assert f.read() == expected
+
+
+def test_hide_secrets_keep_records(module):
+    with tempfile.TemporaryDirectory(prefix='hide_secrets', dir=ASSETS_DIR) as tmpdir:
+        module.add_secrets('foo')
+
+        # snapshots of the same files, in a new directory every time
+        for i in range(5):
+            snapshot_dir = os.path.join(tmpdir, 'snapshot-{}'.format(i))
+            os.mkdir(snapshot_dir)
+
+            for filename in ('clean.txt', 'secret.txt'):
+                with open(os.path.join(snapshot_dir, filename), 'w') as f:
+                    f.write('foo' if filename == 'secret.txt' else 'bar')
+
+            module.hide_secrets(search_path=snapshot_dir, keep_records=False)
+
+            with open(os.path.join(snapshot_dir, 'secret.txt'), 'r') as f:
+                assert f.read() == 'hidden'
+
+            shutil.rmtree(snapshot_dir)
+
+        assert module._scan_records == {}
+
+        # records of other paths are kept
+        with open(os.path.join(tmpdir, 'live.log'), 'w') as f:
+            f.write('bar')
+
+        module.hide_secrets(search_path=tmpdir)
+
+        assert list(module._scan_records) == [os.path.abspath(os.path.join(tmpdir, 'live.log'))]
+
+def test_hide_secrets_pool(monkeypatch, module):
+    monkeypatch.setattr(gluetool_modules_framework.helpers.hide_secrets, 'POOL_MIN_FILES', 2)
+    module._config['workers'] = 2
+
+    with tempfile.TemporaryDirectory(prefix='hide_secrets', dir=ASSETS_DIR) as tmpdir:
+        for i in range(5):
+            with open(os.path.join(tmpdir, 'file{}.txt'.format(i)), 'w') as f:
+                f.write('{} foo {}'.format(i, 'bar' if i % 2 else 'baz'))
+
+        module.add_secrets(['foo', 'bar'])
+        module.hide_secrets(search_path=tmpdir)
+
+        for i in range(5):
+            with open(os.path.join(tmpdir, 'file{}.txt'.format(i)), 'r') as f:
+                assert f.read() == '{} hidden {}'.format(i, 'hidden' if i % 2 else 'baz')
+
+
+def test_hide_secrets_incremental(monkeypatch, module):
+    scans = []
+    scrub_file = gluetool_modules_framework.helpers.hide_secrets.scrub_file
+
+    def _scrub_file(filepath, *args, **kwargs):
+        scans.append((os.path.basename(filepath), kwargs['offset']))
+        return scrub_file(filepath, *args, **kwargs)
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.hide_secrets, 'scrub_file', _scrub_file)
+
+    with tempfile.TemporaryDirectory(prefix='hide_secrets', dir=ASSETS_DIR) as tmpdir:
+        log_filepath = os.path.join(tmpdir, 'output.log')
+        results_filepath = os.path.join(tmpdir, 'results.yaml')
+
+        with open(log_filepath, 'w') as f:
+            f.write('line foo\nline fo')
+
+        with open(results_filepath, 'w') as f:
+            f.write('result: pass\n')
+
+        module.add_secrets('foo')
+        module.hide_secrets(search_path=tmpdir)
+
+        assert sorted(scans) == [('output.log', 0), ('results.yaml', 0)]
+
+        # nothing changed, nothing to scan
+        del scans[:]
+        module.hide_secrets(search_path=tmpdir)
+
+        assert scans == []
+
+        # appended log is scanned from the end of the previous scan, catching a secret crossing it
+        with open(log_filepath, 'r') as f:
+            size = len(f.read())
+
+        with open(log_filepath, 'a') as f:
+            f.write('o\nline bar\n')
+
+        module.hide_secrets(search_path=tmpdir)
+
+        assert scans == [('output.log', size)]
+
+        with open(log_filepath, 'r') as f:
+            assert f.read() == 'line hidden\nline hidden\nline bar\n'
+
+        # rewritten file is scanned as a whole, even though it is larger now
+        del scans[:]
+
+        with open(results_filepath, 'w') as f:
+            f.write('result: foo\nresult: pass\n')
+
+        module.hide_secrets(search_path=tmpdir)
+
+        with open(results_filepath, 'r') as f:
+            assert f.read() == 'result: hidden\nresult: pass\n'
+
+        # new secrets require a full scan
+        del scans[:]
+        module.add_secrets('bar')
+        module.hide_secrets(search_path=tmpdir)
+
+        assert sorted(scans) == [('output.log', 0), ('results.yaml', 0)]
+
+        with open(log_filepath, 'r') as f:
+            assert f.read() == 'line hidden\nline hidden\nline hidden\n'
@@ -163,8 +163,7 @@ def test_loadable(module):
             'dnf -y --setopt=gpgcheck=0 reinstall https://example.com/dummy1_rpm_name1-1.0.1-el7.rpm || true',
             'dnf -y --setopt=gpgcheck=0 reinstall https://example.com/dummy1_rpm_name2-1.0.1-el7.rpm || true',
             'dnf -y --setopt=gpgcheck=0 install --allowerasing https://example.com/dummy1_rpm_name1-1.0.1-el7.rpm https://example.com/dummy1_rpm_name2-1.0.1-el7.rpm',
-            'rpm -q dummy1_rpm_name1',
-            'rpm -q dummy1_rpm_name2',
+            'rpm -q dummy1_rpm_name1 dummy1_rpm_name2',
         ],
         None,  # No expected generated files - use the default ones in `assert_log_files()`
         None
@@ -231,12 +230,9 @@ def test_loadable(module):
                 'https://example.com/dummy3_rpm_name1-1.0.1-el7.rpm '
                 'https://example.com/dummy3_rpm_name2-1.0.1-el7.rpm'
             ),
-            'rpm -q dummy1_rpm_name1',
-            'rpm -q dummy1_rpm_name2',
-            'rpm -q dummy2_rpm_name1',
-            'rpm -q dummy2_rpm_name2',
-            'rpm -q dummy3_rpm_name1',
-            'rpm -q dummy3_rpm_name2',
+            'rpm -q dummy1_rpm_name1 dummy1_rpm_name2',
+            'rpm -q dummy2_rpm_name1 dummy2_rpm_name2',
+            'rpm -q dummy3_rpm_name1 dummy3_rpm_name2',
         ],
         [  # Expected generated files
             '0-Create-artifacts-directory.txt',
@@ -311,8 +307,7 @@ def test_loadable(module):
                 'dnf -y --setopt=gpgcheck=0 install --allowerasing '
                 'https://example.com/dummy3_rpm_name1-1.0.1-el7.rpm https://example.com/dummy3_rpm_name2-1.0.1-el7.rpm'
             ),
-            'rpm -q dummy3_rpm_name1',
-            'rpm -q dummy3_rpm_name2',
+            'rpm -q dummy3_rpm_name1 dummy3_rpm_name2',
         ],
         [  # Expected generated files
             '0-Create-artifacts-directory.txt',
@@ -411,8 +406,7 @@ def test_loadable(module):
             'dnf -y --setopt=gpgcheck=0 reinstall https://example.com/dummy2_rpm_name1-1.0.1-el7.rpm || true',
             'dnf -y --setopt=gpgcheck=0 reinstall https://example.com/dummy2_rpm_name2-1.0.1-el7.rpm || true',
             'dnf -y --setopt=gpgcheck=0 install --allowerasing https://example.com/dummy2_rpm_name1-1.0.1-el7.rpm https://example.com/dummy2_rpm_name2-1.0.1-el7.rpm',
-            'rpm -q dummy2_rpm_name1',
-            'rpm -q dummy2_rpm_name2',
+            'rpm -q dummy2_rpm_name1 dummy2_rpm_name2',
         ],
         [  # Expected generated files
             '0-Create-artifacts-directory.txt',
@@ -456,8 +450,7 @@ def test_loadable(module):
             'dnf -y --setopt=gpgcheck=0 reinstall https://example.com/dummy1_rpm_name1-1.0.1-el7.rpm || true',
             'dnf -y --setopt=gpgcheck=0 reinstall https://example.com/dummy1_rpm_name2-1.0.1-el7.rpm || true',
             'dnf -y --setopt=gpgcheck=0 install --allowerasing https://example.com/dummy1_rpm_name1-1.0.1-el7.rpm https://example.com/dummy1_rpm_name2-1.0.1-el7.rpm',
-            'rpm -q dummy1_rpm_name1',
-            'rpm -q dummy1_rpm_name2',
+            'rpm -q dummy1_rpm_name1 dummy1_rpm_name2',
         ],
         None,  # No expected generated files - use the default ones in `assert_log_files()`
         [Artifact(type='fedora-copr-build', id='artifact1')]  # This artifact should be installed
@@ -524,8 +517,7 @@ def test_no_dnf(module_shared_patched, tmpdir):
         call('yum -y --setopt=gpgcheck=0 reinstall https://example.com/dummy1_rpm_name2-1.0.1-el7.rpm'),
         call('yum -y --setopt=gpgcheck=0 downgrade https://example.com/dummy1_rpm_name1-1.0.1-el7.rpm https://example.com/dummy1_rpm_name2-1.0.1-el7.rpm'),
         call('yum -y --setopt=gpgcheck=0 install https://example.com/dummy1_rpm_name1-1.0.1-el7.rpm https://example.com/dummy1_rpm_name2-1.0.1-el7.rpm'),
-        call('rpm -q dummy1_rpm_name1'),
-        call('rpm -q dummy1_rpm_name2')
+        call('rpm -q dummy1_rpm_name1 dummy1_rpm_name2')
     ]
 
     execute_mock.assert_has_calls(calls, any_order=False)
@@ -896,3 +888,31 @@ def test_setup_guest_bootc(module_shared_patched, tmpdir, guest_artifacts, guest
     calls = [call(c) for c in expected_commands]
     mock_command_init.assert_has_calls(calls, any_order=False)
     assert mock_command_init.call_count == len(calls)
+
+
+def test_artifact_cache(module_shared_patched, tmpdir, monkeypatch):
+    module, primary_task_mock = module_shared_patched
+    primary_task_mock.checksums = {'https://example.com/dummyX_rpm_name1-1.0.1-el7.rpm': 'a' * 64}
+
+    passed_checksums = []
+
+    def cache_urls(guest, urls, checksums=None):
+        passed_checksums.append(checksums)
+        return {url: url.replace('https://example.com', 'http://cache') for url in urls}
+
+    patch_shared(monkeypatch, module, {}, callables={'cache_urls': cache_urls})
+
+    execute_mock = get_execute_mock()
+    guest = mock_guest(execute_mock, artifacts=[Artifact(type='fedora-copr-build', id='artifact1')])
+
+    module.setup_guest(guest, stage=GuestSetupStage.ARTIFACT_INSTALLATION, log_dirpath=str(tmpdir))
+
+    with open(os.path.join(str(tmpdir), 'artifact-installation-guest0', INSTALL_COMMANDS_FILE)) as f:
+        commands = f.read()
+
+    assert 'https://example.com' not in commands
+    assert 'http://cache/dummy1_rpm_name1-1.0.1-el7.src.rpm' in commands
+    assert 'dnf -y --setopt=gpgcheck=0 reinstall http://cache/dummy1_rpm_name1-1.0.1-el7.rpm || true' in commands
+    assert 'rpm -q dummy1_rpm_name1 dummy1_rpm_name2' in commands
+
+    assert passed_checksums == [primary_task_mock.checksums]
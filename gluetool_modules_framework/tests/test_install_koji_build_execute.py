@@ -258,8 +258,7 @@ def test_guest_setup_with_copr(module, local_guest, monkeypatch, tmpdir):
         'dnf -y --setopt=gpgcheck=0 reinstall dummy_rpm_url1 || true',
         'dnf -y --setopt=gpgcheck=0 reinstall dummy_rpm_url2 || true',
         'dnf -y --setopt=gpgcheck=0 install --allowerasing dummy_rpm_url1 dummy_rpm_url2',
-        'rpm -q dummy_rpm_names1',
-        'rpm -q dummy_rpm_names2',
+        'rpm -q dummy_rpm_names1 dummy_rpm_names2',
     ]
     calls = (
         [call('type bootc && sudo bootc status && ((sudo bootc status --format yaml | grep -e "booted: null" -e "image: null") && exit 1 || exit 0)')] +
@@ -160,6 +160,8 @@ def test_guest_setup(module, environment_index, tmpdir, monkeypatch):
     mock_file.write.assert_has_calls(write_calls)
     assert mock_file.flush.called
 
+    guest.copy_many_to.assert_called_once_with(['dummy.txt', 'dummy.txt'], '')
+
     execute_calls = [
         call('type bootc && sudo bootc status && ((sudo bootc status --format yaml | grep -e "booted: null" -e "image: null") && exit 1 || exit 0)'),
         call('command -v dnf'),
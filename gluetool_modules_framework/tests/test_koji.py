@@ -50,6 +50,43 @@ class MockClientSession(object):
         for method, response in six.iteritems(data):
             setattr(self, method, functools.partial(getter, method))
 
+        # list of multicall requests, each being a list of method names
+        self.multicall_requests = []
+
+    def multicall(self, strict=False, batch=None):
+        return MockMultiCallSession(self, batch)
+
+
+class MockMultiCallSession(object):
+    """
+    Mocked Koji multicall session, recording calls and sending them to the mocked session in batches.
+    """
+
+    def __init__(self, session, batch):
+        self._session = session
+        self._batch = batch
+        self._calls = []
+
+    def __getattr__(self, name):
+        def _call(*args, **kwargs):
+            call = MagicMock(method=name, args=args, kwargs=kwargs)
+            self._calls.append(call)
+            return call
+
+        return _call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for i in range(0, len(self._calls), self._batch):
+            batch = self._calls[i:i + self._batch]
+
+            self._session.multicall_requests.append([call.method for call in batch])
+
+            for call in batch:
+                call.result = getattr(self._session, call.method)(*call.args, **call.kwargs)
+
 
 @pytest.fixture(name='koji_session')
 def fixture_koji_session(request, monkeypatch):
@@ -196,6 +233,179 @@ def test_task_by_id(koji_session, koji_module):
     assert_task_attributes(koji_module, koji_session)
 
 
+@pytest.mark.parametrize('koji_session', [
+    15869828,
+    16311217
+], indirect=True)
+def test_task_by_id_multicall(koji_session, koji_module):
+    """
+    Tasks are specified directly by their IDs, API calls are batched with multicalls.
+    """
+
+    koji_module._config['multicall-batch-size'] = 2
+
+    koji_module.tasks(task_ids=[koji_session])
+
+    assert_task_attributes(koji_module, koji_session)
+
+    session = koji_module.koji_session()
+
+    assert session.multicall_requests
+    assert all(len(request) <= 2 for request in session.multicall_requests)
+    assert koji_module._multicall_requests < koji_module._multicall_calls
+
+
+@pytest.mark.parametrize('batch_size, expected_requests', [
+    (0, 3),
+    (2, 2),
+    (5, 1)
+])
+def test_call_api_multi(batch_size, expected_requests):
+    session = MockClientSession(testing_asset('koji', '15869828.yml'))
+
+    results, requests_count = gluetool_modules_framework.infrastructure.koji_fedora._call_api_multi(
+        session, MagicMock(), 'getBuild', [((805705,), {}), (('bash-4.3.43-4.fc25',), {}), ((805705,), {})],
+        batch_size
+    )
+
+    assert requests_count == expected_requests
+    assert [build['build_id'] for build in results] == [805705, 805705, 805705]
+    assert len(session.multicall_requests) == (expected_requests if batch_size else 0)
+
+
+@pytest.fixture(name='api_cache')
+def fixture_api_cache(tmpdir):
+    return gluetool_modules_framework.infrastructure.koji_fedora.KojiApiCache(
+        gluetool_modules_framework.infrastructure.koji_fedora.DiskApiCacheStore(str(tmpdir)),
+        'https://koji.fedoraproject.org/kojihub',
+        60,
+        MagicMock()
+    )
+
+
+def test_api_cache(api_cache):
+    session = MockClientSession(testing_asset('koji', '15869828.yml'))
+    session.getBuild = MagicMock(side_effect=session.getBuild)
+    session.getTaskInfo = MagicMock(return_value={'id': 1, 'state': koji.TASK_STATES['OPEN']})
+
+    # complete build, cached for good
+    build = api_cache.call_api(session, MagicMock(), 'getBuild', 805705)
+    assert api_cache.call_api(session, MagicMock(), 'getBuild', 805705) == build
+    assert session.getBuild.call_count == 1
+
+    # task still running, never cached
+    api_cache.call_api(session, MagicMock(), 'getTaskInfo', 1)
+    api_cache.call_api(session, MagicMock(), 'getTaskInfo', 1)
+    assert session.getTaskInfo.call_count == 2
+
+    assert api_cache.hits == 1
+
+
+def test_api_cache_ttl(api_cache, monkeypatch):
+    session = MagicMock()
+    session.listTagged.return_value = [{'nvr': 'bash-4.3.43-4.fc25'}]
+
+    monkeypatch.setattr(gluetool_modules_framework.infrastructure.koji_fedora.time, 'time', MagicMock(return_value=0))
+    api_cache.call_api(session, MagicMock(), 'listTagged', 'f25', package='bash')
+    api_cache.call_api(session, MagicMock(), 'listTagged', 'f25', package='bash')
+    assert session.listTagged.call_count == 1
+
+    # different arguments, different key
+    api_cache.call_api(session, MagicMock(), 'listTagged', 'f26', package='bash')
+    assert session.listTagged.call_count == 2
+
+    monkeypatch.setattr(gluetool_modules_framework.infrastructure.koji_fedora.time, 'time', MagicMock(return_value=61))
+    api_cache.call_api(session, MagicMock(), 'listTagged', 'f25', package='bash')
+    assert session.listTagged.call_count == 3
+
+
+def test_api_cache_empty(api_cache):
+    session = MagicMock()
+    session.listBuilds.return_value = []
+    session.queryHistory.return_value = {'tag_listing': [{'tag.name': 'f25'}]}
+
+    # empty responses may change soon, callers are polling for them
+    api_cache.call_api(session, MagicMock(), 'listBuilds', taskID=1)
+    api_cache.call_api(session, MagicMock(), 'listBuilds', taskID=1)
+    assert session.listBuilds.call_count == 2
+
+    api_cache.call_api(session, MagicMock(), 'queryHistory', build=1)
+    api_cache.call_api(session, MagicMock(), 'queryHistory', build=1)
+    assert session.queryHistory.call_count == 2
+
+
+def test_api_cache_bypass(api_cache):
+    session = MagicMock()
+    session.getTaskChildren.return_value = [{'id': 2, 'state': koji.TASK_STATES['CLOSED']}]
+
+    api_cache.call_api(session, MagicMock(), 'getTaskChildren', 1, use_cache=False)
+    api_cache.call_api(session, MagicMock(), 'getTaskChildren', 1)
+    api_cache.call_api(session, MagicMock(), 'getTaskChildren', 1)
+
+    assert session.getTaskChildren.call_count == 2
+    assert api_cache.hits == 1
+
+
+def test_disk_api_cache_store_failure(tmpdir):
+    store = gluetool_modules_framework.infrastructure.koji_fedora.DiskApiCacheStore(str(tmpdir))
+
+    with pytest.raises(TypeError):
+        store.set('foo', {'response': object()}, 0)
+
+    assert tmpdir.listdir() == []
+
+
+def test_api_cache_multi(api_cache):
+    session = MockClientSession(testing_asset('koji', '15869828.yml'))
+
+    api_cache.call_api(session, MagicMock(), 'getBuild', 805705)
+
+    results, requests_count = api_cache.call_api_multi(
+        session, MagicMock(), 'getBuild', [((805705,), {}), (('bash-4.3.43-4.fc25',), {})], 5
+    )
+
+    assert [build['build_id'] for build in results] == [805705, 805705]
+    # only the second call was sent, and a single call does not need a multicall
+    assert requests_count == 1
+    assert session.multicall_requests == []
+
+
+COMMIT_HTML = """
+<html><body>
+<table class='commit-info'>
+<tr><th>author</th><td>Foo Bar &lt;foo@example.com&gt;</td></tr>
+</table>
+<a class='branch-deco' href='/rpms/bash/log/?h=rhel-8.0.0'>rhel-8.0.0</a>
+<a class='branch-deco' href='/rpms/bash/log/?h=private-foo'>private-foo</a>
+<a class='branch-deco' href='/rpms/bash/log/?h=private-bar'><span>private</span>-bar</a>
+</body></html>
+"""
+
+
+def test_extract_commit_details():
+    details = gluetool_modules_framework.infrastructure.koji_fedora._extract_commit_details(
+        gluetool_modules_framework.infrastructure.koji_fedora.BeautifulSoup(
+            COMMIT_HTML, gluetool_modules_framework.infrastructure.koji_fedora.HTML_PARSER
+        )
+    )
+
+    assert details == {
+        'branches': ['rhel-8.0.0', 'private-foo'],
+        'issuer': 'foo'
+    }
+
+
+def test_api_cache_commit_details(api_cache):
+    url = 'https://src.example.com/cgit/rpms/bash/commit/?id=abcdef&dt=2'
+
+    assert api_cache.get_commit_details(url) is None
+
+    api_cache.set_commit_details(url, {'branches': ['rhel-8.0.0'], 'issuer': 'foo'})
+
+    assert api_cache.get_commit_details(url) == {'branches': ['rhel-8.0.0'], 'issuer': 'foo'}
+    assert api_cache.hits == 1
+
+
 @pytest.mark.parametrize('koji_session', [
     48742482,
     69327928
@@ -441,6 +651,30 @@ def test_baseline(koji_session, koji_module, log):
     assert koji_module._tasks[0].baseline == nvr
 
 
+@pytest.mark.parametrize('koji_session', [
+    (15869828, 'previous-released-build', 'bash-4.2.43-4.fc24'),
+    (15869828, 'previous-build', 'bash-4.3.43-3.fc25')
+], indirect=True)
+def test_baseline_multicall(koji_session, koji_module):
+    """
+    Test if baseline builds are correctly resolved when all candidate tags are queried at once.
+    """
+
+    task_id, method, nvr = koji_session
+
+    koji_module._config['baseline-method'] = method
+    koji_module._config['task-id'] = [task_id]
+    koji_module._config['multicall-batch-size'] = 5
+
+    koji_module.execute()
+
+    assert koji_module._tasks[0].baseline_task.nvr == nvr
+
+    session = koji_module.koji_session()
+
+    assert ['listTagged', 'listTagged'] in session.multicall_requests
+
+
 @pytest.mark.parametrize('koji_session', [
     15869828,
 ], indirect=True)
@@ -0,0 +1,238 @@
+# Copyright Contributors to the Testing Farm project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+import pytest
+
+from mock import MagicMock
+
+import gluetool
+from gluetool.utils import Command
+
+import gluetool_modules_framework.libs.sut_installation
+from gluetool_modules_framework.libs.sut_installation import SUTInstallation, rpm_query_failed_items
+
+
+@pytest.fixture(name='guest')
+def fixture_guest(monkeypatch):
+    """
+    Guest running commands locally.
+    """
+
+    monkeypatch.setattr(gluetool_modules_framework.libs.sut_installation, 'artifacts_location',
+                        MagicMock(return_value='dummy-location'))
+
+    def execute(cmd, env=None):
+        return Command(['bash', '-c', cmd]).run(env=env)
+
+    return MagicMock(name='guest0', execute=MagicMock(side_effect=execute))
+
+
+def _sut_installation(log_dirpath, single_session):
+    sut_installation = SUTInstallation(
+        MagicMock(spec=gluetool.Module), log_dirpath, MagicMock(), single_session=single_session
+    )
+
+    sut_installation.add_step('Create directory', 'mkdir -p {0} && cd {0} && pwd'.format(log_dirpath),
+                              ignore_exception=True)
+    sut_installation.add_step('Ignored failure', 'echo failed >&2; exit 1', ignore_exception=True)
+    sut_installation.add_step('No newline', 'printf foo; printf bar >&2')
+    sut_installation.add_step('Check items', 'echo {0}; [ {0} != bad ]', items=['good', 'bad', 'other'])
+    sut_installation.add_step('Never', 'echo never')
+
+    return sut_installation
+
+
+def _read_logs(log_dirpath):
+    return {
+        filename: open(os.path.join(log_dirpath, filename)).read()
+        for filename in sorted(os.listdir(log_dirpath))
+    }
+
+
+def test_single_session(guest, tmpdir):
+    default_dirpath = str(tmpdir.join('default'))
+    session_dirpath = str(tmpdir.join('session'))
+
+    default_result = _sut_installation(default_dirpath, False).run(guest)
+
+    assert guest.execute.call_count == 6
+
+    guest.execute.reset_mock()
+
+    session_result = _sut_installation(session_dirpath, True).run(guest)
+
+    # a single session, no `dnf` probe
+    assert guest.execute.call_count == 1
+
+    for result in (default_result, session_result):
+        assert result.is_error
+        assert result.error.items == 'bad'
+        assert result.error.reason == 'Check items'
+
+    default_logs = _read_logs(default_dirpath)
+    session_logs = _read_logs(session_dirpath)
+
+    assert sorted(session_logs.keys()) == [
+        '0-Create-directory.txt', '1-Ignored-failure.txt', '2-No-newline.txt', '3-Check-items.txt'
+    ]
+
+    assert session_logs == {
+        filename: log.replace(default_dirpath, session_dirpath) for filename, log in default_logs.items()
+    }
+
+    assert 'foo\n---^' in session_logs['2-No-newline.txt']
+    assert 'other' not in session_logs['3-Check-items.txt']
+
+
+def test_single_session_success(guest, tmpdir):
+    log_dirpath = str(tmpdir)
+
+    sut_installation = SUTInstallation(MagicMock(spec=gluetool.Module), log_dirpath, MagicMock(), single_session=True)
+    sut_installation.add_step('Verify', 'echo {}', items=['foo', 'bar'])
+    sut_installation.add_step('Environment', 'echo "$FOO"', env={'FOO': 'foo bar'})
+
+    assert sut_installation.run(guest).is_ok
+    assert guest.execute.call_count == 1
+
+    assert 'foo bar\n' in tmpdir.join('1-Environment.txt').read()
+    assert tmpdir.join('sut_install_commands.sh').read() == 'echo foo\necho bar\necho "$FOO"\n'
+
+
+def test_single_session_split(guest, tmpdir):
+    """
+    Steps with callbacks end the session, local steps run on their own.
+    """
+
+    log_dirpath = str(tmpdir)
+
+    callback = MagicMock(return_value=None)
+
+    sut_installation = SUTInstallation(MagicMock(spec=gluetool.Module), log_dirpath, MagicMock(), single_session=True)
+    sut_installation.add_step('First', 'echo first')
+    sut_installation.add_step('Callback', 'echo callback', callback=callback)
+    sut_installation.add_step('Second', 'echo second')
+    sut_installation.add_step('Local', 'echo local', local=True)
+    sut_installation.add_step('Third', 'echo third')
+
+    assert sut_installation.run(guest).is_ok
+
+    # sessions ending with the callback step and the local step, and the last session
+    assert guest.execute.call_count == 3
+
+    callback.assert_called_once()
+    assert callback.call_args[0][0] == ['echo callback']
+    assert callback.call_args[0][1].stdout == 'callback\n'
+
+
+def test_single_session_terminated(guest, tmpdir):
+    log_dirpath = str(tmpdir)
+
+    sut_installation = SUTInstallation(MagicMock(spec=gluetool.Module), log_dirpath, MagicMock(), single_session=True)
+    sut_installation.add_step('Killed', 'echo started; kill -9 $$', ignore_exception=True)
+    sut_installation.add_step('Never', 'echo never')
+
+    result = sut_installation.run(guest)
+
+    assert result.is_error
+    assert result.error.reason == 'Killed'
+
+    assert 'started' in tmpdir.join('0-Killed.txt').read()
+    assert not tmpdir.join('1-Never.txt').exists()
+
+
+def test_rpm_query_failed_items():
+    output = MagicMock(stdout='foo-1.0-1.noarch\npackage bar is not installed\npackage baz-1.0 is not installed\n')
+
+    assert rpm_query_failed_items(['foo', 'bar', 'baz-1.0', 'qux'], output) == ['bar', 'baz-1.0']
+
+
+@pytest.mark.parametrize('single_session', [False, True], ids=['default', 'single-session'])
+def test_batch(guest, tmpdir, single_session):
+    log_dirpath = str(tmpdir)
+
+    sut_installation = SUTInstallation(
+        MagicMock(spec=gluetool.Module), log_dirpath, MagicMock(), single_session=single_session
+    )
+    sut_installation.add_step('Verify', 'for p in {}; do echo $p; done', items=['foo', 'bar'], batch=True)
+
+    assert sut_installation.run(guest).is_ok
+
+    # the batch command, and the `dnf` probe when not running in a single session
+    assert guest.execute.call_count == (1 if single_session else 2)
+
+    assert tmpdir.join('sut_install_commands.sh').read() == 'for p in foo bar; do echo $p; done\n'
+    assert 'foo\nbar\n' in tmpdir.join('0-Verify.txt').read()
+
+
+def test_batch_parser(guest, tmpdir):
+    log_dirpath = str(tmpdir)
+
+    def batch_parser(items, output):
+        return [item for item in items if 'missing {}'.format(item) in output.stdout]
+
+    sut_installation = SUTInstallation(MagicMock(spec=gluetool.Module), log_dirpath, MagicMock())
+    sut_installation.add_step(
+        'Verify', 'for p in {}; do [ $p = foo ] || {{ echo missing $p; false; }}; done',
+        items=['foo', 'bar', 'baz'], batch=True, batch_parser=batch_parser
+    )
+
+    result = sut_installation.run(guest)
+
+    assert result.is_error
+    assert result.error.items == 'bar'
+    assert result.error.reason == 'Verify'
+
+    # `dnf` probe and the batch command
+    assert guest.execute.call_count == 2
+
+    guest.warn.assert_called_once_with('Following items have failed: bar,baz')
+
+
+def test_batch_fallback(guest, tmpdir):
+    """
+    Without a parser, failing items are found by running the command for each item.
+    """
+
+    log_dirpath = str(tmpdir)
+
+    sut_installation = SUTInstallation(MagicMock(spec=gluetool.Module), log_dirpath, MagicMock(), single_session=True)
+    sut_installation.add_step('Verify', 'for p in {}; do [ $p != bar ] || exit 1; done', items=['foo', 'bar', 'baz'],
+                              batch=True)
+
+    result = sut_installation.run(guest)
+
+    assert result.is_error
+    assert result.error.items == 'bar'
+
+    # the session, then `foo` and `bar`
+    assert guest.execute.call_count == 3
+
+    assert tmpdir.join('0-Verify.txt').read().count('Command:') == 1
+    assert tmpdir.join('0-Verify-items.txt').read().count('Command:') == 2
+
+
+@pytest.mark.parametrize('single_session', [False, True], ids=['default', 'single-session'])
+def test_batch_fallback_passed(guest, tmpdir, single_session):
+    """
+    When the batch fails but every item passes on its own, the installation continues.
+    """
+
+    log_dirpath = str(tmpdir)
+
+    sut_installation = SUTInstallation(
+        MagicMock(spec=gluetool.Module), log_dirpath, MagicMock(), single_session=single_session
+    )
+    # fails with more than one item, like a batch interrupted by a transient error would
+    sut_installation.add_step('Verify', 'set -- {}; [ $# = 1 ]', items=['foo', 'bar'], batch=True)
+    sut_installation.add_step('After', 'echo after')
+
+    assert sut_installation.run(guest).is_ok
+
+    # the batch command, `foo`, `bar` and the following step, and the `dnf` probe when not running in a single session
+    assert guest.execute.call_count == (4 if single_session else 5)
+
+    assert tmpdir.join('0-Verify.txt').read().count('Command:') == 1
+    assert tmpdir.join('0-Verify-items.txt').read().count('Command:') == 2
+    assert 'after' in tmpdir.join('1-After.txt').read()
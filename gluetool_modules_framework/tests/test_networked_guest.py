@@ -2,7 +2,9 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+import os
 import socket
+import subprocess
 import pytest
 
 from functools import partial
@@ -11,6 +13,9 @@ from mock import call
 
 import gluetool
 import gluetool_modules_framework.libs.guest as guest_module
+import gluetool_modules_framework.libs.ssh_client
+
+from gluetool.result import Result
 
 from gluetool_modules_framework.tests import *
 
@@ -360,6 +365,20 @@ def test_wait_alive_unknown_rc_support(guest, log, monkeypatch):
     assert log.records[-1].message == "Don't know how to check boot process status - assume it finished and hope for the best"
 
 
+def test_wait_alive_resets_facts(guest, monkeypatch):
+    monkeypatch.setattr(guest, 'wait', MagicMock())
+
+    # pylint: disable=protected-access
+    guest._supports_systemctl = False
+    guest._supports_initctl = False
+
+    guest.ansible_interpreters = ['/usr/bin/python3']
+
+    guest.wait_alive()
+
+    assert guest.ansible_interpreters is None
+
+
 def test_wait_alive_get_rc_support(guest, monkeypatch):
     monkeypatch.setattr(guest, 'wait', MagicMock())
 
@@ -437,3 +456,346 @@ def test_setup(guest, monkeypatch):
 
     assert guest.setup(foo=17) == output
     guest._module.shared.assert_called_once_with('setup_guest', guest, variables=None, foo=17)
+
+
+@pytest.fixture(name='mux_guest')
+def fixture_mux_guest():
+    ci = NonLoadingGlue()
+    mod = gluetool.Module(ci, 'dummy-module')
+
+    return guest_module.NetworkedGuest(mod, '10.20.30.40', 'dummy-guest', port=13, username='ssh-user',
+                                       key='/tmp/ssh.key', options=['Foo=17'], control_path_dir='/tmp/workdir',
+                                       control_persist=30)
+
+
+def test_multiplexing(mux_guest, monkeypatch):
+    mux_options = ['-o', 'ControlMaster=auto', '-o', 'ControlPath=/tmp/workdir/ssh-%C', '-o', 'ControlPersist=30']
+
+    # pylint: disable=protected-access
+    assert mux_guest.control_path == '/tmp/workdir/ssh-%C'
+    assert mux_guest._ssh == ['ssh', '-p', '13', '-l', 'ssh-user', '-i', '/tmp/ssh.key', '-o', 'Foo=17'] + mux_options
+    assert mux_guest._scp == ['scp', '-P', '13', '-i', '/tmp/ssh.key', '-o', 'Foo=17'] + mux_options
+
+    monkeypatch.setattr(gluetool.utils.Command, 'run', MagicMock(return_value=Bunch(exit_code=0)))
+
+    mux_guest.execute('/usr/bin/foo')
+    mux_guest.copy_to('/foo', '/bar')
+    mux_guest.copy_from('/foo', '/bar')
+
+    assert mux_guest.connection_commands == 3
+
+    mux_guest.close_connection()
+
+    assert mux_guest.connection_commands == 0
+
+
+def test_forward_remote_port(mux_guest, monkeypatch):
+    monkeypatch.setattr(guest_module.subprocess, 'Popen', MagicMock())
+
+    assert mux_guest.forward_remote_port(8642, 1234) == guest_module.subprocess.Popen.return_value
+
+    # forwarding does not use the master connection, it would outlive the process otherwise
+    args, _ = guest_module.subprocess.Popen.call_args
+    assert args[0] == [
+        'ssh', '-p', '13', '-l', 'ssh-user', '-i', '/tmp/ssh.key', '-o', 'Foo=17',
+        '-N', '-o', 'ExitOnForwardFailure=yes', '-R', '8642:127.0.0.1:1234', '10.20.30.40'
+    ]
+
+
+def test_multiplexing_disabled(guest, monkeypatch):
+    monkeypatch.setattr(gluetool.utils.Command, 'run', MagicMock(return_value=Bunch(exit_code=0)))
+
+    guest.execute('/usr/bin/foo')
+    guest.close_connection()
+
+    assert guest.control_path is None
+    assert guest.connection_commands == 0
+    # pylint: disable=no-member
+    gluetool.utils.Command.run.assert_called_once_with()
+
+
+def test_close_connection(mux_guest, monkeypatch):
+    commands = []
+
+    def mock_command(cmd, **kwargs):
+        # pylint: disable=unused-argument
+        commands.append(cmd)
+
+        return MagicMock(run=MagicMock(side_effect=gluetool.GlueCommandError(cmd, Bunch(exit_code=255, stderr='gone'))))
+
+    monkeypatch.setattr(guest_module, 'Command', mock_command)
+
+    # a missing master connection is not an error
+    mux_guest.close_connection()
+
+    assert commands == [mux_guest._ssh + ['-O', 'exit', '10.20.30.40']]
+
+
+def test_multiplexing_long_workdir(tmpdir, monkeypatch):
+    monkeypatch.setattr(gluetool.utils.Command, 'run', MagicMock(return_value=Bunch(exit_code=0)))
+
+    ci = NonLoadingGlue()
+    mod = gluetool.Module(ci, 'dummy-module')
+
+    workdir = str(tmpdir.mkdir('a-very-long-directory-name-exceeding-the-limit-of-unix-sockets'))
+    guest = guest_module.NetworkedGuest(mod, '10.20.30.40', control_path_dir=workdir)
+
+    assert guest.control_path is not None
+    assert not guest.control_path.startswith(workdir)
+    assert os.path.isdir(os.path.dirname(guest.control_path))
+
+    guest.close_connection()
+
+    assert not os.path.exists(os.path.dirname(guest.control_path))
+
+
+@pytest.mark.parametrize('stdout, expected, rc_support', [
+    ('guest 10.20.30.40 is alive\nsystemctl running\n', True, (True, False)),
+    ('guest 10.20.30.40 is alive\nsystemctl starting\n', False, (True, False)),
+    ('guest 10.20.30.40 is alive\nsystemctl degraded\n' + DEGRADED_REPORT, True, (True, False)),
+    ('guest 10.20.30.40 is alive\ninitctl rc stop/waiting\n', True, (False, True)),
+    ('guest 10.20.30.40 is alive\ninitctl rc start/running\n', False, (False, True)),
+    ('guest 10.20.30.40 is alive\nunknown\n', True, (False, False)),
+    ('go away...\n', False, (None, None))
+])
+def test_check_probe(guest, monkeypatch, stdout, expected, rc_support):
+    mock_execute = MagicMock(return_value=Bunch(stdout=stdout))
+    failed_units = []
+
+    monkeypatch.setattr(guest, 'execute', mock_execute)
+    monkeypatch.setattr(guest, '_is_allowed_degraded', lambda service: failed_units.append(service) or True)
+
+    # pylint: disable=protected-access
+    ret = guest._check_probe(connection_timeout=10)
+
+    assert ret.is_ok is expected
+    assert (guest._supports_systemctl, guest._supports_initctl) == rc_support
+    mock_execute.assert_called_once_with(
+        guest_module.PROBE_SCRIPT.format(msg='guest 10.20.30.40 is alive'), connection_timeout=10
+    )
+
+    if 'degraded' in stdout:
+        assert [service.split()[0] for service in failed_units] == ['dummy.service', 'another-dummy.service']
+
+
+def test_check_probe_error(guest, monkeypatch):
+    monkeypatch.setattr(guest, 'execute', MagicMock(side_effect=gluetool.GlueCommandError(None, Bunch(exit_code=255))))
+
+    # pylint: disable=protected-access
+    assert guest._check_probe().is_error
+
+
+def test_wait_alive_single_probe(guest, monkeypatch):
+    monkeypatch.setattr(guest, 'wait', MagicMock())
+    monkeypatch.setattr(guest, 'wait_backoff', MagicMock())
+
+    guest.wait_alive(connect_socket_timeout=10,
+                     connect_timeout=19, connect_tick=13,
+                     echo_timeout=23, echo_tick=57,
+                     boot_timeout=27, boot_tick=17,
+                     single_probe=True)
+
+    args, kwargs = guest.wait_backoff.call_args
+    assert args[0] == 'connectivity'
+    assert args[1].args == (10,)
+    assert kwargs == {'timeout': 19, 'tick': 1, 'max_tick': 13}
+
+    args, kwargs = guest.wait.call_args
+    assert args[0] == 'guest alive'
+    # pylint: disable=protected-access
+    assert args[1].func == guest._check_probe
+    assert args[1].keywords == {'connection_timeout': 57}
+    assert kwargs == {'timeout': 50, 'tick': 17}
+
+
+def test_wait_backoff(guest, monkeypatch):
+    sleeps = []
+    results = [Result.Error('no'), Result.Error('no'), Result.Error('no'), Result.Error('no'), Result.Ok(17)]
+
+    monkeypatch.setattr(guest_module.time, 'sleep', sleeps.append)
+
+    assert guest.wait_backoff('dummy', lambda: results.pop(0), tick=1, max_tick=5) == 17
+    assert sleeps == [1, 2, 4, 5]
+
+
+def test_wait_backoff_timeout(guest, monkeypatch):
+    clock = Bunch(now=100.0)
+
+    def sleep(delay):
+        clock.now += delay
+
+    monkeypatch.setattr(guest_module, 'time', Bunch(time=lambda: clock.now, sleep=sleep))
+
+    check = MagicMock(return_value=Result.Error('no'))
+
+    with pytest.raises(gluetool.GlueError, match=r"Condition 'dummy' failed to pass within given time"):
+        guest.wait_backoff('dummy', check, timeout=10, tick=1, max_tick=4)
+
+    # checks at 0, 1, 3 and 7 seconds, the last sleep is cut short by the timeout
+    assert check.call_count == 4
+    assert clock.now == 110.0
+
+
+@pytest.fixture(name='local_guest')
+def fixture_local_guest(guest):
+    # instead of connecting to the guest, run the remote command locally
+    # pylint: disable=protected-access
+    guest._ssh = ['sh', '-c', 'exec sh -c "$2"', 'ssh']
+
+    return guest
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_copy_many(local_guest, tmpdir, compress):
+    src_dir = tmpdir.mkdir('src')
+    src_dir.join('foo.txt').write('foo')
+    src_dir.mkdir('tree').join('bar.sh').write('echo bar')
+    src_dir.join('tree', 'bar.sh').chmod(0o750)
+
+    transferred = local_guest.copy_many_to(
+        [str(src_dir.join('foo.txt')), str(src_dir.join('tree')) + '/'],
+        str(tmpdir.join('guest', 'dst')),
+        compress=compress
+    )
+
+    assert transferred > 0
+    assert tmpdir.join('guest', 'dst', 'foo.txt').read() == 'foo'
+    assert tmpdir.join('guest', 'dst', 'tree', 'bar.sh').read() == 'echo bar'
+    assert tmpdir.join('guest', 'dst', 'tree', 'bar.sh').stat().mode & 0o777 == 0o750
+
+    transferred = local_guest.copy_many_from(
+        [str(tmpdir.join('guest', 'dst', 'foo.txt')), str(tmpdir.join('guest', 'dst', 'tree'))],
+        str(tmpdir.join('back')),
+        compress=compress
+    )
+
+    assert transferred > 0
+    assert tmpdir.join('back', 'foo.txt').read() == 'foo'
+    assert tmpdir.join('back', 'tree', 'bar.sh').stat().mode & 0o777 == 0o750
+
+
+def test_copy_many_from_relative(local_guest, tmpdir, monkeypatch):
+    tmpdir.mkdir('foo').join('foo.txt').write('foo')
+    tmpdir.join('bar.txt').write('bar')
+    tmpdir.mkdir('baz').join('baz.txt').write('baz')
+
+    # relative paths are relative to the initial directory, not to the previous member
+    monkeypatch.chdir(tmpdir)
+
+    local_guest.copy_many_from(['foo/foo.txt', 'bar.txt', 'baz/baz.txt'], str(tmpdir.join('back')))
+
+    assert sorted(os.listdir(str(tmpdir.join('back')))) == ['bar.txt', 'baz.txt', 'foo.txt']
+
+
+def test_copy_many_from_error(local_guest, tmpdir):
+    with pytest.raises(gluetool.GlueCommandError) as excinfo:
+        local_guest.copy_many_from([str(tmpdir.join('missing'))], str(tmpdir.join('back')))
+
+    assert 'missing' in excinfo.value.output.stderr
+
+
+def test_copy_many_to_error(local_guest, tmpdir):
+    tmpdir.join('file').write('')
+
+    # destination cannot be created, there is a file in the way
+    with pytest.raises(gluetool.GlueCommandError):
+        local_guest.copy_many_to([str(tmpdir.join('file'))], str(tmpdir.join('file', 'dst')))
+
+
+def test_counting_reader_chunks():
+    reader = guest_module.CountingReader([b'abc', b'', b'defgh', b'i'])
+
+    assert reader.read(4) == b'abcd'
+    assert reader.read(2) == b'ef'
+    assert reader.read() == b'ghi'
+    assert reader.read(1) == b''
+    assert reader.count == 9
+
+
+def test_paramiko_backend(monkeypatch, log):
+    ci = NonLoadingGlue()
+    mod = gluetool.Module(ci, 'dummy-module')
+
+    guest = guest_module.NetworkedGuest(mod, '10.20.30.40', ssh_backend='paramiko',
+                                        options=['ConnectTimeout=15', 'ServerAliveInterval=30'])
+
+    client = MagicMock()
+    client.execute.return_value = output = MagicMock()
+    monkeypatch.setattr(guest_module, 'SSHClient', MagicMock(return_value=client, execute=client.execute))
+
+    callback = MagicMock()
+
+    assert guest.execute('/usr/bin/foo', ssh_options=['Foo=17'], connection_timeout=10,
+                         stdout_callback=callback, env={'FOO': 'bar'}) == output
+    assert guest.connection_commands == 1
+
+    guest_module.SSHClient.assert_called_once_with(
+        guest.logger, '10.20.30.40', port=22, username=None, key=None, connect_timeout=15, keepalive_interval=30
+    )
+    guest_module.SSHClient.execute.assert_called_once_with(
+        client, cmd='/usr/bin/foo', stdout_callback=callback, stderr_callback=None, alive_interval=10
+    )
+
+    assert log.match(
+        levelno=logging.WARNING,
+        message='execute options ignored by paramiko SSH backend: env, ssh_options'
+    )
+
+    guest.close_connection()
+
+    client.close.assert_called_once_with()
+    assert guest.connection_commands == 0
+
+
+def test_paramiko_backend_copy_many(monkeypatch, tmpdir):
+    ci = NonLoadingGlue()
+    mod = gluetool.Module(ci, 'dummy-module')
+
+    guest = guest_module.NetworkedGuest(mod, '10.20.30.40', ssh_backend='paramiko')
+
+    # instead of connecting to the guest, run the remote command locally
+    def _execute(cmd, stdin=None, stdout=None):
+        subprocess.run(cmd, shell=True, stdin=stdin, stdout=stdout, check=True)
+
+    client = MagicMock()
+    monkeypatch.setattr(guest_module, 'SSHClient', MagicMock(return_value=client, execute=MagicMock(
+        side_effect=lambda client, **kwargs: _execute(**kwargs)
+    )))
+
+    # no ssh command is needed
+    monkeypatch.setattr(guest, '_execute', MagicMock(side_effect=AssertionError))
+
+    tmpdir.mkdir('src').join('foo.txt').write('foo')
+
+    assert guest.copy_many_to([str(tmpdir.join('src', 'foo.txt'))], str(tmpdir.join('guest'))) > 0
+    assert guest.copy_many_from([str(tmpdir.join('guest', 'foo.txt'))], str(tmpdir.join('back'))) > 0
+
+    assert tmpdir.join('back', 'foo.txt').read() == 'foo'
+    assert guest_module.SSHClient.execute.call_count == 2
+
+
+def test_paramiko_backend_unavailable(monkeypatch):
+    monkeypatch.setattr(gluetool_modules_framework.libs.ssh_client, 'paramiko', None)
+
+    ci = NonLoadingGlue()
+    mod = gluetool.Module(ci, 'dummy-module')
+
+    guest = guest_module.NetworkedGuest(mod, '10.20.30.40', ssh_backend='paramiko')
+
+    with pytest.raises(gluetool.GlueError, match=r'In-process SSH client requires paramiko package'):
+        guest.execute('/usr/bin/foo')
+
+
+@pytest.mark.parametrize('check', ['_check_echo', '_check_probe'])
+def test_paramiko_backend_check_connection_error(monkeypatch, check):
+    ci = NonLoadingGlue()
+    mod = gluetool.Module(ci, 'dummy-module')
+
+    guest = guest_module.NetworkedGuest(mod, '10.20.30.40', ssh_backend='paramiko')
+
+    # guest still booting, SSH server accepts connections and closes them right away
+    client = MagicMock()
+    client.execute.side_effect = EOFError('Error reading SSH protocol banner')
+    monkeypatch.setattr(guest_module, 'SSHClient', MagicMock(return_value=client, execute=client.execute))
+
+    assert getattr(guest, check)(connection_timeout=10).is_error
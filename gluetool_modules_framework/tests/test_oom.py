@@ -133,7 +133,7 @@ def test_oom_event(module, monkeypatch, log, memory_bytes, terminated):
     send_signal = MagicMock()
     process_mock.send_signal = send_signal
     monkeypatch.setattr(psutil, 'Process', MagicMock(return_value=process_mock))
-    monkeypatch.setattr(module, 'total_rss_memory', MagicMock(return_value=memory_bytes))
+    monkeypatch.setattr(module, 'memory_usage', MagicMock(return_value=memory_bytes))
 
     # pipeline cancellation is started in execute
     module.execute()
@@ -187,3 +187,80 @@ def test_total_rss_memory(module, monkeypatch, log):
     assert module.total_rss_memory() == 1300
     assert log.records[-1].message == "Ignoring process '1', it is gone or inacessible"
     assert log.records[-1].levelno == logging.DEBUG
+
+
+@pytest.fixture(name='cgroup')
+def fixture_cgroup(monkeypatch, tmpdir):
+    proc_cgroup = tmpdir.join('cgroup')
+    proc_cgroup.write('1:name=systemd:/\n0::/pipeline\n')
+
+    cgroup_dir = tmpdir.mkdir('sys').mkdir('pipeline')
+    cgroup_dir.join('memory.current').write('{}\n'.format(5 * 1024**2))
+    cgroup_dir.join('memory.stat').write('anon {}\nfile {}\ninactive_file {}\n'.format(
+        3 * 1024**2, 2 * 1024**2, 1024**2
+    ))
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.oom, 'PROC_CGROUP', str(proc_cgroup))
+    monkeypatch.setattr(gluetool_modules_framework.helpers.oom, 'CGROUP_ROOT', str(tmpdir.join('sys')))
+
+    return cgroup_dir
+
+
+def test_cgroup_memory(module, monkeypatch, cgroup):
+    total_rss_memory = MagicMock(return_value=1024)
+    monkeypatch.setattr(module, 'total_rss_memory', total_rss_memory)
+
+    assert module.cgroup_path == str(cgroup)
+    assert module.accounting == 'cgroup'
+    assert module.memory_usage() == 4 * 1024**2
+
+    # fall back to counting processes if cgroup files are gone
+    cgroup.join('memory.stat').remove()
+
+    assert module.memory_usage() == 1024
+    total_rss_memory.assert_called_once_with()
+
+
+@pytest.mark.parametrize('cgroup_entry, option, accounting', (
+    ('0::/pipeline\n', 'process', 'process'),
+    ('0::/missing\n', 'cgroup', 'process'),
+    ('4:memory:/pipeline\n', None, 'process'),
+    ('0::/pipeline\n', None, 'cgroup'),
+))
+def test_accounting(module, cgroup, cgroup_entry, option, accounting):
+    with open(gluetool_modules_framework.helpers.oom.PROC_CGROUP, 'w') as f:
+        f.write(cgroup_entry)
+
+    module._config['memory-accounting'] = option
+
+    assert module.accounting == accounting
+
+
+def test_total_rss_memory_pss(module, monkeypatch):
+    pmock = MagicMock(pid=10)
+    pmock.memory_info.return_value.rss = 100
+    pmock.cmdline.return_value = ['some-process']
+
+    pmock_only_once = MagicMock(pid=20)
+    pmock_only_once.memory_info.return_value.rss = 1000
+    pmock_only_once.cmdline.return_value = ['special-process', 'some-arg']
+
+    pmock_no_pss = MagicMock(pid=30)
+    pmock_no_pss.memory_info.return_value.rss = 2000
+    pmock_no_pss.cmdline.return_value = ['other-process']
+
+    monkeypatch.setattr(
+        psutil,
+        'process_iter',
+        MagicMock(return_value=[pmock, pmock_only_once, pmock_only_once, pmock_no_pss])
+    )
+    monkeypatch.setattr(module, 'pss_memory', MagicMock(side_effect=lambda pid: 400 if pid == 20 else None))
+
+    module._config['count-once-pss'] = True
+
+    assert module.total_rss_memory() == 100 + 400 + 400 + 2000
+
+
+def test_pss_memory(module):
+    assert module.pss_memory(os.getpid()) > 0
+    assert module.pss_memory(-1) is None
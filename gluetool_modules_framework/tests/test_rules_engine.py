@@ -12,6 +12,7 @@ import pytest
 import gluetool
 import gluetool_modules_framework.helpers.rules_engine
 from gluetool_modules_framework.helpers.rules_engine import RulesEngine, Rules, MatchableString, RulesSyntaxError, InvalidASTNodeError
+from gluetool_modules_framework.helpers.rules_engine import CompiledRulesCache, PreparedContext, precompile_rules
 
 from mock import MagicMock
 from . import create_module, check_loadable
@@ -70,6 +71,69 @@ def test_compile_sanity(rule):
     assert isinstance(code, types.CodeType)
 
 
+def test_compiled_rules_cache():
+    cache = CompiledRulesCache(maxsize=2)
+
+    code = cache.get(Rules('1 == 1'))
+
+    assert isinstance(code, types.CodeType)
+    assert cache.get(Rules('1 == 1')) is code
+    assert cache.stats == {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1}
+
+    cache.get(Rules('2 == 2'))
+    cache.get(Rules('3 == 3'))
+
+    # the least recently used rule has been dropped
+    assert len(cache) == 2
+    assert cache.get(Rules('1 == 1')) is not code
+    assert cache.stats['misses'] == 4
+
+    cache.resize(1)
+
+    assert len(cache) == 1
+
+    cache.clear()
+
+    assert cache.stats == {'size': 0, 'maxsize': 1, 'hits': 0, 'misses': 0}
+
+
+def test_compiled_rules_cache_errors():
+    cache = CompiledRulesCache()
+
+    for _ in range(2):
+        with pytest.raises(RulesSyntaxError):
+            cache.get(Rules('1 == '))
+
+    assert len(cache) == 0
+    assert cache.stats['misses'] == 2
+
+
+def test_rules_use_cache(monkeypatch):
+    cache = CompiledRulesCache()
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.rules_engine, 'COMPILED_RULES_CACHE', cache)
+
+    assert Rules('1 == 1').eval({}, {}) is True
+    assert Rules('1 == 1').eval({}, {}) is True
+
+    assert cache.stats['hits'] == 1
+    assert cache.stats['misses'] == 1
+
+
+def test_precompile_rules(monkeypatch):
+    cache = CompiledRulesCache()
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.rules_engine, 'COMPILED_RULES_CACHE', cache)
+
+    entries = [{'rule': '1 == 1'}, {'rule': '1 == '}, {'foo': 'bar'}, {'rule': '1 == 1'}]
+
+    assert precompile_rules(entries) is entries
+    assert cache.stats == {'size': 1, 'maxsize': cache.maxsize, 'hits': 1, 'misses': 2}
+
+    # not a list of instructions - nothing to do
+    assert precompile_rules(None) is None
+
+
 @pytest.mark.parametrize('rule, error_klass, error_message, error_detail', [
     (
         '1 == ',
@@ -126,6 +190,75 @@ def test_unknown_variable(module):
         module.evaluate_rules('foo')
 
 
+def test_prepared_context():
+    context = {'foo': 'bar', 'baz': 79}
+
+    prepared = PreparedContext(context)
+
+    assert prepared.context is context
+
+    # strings are wrapped only when accessed
+    assert type(dict.__getitem__(prepared, 'foo')) is str
+    assert isinstance(prepared['foo'], MatchableString)
+    assert type(dict.__getitem__(prepared, 'foo')) is MatchableString
+    assert prepared['baz'] == 79
+
+    # the original context stays untouched
+    assert type(context['foo']) is str
+
+    assert prepared['EXISTS']('foo') is True
+    assert prepared['EXISTS']('qux') is False
+    assert isinstance(prepared['EVAL_CONTEXT']().foo, MatchableString)
+
+
+def test_prepared_context_reuse(module):
+    prepared = module.prepare_context({'FOO': 'bar'})
+
+    assert module.evaluate_rules("FOO.match('bar') is not None", context=prepared) is True
+    assert module.evaluate_rules("FOO == 'bar'", context=prepared) is True
+    assert module.evaluate_rules("EXISTS('BAZ')", context=prepared) is False
+
+
+def test_filter_prepares_context_once(monkeypatch, module):
+    context = {'FOO': 1}
+
+    monkeypatch.setattr(module, 'prepare_context', MagicMock(wraps=module.prepare_context))
+
+    module.evaluate_filter([{'rule': 'FOO == 1'}, {'rule': 'FOO == 2'}, {'rule': 'FOO == 1'}], context=context)
+
+    module.prepare_context.assert_called_once_with(context)
+
+
+def test_filter_prepares_context_per_change(monkeypatch, module):
+    contexts = iter([{'FOO': 1}, {'FOO': 2}])
+
+    monkeypatch.setattr(module, 'prepare_context', MagicMock(wraps=module.prepare_context))
+
+    assert module.evaluate_filter(
+        [{'rule': 'FOO == 1'}, {'rule': 'FOO == 2'}],
+        context=lambda: next(contexts)
+    ) == [{'rule': 'FOO == 1'}, {'rule': 'FOO == 2'}]
+
+    assert module.prepare_context.call_count == 2
+
+
+def test_locals_logged_only_when_verbose(monkeypatch, module):
+    mock_log_dict = MagicMock()
+
+    monkeypatch.setattr(gluetool_modules_framework.helpers.rules_engine, 'log_dict', mock_log_dict)
+    monkeypatch.setattr(module.logger, 'isEnabledFor', MagicMock(return_value=False))
+
+    module.evaluate_rules('1 == 1', context={})
+
+    assert 'locals' not in [call[0][1] for call in mock_log_dict.call_args_list]
+
+    module.logger.isEnabledFor.return_value = True
+
+    module.evaluate_rules('1 == 1', context={})
+
+    assert 'locals' in [call[0][1] for call in mock_log_dict.call_args_list]
+
+
 @pytest.mark.parametrize('rule, context, result', [
     ("EXISTS('foo')",     {}, False,),
     ("not EXISTS('foo')", {}, True),
@@ -247,6 +380,63 @@ def test_evaluate_filter(module, entries, context, default_rule, stop_at_first_h
     assert actual == expected
 
 
+@pytest.mark.parametrize(
+    'entries, context, default_rule, stop_at_first_hit, expected',
+    FILTER_CASES
+)
+def test_evaluate_filter_batch(module, entries, context, default_rule, stop_at_first_hit, expected):
+    actual = module.evaluate_filter(
+        entries, context=context, default_rule=default_rule, stop_at_first_hit=stop_at_first_hit, batch=True
+    )
+
+    assert actual == expected
+
+
+def test_evaluate_filter_batch_distinct_rules(monkeypatch, module):
+    mock_evaluate_rules = MagicMock(wraps=module.evaluate_rules)
+    mock_context = MagicMock(return_value={'FOO': 'bar', 'BAZ': 79})
+
+    monkeypatch.setitem(module.glue.pipelines[-1].shared_functions, 'evaluate_rules', (None, mock_evaluate_rules))
+
+    entries = [
+        {'rule': 'BAZ == 79', 'id': 1},
+        {'rule': 'BAZ == 80', 'id': 2},
+        {'rule': 'BAZ == 79', 'id': 3},
+        {'rule': "FOO == 'bar'", 'id': 4},
+        {'rule': "FOO.match('BA')", 'id': 5},
+        {'rule': "FOO.match('baz')", 'id': 6},
+        {'rule': "'bar' == FOO", 'id': 7}
+    ]
+
+    actual = module.evaluate_filter(entries, context=mock_context, batch=True)
+
+    assert [entry['id'] for entry in actual] == [1, 3, 4, 5, 7]
+
+    # context acquired once, simple rules decided without evaluation, others evaluated once
+    mock_context.assert_called_once_with()
+    assert mock_evaluate_rules.call_count == 2
+
+
+@pytest.mark.parametrize('rule, context, outcome', [
+    ("FOO == 'bar'", {'FOO': 'bar'}, True),
+    ("'bar' == FOO", {'FOO': 'baz'}, False),
+    ("FOO.match('ba')", {'FOO': 'BAR'}, True),
+    ("FOO.match('ar')", {'FOO': 'bar'}, False),
+    # not simple rules, or not simple values
+    ("FOO.match('b.r')", {'FOO': 'bar'}, None),
+    ("FOO.match('ba', I=False)", {'FOO': 'bar'}, None),
+    ("FOO == 1", {'FOO': 1}, None),
+    ("FOO == 'bar'", {'FOO': 1}, None),
+    ("FOO == 'bar'", {}, None),
+    ("FOO.match('s')", {'FOO': '\u017f'}, None),
+    ("FOO == 'bar' and True", {'FOO': 'bar'}, None),
+    ('1 == ', {}, None),
+    (1, {}, None)
+])
+def test_decide_simple_rule(rule, context, outcome):
+    assert PreparedContext(context).decide_simple_rule(rule) is outcome
+
+
 @pytest.mark.parametrize(
     'rules, expected_call, expected_message',
     [
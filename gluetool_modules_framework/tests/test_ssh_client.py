@@ -0,0 +1,282 @@
+# Copyright Contributors to the Testing Farm project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import gluetool
+
+from gluetool.log import Logging
+
+from gluetool_modules_framework.libs.ssh_client import SSHClient
+
+paramiko = pytest.importorskip('paramiko')
+
+
+class Server(paramiko.ServerInterface):
+    """
+    Accepts any public key, runs commands locally. Stops responding when ``unresponsive`` is set.
+    """
+
+    def __init__(self, unresponsive):
+        self.unresponsive = unresponsive
+
+    def check_global_request(self, kind, msg):
+        if self.unresponsive.is_set():
+            # blocks the whole transport, like a dead guest would
+            time.sleep(5)
+
+        return False
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def _forward_stdin(process):
+            try:
+                while True:
+                    data = channel.recv(32768)
+
+                    if not data:
+                        break
+
+                    process.stdin.write(data)
+
+                process.stdin.close()
+
+            except (OSError, ValueError):
+                # the command exited without reading its input
+                pass
+
+        def _run():
+            with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+                process = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=stdout, stderr=stderr)
+
+                threading.Thread(target=_forward_stdin, args=(process,), daemon=True).start()
+
+                process.wait()
+
+                stdout.seek(0)
+                stderr.seek(0)
+
+                channel.sendall_stderr(stderr.read())
+                channel.sendall(stdout.read())
+
+            channel.send_exit_status(process.returncode)
+            channel.close()
+
+        threading.Thread(target=_run, daemon=True).start()
+
+        return True
+
+
+class SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class SFTPServer(paramiko.SFTPServerInterface):
+    """
+    Serves local filesystem.
+    """
+
+    def list_folder(self, path):
+        return [
+            paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, name)), filename=name)
+            for name in os.listdir(path)
+        ]
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+
+        handle = SFTPHandle(flags)
+        handle.readfile = handle.writefile = os.fdopen(fd, 'r+b' if flags & (os.O_WRONLY | os.O_RDWR) else 'rb')
+
+        return handle
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        if attr.st_mode is not None:
+            os.chmod(path, attr.st_mode)
+
+        return paramiko.SFTP_OK
+
+
+@pytest.fixture(name='unresponsive')
+def fixture_unresponsive():
+    return threading.Event()
+
+
+@pytest.fixture(name='server')
+def fixture_server(unresponsive):
+    host_key = paramiko.RSAKey.generate(2048)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(5)
+
+    transports = []
+
+    def _serve():
+        while True:
+            try:
+                client, _ = sock.accept()
+
+            except OSError:
+                return
+
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, SFTPServer)
+            transport.start_server(server=Server(unresponsive))
+
+            transports.append(transport)
+
+    threading.Thread(target=_serve, daemon=True).start()
+
+    yield sock.getsockname()
+
+    sock.close()
+
+    for transport in transports:
+        transport.close()
+
+
+@pytest.fixture(name='client')
+def fixture_client(server, tmpdir):
+    key_path = str(tmpdir.join('key'))
+    paramiko.RSAKey.generate(2048).write_private_key_file(key_path)
+
+    client = SSHClient(Logging.get_logger(), server[0], port=server[1], username='root', key=key_path,
+                       connect_timeout=10)
+
+    yield client
+
+    client.close()
+
+
+def test_execute(client):
+    chunks = []
+
+    output = client.execute('echo foo; echo bar >&2', stdout_callback=chunks.append)
+
+    assert output.exit_code == 0
+    assert output.stdout == 'foo\n'
+    assert output.stderr == 'bar\n'
+    assert ''.join(chunks) == 'foo\n'
+
+
+def test_execute_stderr_only(client):
+    chunks = []
+
+    output = client.execute('echo foo >&2; sleep 0.5', stderr_callback=chunks.append)
+
+    assert output.stdout == ''
+    assert ''.join(chunks) == 'foo\n'
+
+
+def test_execute_quiet(client):
+    # no output for longer than the interval, but the guest responds
+    output = client.execute('sleep 2.5; echo done', alive_interval=1)
+
+    assert output.stdout == 'done\n'
+
+
+def test_execute_unresponsive(client, unresponsive):
+    client.execute('true')
+
+    unresponsive.set()
+
+    with pytest.raises(paramiko.SSHException, match=r'Guest 127.0.0.1 did not respond for 1 seconds'):
+        client.execute('sleep 3', alive_interval=1)
+
+
+def test_execute_error(client):
+    with pytest.raises(gluetool.GlueCommandError) as excinfo:
+        client.execute('echo failed >&2; exit 3')
+
+    assert excinfo.value.output.exit_code == 3
+    assert excinfo.value.output.stderr == 'failed\n'
+
+
+def test_execute_stdin_stdout(client, tmpdir):
+    content = os.urandom(3 * 1024 * 1024)
+
+    tmpdir.join('input').write_binary(content)
+
+    with open(str(tmpdir.join('input')), 'rb') as stdin, open(str(tmpdir.join('output')), 'wb') as stdout:
+        output = client.execute('cat; echo done >&2', stdin=stdin, stdout=stdout)
+
+    assert output.stdout is None
+    assert output.stderr == 'done\n'
+    assert tmpdir.join('output').read_binary() == content
+
+
+def test_execute_concurrent(client):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        outputs = list(executor.map(lambda i: client.execute('sleep 0.2; echo {}'.format(i)), range(8)))
+
+    assert [output.stdout for output in outputs] == ['{}\n'.format(i) for i in range(8)]
+
+
+def test_copy(client, tmpdir):
+    src = tmpdir.mkdir('src')
+    src.join('foo.sh').write('echo foo')
+    src.join('foo.sh').chmod(0o750)
+    src.mkdir('tree').join('bar').write('bar')
+
+    guest_dir = tmpdir.mkdir('guest')
+
+    client.copy_to(str(src.join('foo.sh')), str(guest_dir))
+    client.copy_to(str(src.join('tree')), str(guest_dir.join('tree')), recursive=True)
+
+    assert guest_dir.join('foo.sh').read() == 'echo foo'
+    assert guest_dir.join('foo.sh').stat().mode & 0o777 == 0o750
+    assert guest_dir.join('tree', 'bar').read() == 'bar'
+
+    back_dir = tmpdir.mkdir('back')
+
+    client.copy_from(str(guest_dir.join('foo.sh')), str(back_dir))
+    client.copy_from(str(guest_dir.join('tree')), str(back_dir), recursive=True)
+
+    assert back_dir.join('foo.sh').stat().mode & 0o777 == 0o750
+    assert back_dir.join('tree', 'bar').read() == 'bar'
+
+    with pytest.raises(gluetool.GlueError, match=r"Cannot copy directory '.*' without recursive flag"):
+        client.copy_to(str(src.join('tree')), str(guest_dir.join('other')))
+
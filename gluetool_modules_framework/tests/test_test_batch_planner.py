@@ -45,7 +45,8 @@ def fixture_module(monkeypatch):
 
     rules_engine = gluetool_modules_framework.helpers.rules_engine.RulesEngine(module.glue, 'rules-engine')
     patch_shared(monkeypatch, module, {}, callables={
-        'evaluate_rules': rules_engine.evaluate_rules
+        'evaluate_rules': rules_engine.evaluate_rules,
+        'evaluate_filter': rules_engine.evaluate_filter
     })
 
     return module
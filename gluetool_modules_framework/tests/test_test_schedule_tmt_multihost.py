@@ -1147,8 +1147,7 @@ cd some-download-path && curl -sL --retry 5 --remote-name-all -w "%{http_code} %
 dnf -y --setopt=gpgcheck=0 reinstall http://copr/project/one.rpm || true
 dnf -y --setopt=gpgcheck=0 reinstall http://copr/project/two.rpm || true
 dnf -y --setopt=gpgcheck=0 install --allowerasing http://copr/project/one.rpm http://copr/project/two.rpm
-rpm -q one
-rpm -q two
+rpm -q one two
 '''
         ])
 